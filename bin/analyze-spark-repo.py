@@ -22,27 +22,35 @@ Analyze Spark repository to extract build dependency and test list
 """
 
 import json
-import glob
 import os
 from pathlib import Path
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import spark_utils
 from ptesting import depgraph
 from ptesting import javaclass
 
 
-def _is_java_class(path: str) -> bool:
-    return spark_utils.RE_IS_JAVA_CLASS.search(path) is not None and \
-        spark_utils.RE_IS_JAVA_TEST.search(path) is None
+# Directories that never contain class files and tests to analyze
+_PRUNED_DIRS = frozenset(['node_modules', 'docs', '__pycache__'])
 
 
-def _is_java_test(path: str) -> bool:
-    return spark_utils.RE_IS_JAVA_TEST.search(path) is not None
+def _walk_files(root_path: str) -> Iterator[str]:
+    # Visits files in the same order as `glob.glob(f'{root_path}/**', recursive=True)` does and,
+    # like `glob`, skips hidden files/directories (e.g., '.git').
+    try:
+        entries = list(os.scandir(root_path))
+    except OSError:
+        return
 
-
-def _is_python_test(path: str) -> bool:
-    return spark_utils.RE_IS_PYTHON_TEST.search(path) is not None
+    for entry in entries:
+        if entry.name.startswith('.'):
+            continue
+        if entry.is_dir():
+            if entry.name not in _PRUNED_DIRS:
+                yield from _walk_files(entry.path)
+        else:
+            yield entry.path
 
 
 def _extract_package(path: str, regex: Any) -> Optional[str]:
@@ -53,33 +61,36 @@ def _extract_package(path: str, regex: Any) -> Optional[str]:
         return None
 
 
-def _enumerate_java_classes(paths: List[str], root_path: str) -> Dict[str, str]:
-    paths = filter(lambda p: _is_java_class(p), paths)  # type: ignore
-    tests = map(lambda p: (_extract_package(p, spark_utils.RE_JAVA_CLASS_PATH), p), paths)
-    tests = filter(lambda t: t[0] is not None, tests)  # type: ignore
-    return dict(tests)  # type: ignore
-
+def _classify_path(path: str) -> Iterator[Tuple[str, str]]:
+    # Cheap string checks are evaluated first because most of the files in a repository
+    # are neither class files nor tests.
+    if path.endswith('Suite.class') and spark_utils.RE_IS_JAVA_TEST.search(path) is not None:
+        test = _extract_package(path, spark_utils.RE_JAVA_TEST_PATH)
+        if test is not None:
+            yield 'java_test', test
+    elif '/classes/' in path:
+        clazz = _extract_package(path, spark_utils.RE_JAVA_CLASS_PATH)
+        if clazz is not None:
+            yield 'java_class', clazz
 
-def _enumerate_java_tests(paths: List[str], root_path: str) -> Dict[str, str]:
-    paths = filter(lambda p: _is_java_test(p), paths)  # type: ignore
-    tests = map(lambda p: (_extract_package(p, spark_utils.RE_JAVA_TEST_PATH), p), paths)
-    tests = filter(lambda t: t[0] is not None, tests)  # type: ignore
-    return dict(tests)  # type: ignore
+    if path.endswith('.py') and spark_utils.RE_IS_PYTHON_TEST.search(path) is not None:
+        test = _extract_package(path, spark_utils.RE_PYTHON_TEST_PATH)
+        if test is not None:
+            yield 'python_test', test
 
 
-def _enumerate_python_tests(paths: List[str], root_path: str) -> Dict[str, str]:
-    paths = filter(lambda p: _is_python_test(p), paths)  # type: ignore
-    tests = map(lambda p: (_extract_package(p, spark_utils.RE_PYTHON_TEST_PATH), p), paths)
-    tests = filter(lambda t: t[0] is not None, tests)  # type: ignore
-    return dict(tests)  # type: ignore
+def _walk_spark_files(root_path: str) -> Iterator[Tuple[str, str, str]]:
+    for path in _walk_files(root_path):
+        for kind, name in _classify_path(path):
+            yield kind, name, path
 
 
 def _enumerate_spark_files(root_path: str) -> Any:
-    files = [p for p in glob.glob(f'{root_path}/**', recursive=True)]
-    java_classes = _enumerate_java_classes(files, root_path)
-    java_tests = _enumerate_java_tests(files, root_path)
-    python_tests = _enumerate_python_tests(files, root_path)
-    return java_classes, java_tests, python_tests
+    files: Dict[str, Dict[str, str]] = {'java_class': {}, 'java_test': {}, 'python_test': {}}
+    for kind, name, path in _walk_spark_files(root_path):
+        files[kind][name] = path
+
+    return files['java_class'], files['java_test'], files['python_test']
 
 
 def _format_path(path: str, root_path: str) -> str:
@@ -127,6 +138,29 @@ def _write_data_as(prefix: str, path: str, data: Any) -> None:
         f.write(json.dumps(data, indent=2))
 
 
+# A cache file for extracted class references has a format as follows:
+#   {"extractor": "<extractor name>", "refs": {"<content hash of a class file>": ["<referenced class>", ...]}}
+def _ref_extractor_name(use_javap: bool) -> str:
+    return 'javap' if use_javap else 'constant-pool'
+
+
+def _load_ref_cache(path: str, use_javap: bool) -> Dict[str, List[str]]:
+    if not os.path.isfile(path):
+        return {}
+
+    cache = json.loads(Path(path).read_text())
+    if cache.get('extractor') != _ref_extractor_name(use_javap):
+        # Discards the cache built by a different extractor because their results might differ
+        return {}
+
+    return cache['refs']
+
+
+def _save_ref_cache(path: str, use_javap: bool, refs: Dict[str, List[str]]) -> None:
+    with open(path, mode='w') as f:
+        f.write(json.dumps({'extractor': _ref_extractor_name(use_javap), 'refs': refs}))
+
+
 def main() -> None:
     # Parses command-line arguments
     from argparse import ArgumentParser
@@ -135,12 +169,20 @@ def main() -> None:
     parser.add_argument('--commits', type=str, required=True)
     parser.add_argument('--output', dest='output', type=str, required=True)
     parser.add_argument('--overwrite', dest='overwrite', action='store_true')
+    parser.add_argument('--num-workers', dest='num_workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--chunk-size', dest='chunk_size', type=int, default=256)
+    parser.add_argument('--use-javap', dest='use_javap', action='store_true')
+    parser.add_argument('--ref-cache', dest='ref_cache', type=str, required=False)
     args = parser.parse_args()
 
     if not os.path.isdir(args.root_path):
         raise ValueError(f"Spark root dir not found in {os.path.abspath(args.root_path)}")
     if not os.path.isfile(args.commits):
         raise ValueError(f"Commit history file not found in {os.path.abspath(args.commits)}")
+    if args.num_workers <= 0:
+        raise ValueError(f"#workers must be positive, but {args.num_workers}")
+    if args.chunk_size <= 0:
+        raise ValueError(f"Chunk size must be positive, but {args.chunk_size}")
 
     if args.overwrite:
         import shutil
@@ -156,9 +198,23 @@ def main() -> None:
 
     # Build a control folow graph from compiled class files
     java_files = list(({**java_classes, **java_tests}).items())
-    extract_edges_from_path = javaclass.create_func_to_extract_refs_from_class_file('org.apache.spark')
-    dep_graph = depgraph.build_dependency_graphs(java_files, extract_edges_from_path)
+    if args.use_javap:
+        # Analyzes a chunk of class files per `javap` launch
+        extract_edges_from_path = javaclass.create_func_to_extract_refs_from_class_files('org.apache.spark')
+    else:
+        extract_edges_from_path = javaclass.create_func_to_extract_refs_from_class_file('org.apache.spark')
+    ref_cache = _load_ref_cache(args.ref_cache, args.use_javap) if args.ref_cache else None
+    dep_graph = depgraph.build_dependency_graphs(java_files, extract_edges_from_path,
+                                                 num_workers=args.num_workers,
+                                                 chunk_size=args.chunk_size,
+                                                 batched=args.use_javap,
+                                                 cache=ref_cache)
+    if args.ref_cache:
+        _save_ref_cache(args.ref_cache, args.use_javap, ref_cache)  # type: ignore
     _write_data_as('dep-graph', args.output, dep_graph)
+    compact_dep_graph = depgraph.to_compact_graph(dep_graph)
+    compact_dep_graph = depgraph.build_test_distance_index(compact_dep_graph, lambda n: n.endswith('Suite'))
+    depgraph.save_compact_graph(compact_dep_graph, f'{args.output}/dep-graph')
 
     # Extract file correlation from a sequence of commit logs
     commits = json.loads(Path(args.commits).read_text())
@@ -45,4 +45,5 @@ PYTHONPATH="${FWDIR}/python:${FWDIR}/bin" \
 exec python3 -u ${FWDIR}/bin/analyze-spark-repo.py \
   --root-path ${ROOT_PATH} \
   --commits ${FWDIR}/models/spark/logs/commits.json \
+  --ref-cache ${FWDIR}/models/spark/indexes/class-refs-cache.json \
   --output ${OUTPUT_PATH}
@@ -17,14 +17,21 @@
 # limitations under the License.
 #
 
+import hashlib
 import json
+import numpy as np  # type: ignore[import]
+import os
 import pandas as pd  # type: ignore[import]
-from datetime import datetime, timedelta, timezone
+import shutil
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
 from pyspark.sql import DataFrame, SparkSession, functions as funcs
 from typing import Any, Dict, List, Optional, Tuple
 
-from auto_tracking import auto_tracking
-from ptesting import github_utils
+import local_features
+from auto_tracking import auto_tracking, auto_tracking_with
+from ptesting import depgraph, fingerprint, timeline
 
 
 def _setup_logger() -> Any:
@@ -37,6 +44,10 @@ def _setup_logger() -> Any:
 
 _logger = _setup_logger()
 
+# The version of the feature pipelines; this should be bumped when changing how features are computed
+# so that persisted feature data computed by a previous version are not reused.
+FEATURE_PIPELINE_VERSION = 1
+
 
 def _to_datetime(d: str, fmt: str) -> datetime:
     return datetime.strptime(d, fmt).replace(tzinfo=timezone.utc)  # type: ignore
@@ -59,78 +70,24 @@ def _create_func_to_enrich_authors(spark: SparkSession,
 
 
 def _create_func_to_enrich_files(spark: SparkSession,
-                                 commits: List[datetime],
+                                 commit_timeline: timeline.CommitTimeline,
                                  updated_file_stats: Dict[str, List[Tuple[str, str, str, str]]],
                                  input_commit_date: str,
                                  input_filenames: str) -> Tuple[Any, List[str]]:
-    broadcasted_updated_file_stats = spark.sparkContext.broadcast(updated_file_stats)
-    broadcasted_commits = spark.sparkContext.broadcast(commits)
+    # Converts the dates into sorted epoch arrays in advance so that the UDF below can count updates
+    # in time windows by using binary searches.
+    broadcasted_update_epochs = spark.sparkContext.broadcast(local_features.to_sorted_update_epochs(updated_file_stats))
+    broadcasted_commit_timeline = spark.sparkContext.broadcast(commit_timeline)
 
     @auto_tracking
     def enrich_files(df: DataFrame) -> DataFrame:
-        @funcs.pandas_udf("string")  # type: ignore
-        def _enrich_files(dates: pd.Series, filenames: pd.Series) -> pd.Series:
-            updated_file_stats = broadcasted_updated_file_stats.value
-            commits = broadcasted_commits.value
-            ret = []
-            for commit_date, files in zip(dates, filenames):
-                base_date = _to_datetime(commit_date, '%Y/%m/%d %H:%M:%S')
-                is_updated_in_days = lambda interval, date: \
-                    base_date - timedelta(interval) <= date and base_date >= date
-
-                def is_updated_in_commits(num_commits: int, date: Any) -> bool:
-                    cur_pos = 0
-                    while cur_pos < len(commits):
-                        if commits[cur_pos] <= base_date:
-                            target_pos = cur_pos + min([num_commits, len(commits) - cur_pos - 1])
-                            return commits[target_pos] <= date and commits[cur_pos] >= date
-
-                        cur_pos += 1
-
-                    return False
-
-                # Time-dependent features
-                updated_num_3d = 0
-                updated_num_14d = 0
-                updated_num_56d = 0
-
-                # Commit-dependent features
-                updated_num_3c = 0
-                updated_num_14c = 0
-                updated_num_56c = 0
-
-                for file in json.loads(files):
-                    if file in updated_file_stats:
-                        for update_date, _, _, _ in updated_file_stats[file]:
-                            udate = github_utils.from_github_datetime(update_date)
-                            if is_updated_in_days(3, udate):
-                                updated_num_3d += 1
-                            if is_updated_in_days(14, udate):
-                                updated_num_14d += 1
-                            if is_updated_in_days(56, udate):
-                                updated_num_56d += 1
-                            if is_updated_in_commits(3, udate):
-                                updated_num_3c += 1
-                            if is_updated_in_commits(14, udate):
-                                updated_num_14c += 1
-                            if is_updated_in_commits(56, udate):
-                                updated_num_56c += 1
-
-                ret.append(json.dumps({
-                    'n3d': updated_num_3d,
-                    'n14d': updated_num_14d,
-                    'n56d': updated_num_56d,
-                    'n3c': updated_num_3c,
-                    'n14c': updated_num_14c,
-                    'n56c': updated_num_56c
-                }))
-
-            return pd.Series(ret)
-
-        enrich_files_expr = _enrich_files(funcs.expr(input_commit_date), funcs.expr(f'to_json({input_filenames})'))
-        enrich_files_schema = 'struct<n3d: int, n14d: int, n56d: int, n3c: int, n14c: int, n56c: int>'
-        return df.withColumn('updated_file_stats', enrich_files_expr)  \
-            .withColumn('ufs', funcs.expr(f'from_json(updated_file_stats, "{enrich_files_schema}")')) \
+        @funcs.pandas_udf("n3d int, n14d int, n56d int, n3c int, n14c int, n56c int")  # type: ignore
+        def _enrich_files(dates: pd.Series, filenames: pd.Series) -> pd.DataFrame:
+            return local_features.count_file_updates(
+                broadcasted_update_epochs.value, broadcasted_commit_timeline.value, dates, filenames)
+
+        enrich_files_expr = _enrich_files(funcs.expr(input_commit_date), funcs.expr(input_filenames))
+        return df.withColumn('ufs', enrich_files_expr)  \
             .withColumn('updated_num_3d', funcs.expr('ufs.n3d')) \
             .withColumn('updated_num_14d', funcs.expr('ufs.n14d')) \
             .withColumn('updated_num_56d', funcs.expr('ufs.n56d')) \
@@ -142,12 +99,13 @@ def _create_func_to_enrich_files(spark: SparkSession,
 
 
 def _create_func_to_enumerate_related_tests(spark: SparkSession,
-                                            dep_graph: Dict[str, List[str]],
+                                            dep_graph: depgraph.CompactGraph,
                                             corr_map: Dict[str, List[str]],
                                             test_files: Dict[str, str],
                                             included_tests: List[str],
                                             input_files: str,
-                                            depth: int) -> Tuple[Any, List[str]]:
+                                            depth: int,
+                                            max_distance: int = 16) -> Tuple[Any, List[str]]:
     broadcasted_dep_graph = spark.sparkContext.broadcast(dep_graph)
     broadcasted_corr_map = spark.sparkContext.broadcast(corr_map)
     broadcasted_test_files = spark.sparkContext.broadcast(test_files)
@@ -163,60 +121,32 @@ def _create_func_to_enumerate_related_tests(spark: SparkSession,
     #    to depend on the class B.
     @auto_tracking
     def enumerate_related_tests(df: DataFrame) -> DataFrame:
-        @funcs.pandas_udf("string")  # type: ignore
-        def _enumerate_tests(file_paths: pd.Series) -> pd.Series:
-            # TODO: Removes package-depenent stuffs
-            import spark_utils
-            parse_path = spark_utils.create_func_to_transform_path_to_qualified_name()
+        related_tests_schema = 'tests array<string>, distance_tests array<string>, distance_values array<int>'
 
+        @funcs.pandas_udf(related_tests_schema)  # type: ignore
+        def _enumerate_tests(file_paths_list: pd.Series) -> pd.DataFrame:
             dep_graph = broadcasted_dep_graph.value
             corr_map = broadcasted_corr_map.value
             test_files = broadcasted_test_files.value
             included_tests = broadcasted_included_tests.value
 
-            def _enumerate_tests_from_dep_graph(target):  # type: ignore
-                subgraph = {}
-                visited_nodes = set()
-                keys = list([target])
-                for i in range(0, depth):
-                    if len(keys) == 0:
-                        break
-
-                    next_keys = set()
-                    for key in keys:
-                        if key in dep_graph and key not in visited_nodes:
-                            nodes = dep_graph[key]
-                            next_keys.update(nodes)
-                    visited_nodes.update(keys)
-                    keys = list(next_keys)
-                if keys is not None:
-                    visited_nodes.update(keys)
-                tests = list(filter(lambda n: n.endswith('Suite'), visited_nodes))
-                return tests
-
             ret = []
-            for file_path in file_paths:
-                correlated_files = corr_map[file_path] if file_path in corr_map else []
-                related_tests = set()
-                related_tests.update(list(filter(lambda f: f in test_files, correlated_files)))
-                related_tests.update(included_tests)
-                if file_path:
-                    result = parse_path(file_path)
-                    if result:
-                        dependant_tests = _enumerate_tests_from_dep_graph(result)
-                        related_tests.update(dependant_tests)
+            for file_paths in file_paths_list:
+                related_tests, test_distances = local_features.enumerate_related_tests(
+                    file_paths, dep_graph, corr_map, test_files, included_tests, depth, max_distance)
 
-                ret.append(json.dumps({'tests': list(related_tests)}))
+                # Map types are not supported in pandas UDFs with old PyArrow versions, so the distances
+                # are returned as two arrays and then converted into a map.
+                ret.append((related_tests, list(test_distances.keys()), list(test_distances.values())))
 
-            return pd.Series(ret)
+            return pd.DataFrame(ret, columns=['tests', 'distance_tests', 'distance_values'])
 
         related_test_df = df.selectExpr('sha', f'explode_outer({input_files}) filename') \
-            .withColumn('tests', _enumerate_tests(funcs.expr('filename'))) \
-            .selectExpr('sha', 'from_json(tests, "tests ARRAY<STRING>").tests tests') \
-            .selectExpr('sha', 'explode_outer(tests) test') \
             .groupBy('sha') \
-            .agg(funcs.expr(f'collect_set(test) tests')) \
-            .selectExpr('sha', 'size(tests) target_card', f'tests related_tests') \
+            .agg(funcs.expr('collect_set(filename) filenames')) \
+            .withColumn('tests', _enumerate_tests(funcs.expr('filenames'))) \
+            .selectExpr('sha', 'size(tests.tests) target_card', 'tests.tests related_tests',
+                        'map_from_arrays(tests.distance_tests, tests.distance_values) related_test_distances') \
             .where(f'related_tests IS NOT NULL')
 
         return df.join(related_test_df, 'sha', 'LEFT_OUTER')
@@ -236,82 +166,24 @@ def _create_func_to_enumerate_all_tests(spark: SparkSession, test_files: Dict[st
 
 
 def _create_func_to_enrich_tests(spark: SparkSession,
-                                 commits: List[datetime],
+                                 commit_timeline: timeline.CommitTimeline,
                                  failed_tests: Dict[str, List[str]],
                                  input_commit_date: str,
                                  input_test: str) -> Tuple[Any, List[str]]:
-    broadcasted_failed_tests = spark.sparkContext.broadcast(failed_tests)
-    broadcasted_commits = spark.sparkContext.broadcast(commits)
+    # Converts the dates into sorted epoch arrays in advance so that the UDF below can count failures
+    # in time windows by using binary searches.
+    broadcasted_failure_index = spark.sparkContext.broadcast(local_features.to_failure_epoch_index(failed_tests))
+    broadcasted_commit_timeline = spark.sparkContext.broadcast(commit_timeline)
 
     @auto_tracking
     def enrich_tests(df: DataFrame) -> DataFrame:
-        @funcs.pandas_udf("string")  # type: ignore
-        def _enrich_tests(dates: pd.Series, tests: pd.Series) -> pd.Series:
-            failed_tests = broadcasted_failed_tests.value
-            commits = broadcasted_commits.value
-            ret = []
-            for commit_date, test in zip(dates, tests):
-                base_date = _to_datetime(commit_date, '%Y/%m/%d %H:%M:%S')
-                failed_in_days = lambda interval, date: \
-                    base_date - timedelta(interval) <= date and base_date >= date
-
-                def failed_in_commits(num_commits: int, date: Any) -> bool:
-                    cur_pos = 0
-                    while cur_pos < len(commits):
-                        if commits[cur_pos] <= base_date:
-                            target_pos = cur_pos + min([num_commits, len(commits) - cur_pos - 1])
-                            return commits[target_pos] <= date and commits[cur_pos] >= date
-
-                        cur_pos += 1
-
-                    return False
-
-                # Time-dependent features
-                failed_num_7d = 0
-                failed_num_14d = 0
-                failed_num_28d = 0
-
-                # Commit-dependent features
-                failed_num_7c = 0
-                failed_num_14c = 0
-                failed_num_28c = 0
-
-                total_failed_num = 0
-
-                if test in failed_tests:
-                    for failed_date in failed_tests[test]:
-                        failed_date = _to_datetime(failed_date, '%Y/%m/%d %H:%M:%S')  # type: ignore
-                        if failed_in_days(7, failed_date):
-                            failed_num_7d += 1
-                        if failed_in_days(14, failed_date):
-                            failed_num_14d += 1
-                        if failed_in_days(28, failed_date):
-                            failed_num_28d += 1
-                        if failed_in_commits(7, failed_date):
-                            failed_num_7c += 1
-                        if failed_in_commits(14, failed_date):
-                            failed_num_14c += 1
-                        if failed_in_commits(28, failed_date):
-                            failed_num_28c += 1
-
-                        total_failed_num += 1
-
-                ret.append(json.dumps({
-                    'n7d': failed_num_7d,
-                    'n14d': failed_num_14d,
-                    'n28d': failed_num_28d,
-                    'n7c': failed_num_7c,
-                    'n14c': failed_num_14c,
-                    'n28c': failed_num_28c,
-                    'total': total_failed_num
-                }))
-
-            return pd.Series(ret)
+        @funcs.pandas_udf("n7d int, n14d int, n28d int, n7c int, n14c int, n28c int, total int")  # type: ignore
+        def _enrich_tests(dates: pd.Series, tests: pd.Series) -> pd.DataFrame:
+            return local_features.count_test_failures(
+                broadcasted_failure_index.value, broadcasted_commit_timeline.value, dates, tests)
 
         enrich_tests_expr = _enrich_tests(funcs.expr(input_commit_date), funcs.expr(input_test))
-        failed_test_stats_schema = 'struct<n7d: int, n14d: int, n28d: int, n7c: int, n14c: int, n28c: int, total: int>'
-        return df.withColumn('failed_test_stats', enrich_tests_expr)  \
-            .withColumn('fts', funcs.expr(f'from_json(failed_test_stats, "{failed_test_stats_schema}")')) \
+        return df.withColumn('fts', enrich_tests_expr)  \
             .withColumn('failed_num_7d', funcs.expr('fts.n7d')) \
             .withColumn('failed_num_14d', funcs.expr('fts.n14d')) \
             .withColumn('failed_num_28d', funcs.expr('fts.n28d')) \
@@ -324,79 +196,26 @@ def _create_func_to_enrich_tests(spark: SparkSession,
 
 
 def _create_func_to_compute_distances(spark: SparkSession,
-                                      dep_graph: Dict[str, List[str]], test_files: Dict[str, str],
+                                      test_files: Dict[str, str],
                                       input_files: str,
-                                      input_test: str) -> Tuple[Any, List[str]]:
-    broadcasted_dep_graph = spark.sparkContext.broadcast(dep_graph)
+                                      input_test: str,
+                                      input_test_distances: str) -> Tuple[Any, List[str]]:
     broadcasted_test_files = spark.sparkContext.broadcast(test_files)
 
     @funcs.pandas_udf("int")  # type: ignore
     def _compute_path_diff(filenames: pd.Series, test: pd.Series) -> pd.Series:
-        # TODO: Removes package-depenent stuffs
-        import spark_utils
-        compute_path_diff = spark_utils.create_func_to_computer_path_difference()
-
-        test_files = broadcasted_test_files.value
-
-        ret = []
-        for names, t in zip(filenames, test):
-            if t in test_files:
-                distances = []
-                for n in json.loads(names):
-                    distances.append(compute_path_diff(n, test_files[t]))
-                ret.append(min(distances) if distances else 128)
-            else:
-                ret.append(128)
-
-        return pd.Series(ret)
-
-    @funcs.pandas_udf("int")  # type: ignore
-    def _compute_distance(filenames: pd.Series, test: pd.Series) -> pd.Series:
-        # TODO: Removes package-depenent stuffs
-        import spark_utils
-        parse_path = spark_utils.create_func_to_transform_path_to_qualified_name()
-
-        dep_graph = broadcasted_dep_graph.value
-
-        ret = []
-        for names, t in zip(filenames, test):
-            distances = [128]
-            for n in json.loads(names):
-                ident = parse_path(n)
-                if ident:
-                    if ident == t:
-                        distances.append(0)
-                        break
-
-                    visited_nodes = set()
-                    keys = list([ident])
-                    for i in range(0, 16):
-                        if len(keys) == 0:
-                            break
-
-                        next_keys = set()
-                        for key in keys:
-                            if key in dep_graph and key not in visited_nodes:
-                                nodes = dep_graph[key]
-                                next_keys.update(nodes)
-                        if t in next_keys:
-                            distances.append(i + 1)
-                            break
-
-                        visited_nodes.update(keys)
-                        keys = list(next_keys)
-
-            ret.append(min(distances))
-
+        ret = local_features.compute_path_differences(filenames, test, broadcasted_test_files.value)
         return pd.Series(ret)
 
     @auto_tracking
     def compute_distances(df: DataFrame) -> DataFrame:
-        path_diff_udf = _compute_path_diff(funcs.expr(f'to_json({input_files})'), funcs.expr(input_test))
+        path_diff_udf = _compute_path_diff(funcs.expr(input_files), funcs.expr(input_test))
+        # Shortest distances from updated files to tests have been computed in `enumerate_related_tests`
+        distance_expr = f'coalesce({input_test_distances}[{input_test}], {local_features.MAX_DISTANCE_VALUE})'
         return df.withColumn('path_difference', path_diff_udf) \
-            .withColumn('distance', _compute_distance(funcs.expr(f'to_json({input_files})'), funcs.expr(input_test)))
+            .withColumn('distance', funcs.expr(distance_expr))
 
-    return compute_distances, [input_files, input_test]
+    return compute_distances, [input_files, input_test, input_test_distances]
 
 
 def _create_func_to_compute_file_cardinality(input_col: str) -> Tuple[Any, List[str]]:
@@ -445,6 +264,122 @@ def _create_func_to_add_failed_column() -> Tuple[Any, List[str]]:
     return add_failed_column, ['related_tests', 'failed_tests']
 
 
+def _create_func_to_count_total_failures(spark: SparkSession,
+                                         failed_tests: Dict[str, List[str]],
+                                         input_test: str) -> Tuple[Any, List[str]]:
+    total_failed_num_df = spark.createDataFrame(
+        [(t, len(dates)) for t, dates in failed_tests.items()],
+        schema='__failed_test: string, total_failed_num: int')
+
+    @auto_tracking
+    def count_total_failures(df: DataFrame) -> DataFrame:
+        return df.join(total_failed_num_df, df[input_test] == total_failed_num_df['__failed_test'], 'LEFT_OUTER') \
+            .drop('__failed_test') \
+            .na.fill({'total_failed_num': 0})
+
+    return count_total_failures, [input_test]
+
+
+def _to_history(epoch_map: Dict[str, Any], commit_timeline: timeline.CommitTimeline) -> Tuple[Any, Any]:
+    # Flattens events (e.g., file updates and test failures) and commits into `(keys, epochs)` arrays;
+    # commits use the empty key that no file/test has.
+    keys = [k for k, epochs in epoch_map.items() for _ in range(len(epochs))]
+    epochs = [np.asarray(e, dtype=np.int64) for e in epoch_map.values()]
+    return np.array(keys + [''] * len(commit_timeline), dtype=str), \
+        np.concatenate(epochs + [commit_timeline.commit_epochs]).astype(np.int64)
+
+
+def _fingerprint_dep_graph(dep_graph: Optional[depgraph.CompactGraph]) -> Optional[str]:
+    if dep_graph is None:
+        return None
+
+    h = hashlib.sha256()
+    h.update(json.dumps(dep_graph.nodes).encode('utf-8'))
+    h.update(np.ascontiguousarray(dep_graph.offsets, dtype=np.int64).tobytes())
+    h.update(np.ascontiguousarray(dep_graph.targets, dtype=np.int64).tobytes())
+    return h.hexdigest()
+
+
+def _create_func_to_reuse_stage_outputs(spark: SparkSession,
+                                        stage: Tuple[Any, List[str]],
+                                        stage_store_path: str,
+                                        key_cols: List[str],
+                                        output_cols: List[str],
+                                        params: Dict[str, Any],
+                                        history: Optional[Tuple[Any, Any]] = None,
+                                        input_commit_date: Optional[str] = None) -> Tuple[Any, List[str]]:
+    # Wraps a stage so that its outputs are persisted in `stage_store_path` and only rows whose keys
+    # have not been processed yet go through the stage. The stored rows are discarded if `params`
+    # (the inputs that the stage outputs depend on) change. For stages that count events in time windows
+    # ending at commit dates, `history` holds the events and the stored rows whose commit dates are
+    # at or after the earliest changed event are recomputed; the others never see the change.
+    stage_func, input_cols = stage
+    stage_name = f'reuse_{stage_func.__name__}'
+    stage_fingerprint = fingerprint.compute_fingerprint({}, params)
+    date_cols = [input_commit_date] if history is not None and input_commit_date is not None else []
+    stored_cols = [*key_cols, *[c for c in date_cols if c not in key_cols], *output_cols]
+
+    def _read_current_version() -> Optional[str]:
+        current_path = f'{stage_store_path}/CURRENT'
+        if not os.path.isfile(current_path):
+            return None
+        current = json.loads(Path(current_path).read_text())
+        return current['version'] if current['fingerprint'] == stage_fingerprint else None
+
+    # Removes the stale versions that no data frame refers to any longer
+    os.makedirs(stage_store_path, exist_ok=True)
+    for version in os.listdir(stage_store_path):
+        if version != 'CURRENT' and version != _read_current_version():
+            shutil.rmtree(f'{stage_store_path}/{version}', ignore_errors=True)
+
+    def _join_on_keys(df: DataFrame, stored_df: DataFrame, how: str) -> DataFrame:
+        renamed_stored_df = stored_df.selectExpr('*', *[f'`{k}` AS `__stored_{k}`' for k in key_cols]).drop(*key_cols)
+        join_cond = [df[k].eqNullSafe(renamed_stored_df[f'__stored_{k}']) for k in key_cols]
+        joined_df = df.join(renamed_stored_df, join_cond, how)
+        return joined_df.drop(*[f'__stored_{k}' for k in key_cols]) if how != 'left_anti' else joined_df
+
+    @auto_tracking_with(stage_name)
+    def reuse_stage_outputs(df: DataFrame) -> DataFrame:
+        version = _read_current_version()
+        stored_df = None
+        history_changed = False
+        if version is not None:
+            stored_df = spark.read.parquet(f'{stage_store_path}/{version}/rows')
+            if history is not None and date_cols:
+                stored_history = np.load(f'{stage_store_path}/{version}/history.npz', allow_pickle=False)
+                divergent_epoch = timeline.find_divergent_epoch(
+                    (stored_history['keys'], stored_history['epochs']), history)
+                if divergent_epoch is not None:
+                    divergent_date = datetime.fromtimestamp(divergent_epoch, timezone.utc) \
+                        .strftime('%Y/%m/%d %H:%M:%S')
+                    stored_df = stored_df.where(f'{date_cols[0]} < "{divergent_date}"')
+                    history_changed = True
+
+        new_df = _join_on_keys(df, stored_df, 'left_anti') if stored_df is not None else df
+        new_rows = stage_func(new_df).selectExpr(stored_cols).dropDuplicates(key_cols)
+
+        if version is not None and not history_changed:
+            # Just appends the new rows into the current version
+            new_rows.write.mode('append').parquet(f'{stage_store_path}/{version}/rows')
+        else:
+            # Writes the valid stored rows and the new rows as a new version, and then switches `CURRENT` to it
+            rows = stored_df.unionByName(new_rows) if stored_df is not None else new_rows
+            version = uuid.uuid4().hex
+            rows.write.parquet(f'{stage_store_path}/{version}/rows')
+            if history is not None:
+                np.savez(f'{stage_store_path}/{version}/history.npz', keys=history[0], epochs=history[1])
+            tmp_current_path = f'{stage_store_path}/CURRENT.{version}'
+            Path(tmp_current_path).write_text(json.dumps({'version': version, 'fingerprint': stage_fingerprint}))
+            os.replace(tmp_current_path, f'{stage_store_path}/CURRENT')
+
+        stored_df = spark.read.parquet(f'{stage_store_path}/{version}/rows') \
+            .drop(*[c for c in date_cols if c not in key_cols])
+        return _join_on_keys(df, stored_df, 'LEFT_OUTER')
+
+    reuse_stage_outputs.__name__ = stage_name
+    return reuse_stage_outputs, input_cols
+
+
 def _create_pipelines(name: str, funcs: List[Tuple[Any, List[str]]]) -> Any:
     def _columns_added(src: DataFrame, dst: DataFrame) -> Any:
         return list(set(dst.columns).difference(set(src.columns)))
@@ -517,12 +452,13 @@ def set_highest_failed_probs_for_updated_tests(test_df: DataFrame, predicted_df:
 def create_train_test_pipeline(spark: SparkSession,
                                test_files: Dict[str, str],
                                commits: List[datetime],
-                               dep_graph: Dict[str, List[str]],
+                               dep_graph: depgraph.CompactGraph,
                                corr_map: Dict[str, List[str]],
                                included_tests: List[str],
                                updated_file_stats: Dict[str, List[Tuple[str, str, str, str]]],
                                contributor_stats: Optional[List[Tuple[str, str]]],
-                               failed_tests: Dict[str, List[str]]) -> Tuple[Any, Any]:
+                               failed_tests: Dict[str, List[str]],
+                               stage_store_path: Optional[str] = None) -> Tuple[Any, Any]:
     # This pipeline extracts features from a dataset of historical test outcomes.
     # The current features used in our model are as follows:
     #  - Change history for files: the count of commits made to modified files in the last 3, 14, and 56 days
@@ -549,49 +485,11 @@ def create_train_test_pipeline(spark: SparkSession,
     # TODO: Needs to improve predictive model performance by checking the other feature candidates
     # that can be found in the Facebook paper (See "Section 4.A. Feature Engineering") [2]
     # and the Google paper (See "Section 4. Hypotheses, Models and Results") [1].
-    expected_train_features = [
-        'num_commits',
-        'updated_num_3d',
-        'updated_num_14d',
-        'updated_num_56d',
-        'updated_num_3c',
-        'updated_num_14c',
-        'updated_num_56c',
-        'num_adds',
-        'num_dels',
-        'num_chgs',
-        # 'target_card',
-        'file_card',
-        'failed_num_7d',
-        'failed_num_14d',
-        'failed_num_28d',
-        'failed_num_7c',
-        'failed_num_14c',
-        'failed_num_28c',
-        'total_failed_num',
-        'path_difference',
-        'distance',
-        'total_failed_num__x__num_commits',
-        'total_failed_num__x__num_chgs',
-        'total_failed_num__x__updated_num_56d',
-        'total_failed_num__x__updated_num_56c',
-        'total_failed_num__x__path_difference',
-        'total_failed_num__x__distance',
-        'failed_num_7d__x__num_commits',
-        'failed_num_7d__x__num_chgs',
-        'failed_num_7d__x__updated_num_56d',
-        'failed_num_7d__x__updated_num_56c',
-        'failed_num_7d__x__path_difference',
-        'failed_num_7d__x__distance',
-        'distance__x__num_commits',
-        'distance__x__num_chgs',
-        'distance__x__updated_num_56d',
-        'distance__x__updated_num_56c',
-        'distance__x__path_difference'
-    ]
+    expected_train_features = local_features.FEATURES
 
+    commit_timeline = timeline.build_commit_timeline(commits)
     enrich_authors = _create_func_to_enrich_authors(spark, contributor_stats, input_col='author')
-    enrich_files = _create_func_to_enrich_files(spark, commits, updated_file_stats,
+    enrich_files = _create_func_to_enrich_files(spark, commit_timeline, updated_file_stats,
                                                 input_commit_date='commit_date',
                                                 input_filenames='files.file.name')
     enumerate_related_tests = _create_func_to_enumerate_related_tests(spark, dep_graph, corr_map,
@@ -599,32 +497,46 @@ def create_train_test_pipeline(spark: SparkSession,
                                                                       included_tests,
                                                                       input_files='files.file.name',
                                                                       depth=2)
-    enrich_tests = _create_func_to_enrich_tests(spark, commits, failed_tests,
+    enrich_tests = _create_func_to_enrich_tests(spark, commit_timeline, failed_tests,
                                                 input_commit_date='commit_date',
                                                 input_test='test')
-    compute_distances = _create_func_to_compute_distances(spark, dep_graph, test_files,
-                                                          input_files='files.file.name', input_test='test')
+    compute_distances = _create_func_to_compute_distances(spark, test_files,
+                                                          input_files='files.file.name', input_test='test',
+                                                          input_test_distances='related_test_distances')
+    count_total_failures = None
+
+    # In an append mode, the outputs of the expensive stages are persisted in `stage_store_path` and
+    # only newly-added shas go through the stages. The total failure counts depend on the whole history
+    # (including later commits), so they are always recomputed.
+    if stage_store_path is not None:
+        updated_file_history = _to_history(local_features.to_sorted_update_epochs(updated_file_stats), commit_timeline)
+        failed_test_epochs = {t: timeline.to_epoch_seconds(dates, '%Y/%m/%d %H:%M:%S')
+                              for t, dates in failed_tests.items()}
+        failed_test_history = _to_history(failed_test_epochs, commit_timeline)
+        version = FEATURE_PIPELINE_VERSION
+        enrich_files = _create_func_to_reuse_stage_outputs(
+            spark, enrich_files, f'{stage_store_path}/enrich_files',
+            key_cols=['sha', 'commit_date'],
+            output_cols=[f'updated_num_{n}' for n in ['3d', '14d', '56d', '3c', '14c', '56c']],
+            params={'version': version},
+            history=updated_file_history, input_commit_date='commit_date')
+        enumerate_related_tests = _create_func_to_reuse_stage_outputs(
+            spark, enumerate_related_tests, f'{stage_store_path}/enumerate_related_tests',
+            key_cols=['sha'],
+            output_cols=['target_card', 'related_tests', 'related_test_distances'],
+            params={'version': version, 'dep_graph': _fingerprint_dep_graph(dep_graph), 'corr_map': corr_map,
+                    'test_files': test_files, 'included_tests': included_tests, 'depth': 2})
+        enrich_tests = _create_func_to_reuse_stage_outputs(
+            spark, enrich_tests, f'{stage_store_path}/enrich_tests',
+            key_cols=['commit_date', 'test'],
+            output_cols=[f'failed_num_{n}' for n in ['7d', '14d', '28d', '7c', '14c', '28c']],
+            params={'version': version},
+            history=failed_test_history, input_commit_date='commit_date')
+        count_total_failures = _create_func_to_count_total_failures(spark, failed_tests, input_test='test')
+
     compute_file_cardinality = _create_func_to_compute_file_cardinality(input_col='files')
-    interacted_features = [
-        ('total_failed_num', 'num_commits'),
-        ('total_failed_num', 'num_chgs'),
-        ('total_failed_num', 'updated_num_56d'),
-        ('total_failed_num', 'updated_num_56c'),
-        ('total_failed_num', 'path_difference'),
-        ('total_failed_num', 'distance'),
-        ('failed_num_7d', 'num_commits'),
-        ('failed_num_7d', 'num_chgs'),
-        ('failed_num_7d', 'updated_num_56d'),
-        ('failed_num_7d', 'updated_num_56c'),
-        ('failed_num_7d', 'path_difference'),
-        ('failed_num_7d', 'distance'),
-        ('distance', 'num_commits'),
-        ('distance', 'num_chgs'),
-        ('distance', 'updated_num_56d'),
-        ('distance', 'updated_num_56c'),
-        ('distance', 'path_difference')
-    ]
-    compute_interaction_features = _create_func_to_compute_interaction_features(input_cols=interacted_features)
+    compute_interaction_features = _create_func_to_compute_interaction_features(
+        input_cols=local_features.INTERACTED_FEATURES)
     expand_updated_stats = _create_func_to_expand_updated_stats()
     add_failed_column = _create_func_to_add_failed_column()
     select_train_features = lambda df: df.selectExpr(['failed', *expected_train_features]), \
@@ -638,6 +550,7 @@ def create_train_test_pipeline(spark: SparkSession,
             enumerate_related_tests,
             add_failed_column,
             enrich_tests,
+            *([count_total_failures] if count_total_failures else []),
             compute_distances,
             compute_file_cardinality,
             compute_interaction_features,
@@ -656,6 +569,7 @@ def create_train_test_pipeline(spark: SparkSession,
             enumerate_related_tests,
             explode_tests,
             enrich_tests,
+            *([count_total_failures] if count_total_failures else []),
             compute_distances,
             compute_file_cardinality,
             compute_interaction_features,
@@ -668,56 +582,17 @@ def create_train_test_pipeline(spark: SparkSession,
 def create_predict_pipeline(spark: SparkSession,
                             test_files: Dict[str, str],
                             commits: List[datetime],
-                            dep_graph: Dict[str, List[str]],
+                            dep_graph: depgraph.CompactGraph,
                             corr_map: Dict[str, List[str]],
                             included_tests: List[str],
                             updated_file_stats: Dict[str, List[Tuple[str, str, str, str]]],
                             contributor_stats: Optional[List[Tuple[str, str]]],
                             failed_tests: Dict[str, List[str]]) -> Any:
-    expected_features = [
-        'test',
-        'num_commits',
-        'updated_num_3d',
-        'updated_num_14d',
-        'updated_num_56d',
-        'updated_num_3c',
-        'updated_num_14c',
-        'updated_num_56c',
-        'num_adds',
-        'num_dels',
-        'num_chgs',
-        # 'target_card',
-        'file_card',
-        'failed_num_7d',
-        'failed_num_14d',
-        'failed_num_28d',
-        'failed_num_7c',
-        'failed_num_14c',
-        'failed_num_28c',
-        'total_failed_num',
-        'path_difference',
-        'distance',
-        'total_failed_num__x__num_commits',
-        'total_failed_num__x__num_chgs',
-        'total_failed_num__x__updated_num_56d',
-        'total_failed_num__x__updated_num_56c',
-        'total_failed_num__x__path_difference',
-        'total_failed_num__x__distance',
-        'failed_num_7d__x__num_commits',
-        'failed_num_7d__x__num_chgs',
-        'failed_num_7d__x__updated_num_56d',
-        'failed_num_7d__x__updated_num_56c',
-        'failed_num_7d__x__path_difference',
-        'failed_num_7d__x__distance',
-        'distance__x__num_commits',
-        'distance__x__num_chgs',
-        'distance__x__updated_num_56d',
-        'distance__x__updated_num_56c',
-        'distance__x__path_difference'
-    ]
+    expected_features = ['sha', 'test', *local_features.FEATURES]
 
+    commit_timeline = timeline.build_commit_timeline(commits)
     enrich_authors = _create_func_to_enrich_authors(spark, contributor_stats, input_col='author')
-    enrich_files = _create_func_to_enrich_files(spark, commits, updated_file_stats,
+    enrich_files = _create_func_to_enrich_files(spark, commit_timeline, updated_file_stats,
                                                 input_commit_date='commit_date',
                                                 input_filenames='filenames')
     enumerate_related_tests = _create_func_to_enumerate_related_tests(spark, dep_graph, corr_map,
@@ -725,31 +600,14 @@ def create_predict_pipeline(spark: SparkSession,
                                                                       included_tests,
                                                                       input_files='filenames',
                                                                       depth=2)
-    enrich_tests = _create_func_to_enrich_tests(spark, commits, failed_tests,
+    enrich_tests = _create_func_to_enrich_tests(spark, commit_timeline, failed_tests,
                                                 input_commit_date='commit_date',
                                                 input_test='test')
-    compute_distances = _create_func_to_compute_distances(spark, dep_graph, test_files,
-                                                          input_files='filenames', input_test='test')
-    interacted_features = [
-        ('total_failed_num', 'num_commits'),
-        ('total_failed_num', 'num_chgs'),
-        ('total_failed_num', 'updated_num_56d'),
-        ('total_failed_num', 'updated_num_56c'),
-        ('total_failed_num', 'path_difference'),
-        ('total_failed_num', 'distance'),
-        ('failed_num_7d', 'num_commits'),
-        ('failed_num_7d', 'num_chgs'),
-        ('failed_num_7d', 'updated_num_56d'),
-        ('failed_num_7d', 'updated_num_56c'),
-        ('failed_num_7d', 'path_difference'),
-        ('failed_num_7d', 'distance'),
-        ('distance', 'num_commits'),
-        ('distance', 'num_chgs'),
-        ('distance', 'updated_num_56d'),
-        ('distance', 'updated_num_56c'),
-        ('distance', 'path_difference')
-    ]
-    compute_interaction_features = _create_func_to_compute_interaction_features(input_cols=interacted_features)
+    compute_distances = _create_func_to_compute_distances(spark, test_files,
+                                                          input_files='filenames', input_test='test',
+                                                          input_test_distances='related_test_distances')
+    compute_interaction_features = _create_func_to_compute_interaction_features(
+        input_cols=local_features.INTERACTED_FEATURES)
     compute_file_cardinality = _create_func_to_compute_file_cardinality(input_col='filenames')
     explode_tests = lambda df: df.selectExpr('*', 'explode_outer(related_tests) test'), ['related_tests']
     select_features = lambda df: df.selectExpr(expected_features), expected_features
@@ -0,0 +1,283 @@
+#!/usr/bin/env python3
+
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+# Spark-free feature computation shared by the pandas UDFs in `features.py` and the in-process
+# prediction pipeline below, which computes the same features as `features.create_predict_pipeline`
+# without launching a JVM.
+
+import numpy as np  # type: ignore[import]
+import pandas as pd  # type: ignore[import]
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import spark_utils
+from ptesting import depgraph, github_utils, timeline
+
+
+# Features used in our model (See `features.create_train_test_pipeline` for their descriptions)
+FEATURES = [
+    'num_commits',
+    'updated_num_3d',
+    'updated_num_14d',
+    'updated_num_56d',
+    'updated_num_3c',
+    'updated_num_14c',
+    'updated_num_56c',
+    'num_adds',
+    'num_dels',
+    'num_chgs',
+    # 'target_card',
+    'file_card',
+    'failed_num_7d',
+    'failed_num_14d',
+    'failed_num_28d',
+    'failed_num_7c',
+    'failed_num_14c',
+    'failed_num_28c',
+    'total_failed_num',
+    'path_difference',
+    'distance',
+    'total_failed_num__x__num_commits',
+    'total_failed_num__x__num_chgs',
+    'total_failed_num__x__updated_num_56d',
+    'total_failed_num__x__updated_num_56c',
+    'total_failed_num__x__path_difference',
+    'total_failed_num__x__distance',
+    'failed_num_7d__x__num_commits',
+    'failed_num_7d__x__num_chgs',
+    'failed_num_7d__x__updated_num_56d',
+    'failed_num_7d__x__updated_num_56c',
+    'failed_num_7d__x__path_difference',
+    'failed_num_7d__x__distance',
+    'distance__x__num_commits',
+    'distance__x__num_chgs',
+    'distance__x__updated_num_56d',
+    'distance__x__updated_num_56c',
+    'distance__x__path_difference'
+]
+
+INTERACTED_FEATURES = [
+    ('total_failed_num', 'num_commits'),
+    ('total_failed_num', 'num_chgs'),
+    ('total_failed_num', 'updated_num_56d'),
+    ('total_failed_num', 'updated_num_56c'),
+    ('total_failed_num', 'path_difference'),
+    ('total_failed_num', 'distance'),
+    ('failed_num_7d', 'num_commits'),
+    ('failed_num_7d', 'num_chgs'),
+    ('failed_num_7d', 'updated_num_56d'),
+    ('failed_num_7d', 'updated_num_56c'),
+    ('failed_num_7d', 'path_difference'),
+    ('failed_num_7d', 'distance'),
+    ('distance', 'num_commits'),
+    ('distance', 'num_chgs'),
+    ('distance', 'updated_num_56d'),
+    ('distance', 'updated_num_56c'),
+    ('distance', 'path_difference')
+]
+
+# The default value of `path_difference` and `distance` if they cannot be computed
+MAX_DISTANCE_VALUE = 128
+
+
+def to_sorted_update_epochs(updated_file_stats: Dict[str, List[Tuple[str, str, str, str]]]) -> Dict[str, Any]:
+    # Parses all the update dates at once and then splits them into per-file sorted arrays
+    files = list(updated_file_stats.keys())
+    update_dates = [d for f in files for d, _, _, _ in updated_file_stats[f]]
+    update_epochs = timeline.to_epoch_seconds(update_dates, github_utils.GITHUB_DATETIME_FORMAT)
+    split_pos = np.cumsum([len(updated_file_stats[f]) for f in files])[:-1]
+    return {f: np.sort(epochs) for f, epochs in zip(files, np.split(update_epochs, split_pos))}
+
+
+def _compute_time_windows(base_epochs: Any, commit_timeline: timeline.CommitTimeline, intervals: List[int],
+                          num_commits: List[int]) -> Tuple[Any, Any, Any]:
+    # Returns the lower/upper bounds of the time windows for each base date: the first windows are
+    # `[base - interval days, base]` for `intervals` and the others cover the last `num_commits` commits
+    # before the base date.
+    day_lower_bounds = base_epochs[:, None] - np.array(intervals, dtype=np.int64)[None, :] * 86400
+    day_upper_bounds = np.repeat(base_epochs[:, None], len(intervals), axis=1)
+    commit_lower_bounds, commit_upper_bounds, valid_commit_windows = \
+        commit_timeline.windows(base_epochs, num_commits)
+
+    lower_bounds = np.concatenate([day_lower_bounds, commit_lower_bounds], axis=1)
+    upper_bounds = np.concatenate([day_upper_bounds, commit_upper_bounds], axis=1)
+    valid_windows = np.concatenate([np.ones(day_lower_bounds.shape, dtype=bool), valid_commit_windows], axis=1)
+    return lower_bounds, upper_bounds, valid_windows
+
+
+def _count_in_windows(sorted_epochs: Any, lower_bounds: Any, upper_bounds: Any) -> Any:
+    return np.searchsorted(sorted_epochs, upper_bounds, side='right') - \
+        np.searchsorted(sorted_epochs, lower_bounds, side='left')
+
+
+def count_file_updates(update_epochs: Dict[str, Any], commit_timeline: timeline.CommitTimeline,
+                       dates: Any, filenames: Any) -> pd.DataFrame:
+    base_epochs = timeline.to_epoch_seconds(dates, '%Y/%m/%d %H:%M:%S')
+
+    # Time-dependent features (3/14/56 days) and commit-dependent features (3/14/56 commits)
+    lower_bounds, upper_bounds, valid_windows = \
+        _compute_time_windows(base_epochs, commit_timeline, [3, 14, 56], [3, 14, 56])
+
+    counts = np.zeros(lower_bounds.shape, dtype=np.int64)
+    for i, files in enumerate(filenames):
+        for file in files if files is not None else []:
+            if file in update_epochs:
+                counts[i] += _count_in_windows(update_epochs[file], lower_bounds[i], upper_bounds[i])
+
+    counts[~valid_windows] = 0
+    return pd.DataFrame(counts.astype(np.int32), columns=['n3d', 'n14d', 'n56d', 'n3c', 'n14c', 'n56c'])
+
+
+# The number of low-order bits used for epoch seconds in the composite keys of `to_failure_epoch_index`
+_EPOCH_BITS = 40
+
+
+def to_failure_epoch_index(failed_tests: Dict[str, List[str]]) -> Tuple[Dict[str, int], Any]:
+    # Builds a single sorted array of `(test id << _EPOCH_BITS) + epoch` keys for failure dates,
+    # so that failures of many tests in time windows can be counted with one binary search.
+    tests = list(failed_tests.keys())
+    failed_dates = [d for t in tests for d in failed_tests[t]]
+    failed_epochs = timeline.to_epoch_seconds(failed_dates, '%Y/%m/%d %H:%M:%S')
+    test_ids = np.repeat(np.arange(len(tests), dtype=np.int64), [len(failed_tests[t]) for t in tests])
+    keys = np.sort((test_ids << _EPOCH_BITS) + failed_epochs)
+    return {t: i for i, t in enumerate(tests)}, keys
+
+
+def _count_failures_in_windows(keys: Any, test_ids: Any, lower_bounds: Any, upper_bounds: Any) -> Any:
+    max_epoch = (1 << _EPOCH_BITS) - 1
+    test_keys = np.maximum(test_ids, 0)[:, None] << _EPOCH_BITS
+    counts = np.searchsorted(keys, test_keys + np.clip(upper_bounds, 0, max_epoch), side='right') - \
+        np.searchsorted(keys, test_keys + np.clip(lower_bounds, 0, max_epoch), side='left')
+    counts[test_ids < 0] = 0
+    return counts
+
+
+def count_test_failures(failure_index: Tuple[Dict[str, int], Any], commit_timeline: timeline.CommitTimeline,
+                        dates: Any, tests: Any) -> pd.DataFrame:
+    failed_test_ids, failure_keys = failure_index
+    base_epochs = timeline.to_epoch_seconds(dates, '%Y/%m/%d %H:%M:%S')
+    test_ids = np.array([failed_test_ids.get(t, -1) for t in tests], dtype=np.int64)
+
+    # Time-dependent features (7/14/28 days) and commit-dependent features (7/14/28 commits)
+    lower_bounds, upper_bounds, valid_windows = \
+        _compute_time_windows(base_epochs, commit_timeline, [7, 14, 28], [7, 14, 28])
+    counts = _count_failures_in_windows(failure_keys, test_ids, lower_bounds, upper_bounds)
+    counts[~valid_windows] = 0
+
+    # The total number of failures in each test is the number of its keys
+    total_failed_nums = _count_failures_in_windows(
+        failure_keys, test_ids, np.zeros((len(test_ids), 1), dtype=np.int64),
+        np.full((len(test_ids), 1), (1 << _EPOCH_BITS) - 1, dtype=np.int64))[:, 0]
+
+    failed_test_stats = np.concatenate([counts, total_failed_nums[:, None]], axis=1).astype(np.int32)
+    return pd.DataFrame(failed_test_stats, columns=['n7d', 'n14d', 'n28d', 'n7c', 'n14c', 'n28c', 'total'])
+
+
+def enumerate_related_tests(file_paths: Any, dep_graph: Optional[depgraph.CompactGraph],
+                            corr_map: Dict[str, List[str]], test_files: Dict[str, str],
+                            included_tests: List[str], depth: int,
+                            max_distance: int) -> Tuple[List[str], Dict[str, int]]:
+    # TODO: Removes package-depenent stuffs
+    parse_path = spark_utils.create_func_to_transform_path_to_qualified_name()
+    is_test = lambda n: n.endswith('Suite')
+
+    related_tests = set(included_tests)
+    for file_path in file_paths:
+        correlated_files = corr_map[file_path] if file_path in corr_map else []
+        related_tests.update(list(filter(lambda f: f in test_files, correlated_files)))
+
+    if dep_graph is None:
+        return sorted(related_tests), {}
+
+    # Traverses the graph only once from all the updated files in a commit; the tests within `depth` hops
+    # are related ones and the resultant distances are reused to compute the `distance` feature.
+    targets = [ident for ident in map(parse_path, file_paths) if ident]
+    test_distances = depgraph.compute_test_distances(dep_graph, targets, max(depth, max_distance), is_test)
+    related_tests.update(t for t, d in test_distances.items() if d <= depth)
+    if depth > max_distance:
+        test_distances = {t: d for t, d in test_distances.items() if d <= max_distance}
+    return sorted(related_tests), test_distances
+
+
+def compute_path_differences(filenames: Any, tests: Any, test_files: Dict[str, str]) -> List[int]:
+    # TODO: Removes package-depenent stuffs
+    compute_path_diff = spark_utils.create_func_to_computer_path_difference()
+
+    ret = []
+    for names, t in zip(filenames, tests):
+        if t in test_files:
+            distances = []
+            for n in names if names is not None else []:
+                distances.append(compute_path_diff(n, test_files[t]))
+            ret.append(min(distances) if distances else MAX_DISTANCE_VALUE)
+        else:
+            ret.append(MAX_DISTANCE_VALUE)
+
+    return ret
+
+
+def create_predict_pipeline(test_files: Dict[str, str],
+                            commits: List[datetime],
+                            dep_graph: Optional[depgraph.CompactGraph],
+                            corr_map: Dict[str, List[str]],
+                            included_tests: List[str],
+                            updated_file_stats: Dict[str, List[Tuple[str, str, str, str]]],
+                            contributor_stats: Optional[List[Tuple[str, str]]],
+                            failed_tests: Dict[str, List[str]]) -> Any:
+    commit_timeline = timeline.build_commit_timeline(commits)
+    update_epochs = to_sorted_update_epochs(updated_file_stats)
+    failure_index = to_failure_epoch_index(failed_tests)
+    num_commits_map = {author: int(num_commits) for author, num_commits in contributor_stats} \
+        if contributor_stats else {}
+
+    # Takes a pandas DataFrame that has the `sha`, `author`, `commit_date`, `filenames`, `num_adds`,
+    # `num_dels`, and `num_chgs` columns, and returns the `sha` and `test` columns and the features
+    # for each related test
+    def _func(pdf: pd.DataFrame) -> pd.DataFrame:
+        pdf = pdf.reset_index(drop=True)
+        pdf['num_commits'] = [num_commits_map.get(a, 0) for a in pdf['author']]
+        updated_stats = count_file_updates(update_epochs, commit_timeline, pdf['commit_date'], pdf['filenames'])
+        for n in [3, 14, 56]:
+            pdf[f'updated_num_{n}d'] = updated_stats[f'n{n}d']
+            pdf[f'updated_num_{n}c'] = updated_stats[f'n{n}c']
+        pdf['file_card'] = [len(files) for files in pdf['filenames']]
+
+        related_tests = {}
+        for sha, filenames in pdf.groupby('sha')['filenames']:
+            file_paths = sorted(set(f for files in filenames for f in files))
+            related_tests[sha] = enumerate_related_tests(
+                file_paths, dep_graph, corr_map, test_files, included_tests, depth=2, max_distance=16)
+
+        pdf['test'] = [related_tests[sha][0] for sha in pdf['sha']]
+        pdf = pdf.explode('test').dropna(subset=['test']).reset_index(drop=True)
+
+        failed_test_stats = count_test_failures(failure_index, commit_timeline, pdf['commit_date'], pdf['test'])
+        for n in [7, 14, 28]:
+            pdf[f'failed_num_{n}d'] = failed_test_stats[f'n{n}d']
+            pdf[f'failed_num_{n}c'] = failed_test_stats[f'n{n}c']
+        pdf['total_failed_num'] = failed_test_stats['total']
+
+        pdf['path_difference'] = compute_path_differences(pdf['filenames'], pdf['test'], test_files)
+        pdf['distance'] = [related_tests[sha][1].get(t, MAX_DISTANCE_VALUE) for sha, t in zip(pdf['sha'], pdf['test'])]
+        for c1, c2 in INTERACTED_FEATURES:
+            pdf[f'{c1}__x__{c2}'] = pdf[c1] * pdf[c2]
+
+        return pdf[['sha', 'test', *FEATURES]].astype({c: np.int32 for c in FEATURES})
+
+    return _func
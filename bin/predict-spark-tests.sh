@@ -44,7 +44,7 @@ exec python3 -u ${FWDIR}/bin/ptesting-model.py \
   --excluded-tests ${MODELPATH}/logs/excluded-tests.json \
   --included-tests ${MODELPATH}/logs/included-tests.json \
   --failed-tests ${MODELPATH}/failed-tests.json \
-  --build-dep ${MODELPATH}/indexes/latest/dep-graph.json \
+  --build-dep ${MODELPATH}/indexes/latest/dep-graph \
   --correlated-files ${MODELPATH}/indexes/latest/correlated-files.json \
   --correlated-files-delta ${MODELPATH}/correlated-files-delta.json \
   --updated-file-stats ${MODELPATH}/logs/updated-file-stats.json \
@@ -17,17 +17,21 @@
 # limitations under the License.
 #
 
+from __future__ import annotations
+
+import functools
 import json
 import os
-import pandas as pd  # type: ignore[import]
 import pickle
 from pathlib import Path
-from pyspark.sql import DataFrame, SparkSession, functions as funcs
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
 
-import features
-from auto_tracking import auto_tracking, auto_tracking_with, save_data_lineage
-from ptesting import github_utils, train
+# Heavy modules (pandas, pyspark, and the modules depending on them) are imported in the functions
+# using them so that `--help`, argument errors, and the Spark-free paths start quickly.
+if TYPE_CHECKING:
+    import pandas as pd  # type: ignore[import]
+    from pyspark.sql import DataFrame, SparkSession
+    from ptesting import depgraph
 
 
 def _setup_logger() -> Any:
@@ -41,7 +45,25 @@ def _setup_logger() -> Any:
 _logger = _setup_logger()
 
 
+def auto_tracking(f: Any) -> Any:
+    # Defers importing `auto_tracking` (that imports pyspark) until a decorated function is called
+    @functools.wraps(f)
+    def wrapper(*args: Any, **kwargs: Any) -> Any:
+        import auto_tracking as tracking
+        return tracking.auto_tracking(f)(*args, **kwargs)  # type: ignore
+
+    return wrapper
+
+# Entries persisted in a feature cache directory
+_FEATURE_CACHE_ENTRIES = ['train-logs', 'test-logs', 'train-features', 'test-features']
+
+# Temporary feature cache directories older than this are assumed to be left by failed runs
+_STALE_FEATURE_CACHE_SECONDS = 24 * 60 * 60
+
+
 def _to_pandas(name: str) -> Any:
+    from auto_tracking import auto_tracking_with
+
     @auto_tracking_with(name)
     def _func(df: DataFrame) -> pd.DataFrame:
         return df.toPandas()
@@ -50,6 +72,8 @@ def _to_pandas(name: str) -> Any:
 
 
 def _to_spark(name: str) -> Any:
+    from auto_tracking import auto_tracking_with
+
     @auto_tracking_with(name)
     def _func(spark: SparkSession, pdf: pd.DataFrame) -> DataFrame:
         return spark.createDataFrame(pdf)
@@ -64,38 +88,59 @@ def _to_spark(name: str) -> Any:
 #  - fast model training on commodity hardware
 #  - robustness in imbalanced datasets
 @auto_tracking
-def _build_predictive_model(df: DataFrame, to_features: Any) -> Any:
+def _build_predictive_model(df: DataFrame, to_features: Any, trials_path: Optional[str] = None) -> Any:
+    from ptesting import train
     pdf = _to_pandas('_to_pandas_for_building_predictive_model')(to_features(df))
     X = pdf[pdf.columns[pdf.columns != 'failed']]  # type: ignore
     y = pdf['failed']
     X, y = train.rebalance_training_data(X, y, coeff=1.0)
-    clf, score = train.build_model(X, y, opts={'hp.timeout': '3600', 'hp.no_progress_loss': '1'})
+    clf, score = train.build_model(X, y, opts={'hp.timeout': '3600', 'hp.no_progress_loss': '1'},
+                                   trials_path=trials_path)
     _logger.info(f"model score: {score}")
     return clf
 
 
+def _export_model(output_path: str, clf: Any) -> None:
+    # Exports the booster as a LightGBM text model and flattened tree arrays; the latter can be scored
+    # by `ptesting.scoring` without lightgbm and sklearn (e.g., `--model model.npz` in predict mode).
+    from ptesting import scoring
+    clf.booster_.save_model(f"{output_path}/model.txt")
+    scoring.from_lgb_dump(clf.booster_.dump_model(), list(clf.classes_)).save(f"{output_path}/model.npz")
+
+
 @auto_tracking
 def _train_test_split(df: DataFrame, test_ratio: float) -> Tuple[DataFrame, DataFrame]:
+    from pyspark.sql import functions as funcs
     test_nrows = int(df.count() * test_ratio)
     test_df = df.orderBy(funcs.expr('to_timestamp(commit_date, "yyy/MM/dd HH:mm:ss")').desc()).limit(test_nrows)
     train_df = df.subtract(test_df)
     return train_df, test_df
 
 
+def _predict_positive_probs(clf: Any, X: pd.DataFrame) -> Any:
+    # Returns the probabilities of the failed class ('1') as a float array
+    failed_class_pos = [str(c) for c in clf.classes_].index('1')
+    return clf.predict_proba(X)[:, failed_class_pos]
+
+
+def _rank_tests_by_failed_probs(df: DataFrame) -> DataFrame:
+    # Sorts the tests of each sha in descending order of failed probabilities with `sort_array`, which compares
+    # structs field-by-field natively; ties are broken by test names in descending order.
+    from pyspark.sql import functions as funcs
+    to_test_struct = 't -> named_struct("test", t.test, "failed_prob", t.failed_prob)'
+    return df.groupBy('sha') \
+        .agg(funcs.expr('collect_set(named_struct("failed_prob", failed_prob, "test", test))').alias('tests')) \
+        .selectExpr('sha', f'filter(tests, t -> t.test IS NOT NULL) tests') \
+        .selectExpr('sha', f'transform(sort_array(tests, false), {to_test_struct}) tests')
+
+
 @auto_tracking
 def _predict_failed_probs_for_tests(test_df: DataFrame, clf: Any, to_features: Any) -> DataFrame:
-    test_feature_df = to_features(test_df)
-    pdf = _to_pandas('_to_pandas_for_failed_probs')(test_feature_df.selectExpr('sha', 'test'))
-    X = _to_pandas('_to_pandas_for_evaluating_model')(test_feature_df.drop('sha', 'failed', 'test'))
-    predicted = clf.predict_proba(X)
-    pmf = map(lambda p: {"classes": clf.classes_.tolist(), "probs": p.tolist()}, predicted)
-    pmf = map(lambda p: json.dumps(p), pmf)  # type: ignore
-    pdf['predicted'] = pd.Series(list(pmf))
-    to_map_expr = funcs.expr('from_json(predicted, "classes array<string>, probs array<double>")')
-    to_failed_prob = 'map_from_arrays(pmf.classes, pmf.probs)["1"] failed_prob'
-    df_with_failed_probs = _to_spark('predicted_failed_probs')(test_df.sql_ctx.sparkSession, pdf) \
-        .withColumn('pmf', to_map_expr) \
-        .selectExpr('sha', 'test', to_failed_prob)
+    import features
+    test_feature_pdf = _to_pandas('_to_pandas_for_evaluating_model')(to_features(test_df))
+    pdf = test_feature_pdf[['sha', 'test']].copy()
+    pdf['failed_prob'] = _predict_positive_probs(clf, test_feature_pdf.drop(['sha', 'test'], axis=1))
+    df_with_failed_probs = _to_spark('predicted_failed_probs')(test_df.sql_ctx.sparkSession, pdf)
 
     # Applied an emprical rule: set 1.0 to the failed probs of udpated tests
     # TODO: Removes package-depenent stuffs
@@ -104,41 +149,16 @@ def _predict_failed_probs_for_tests(test_df: DataFrame, clf: Any, to_features: A
         test_df, df_with_failed_probs,
         spark_utils.RE_PARSE_PATH_PATTERN)
 
-    compare = lambda x, y: \
-        f"case when {x}.failed_prob < {y}.failed_prob then 1 " \
-        f"when {x}.failed_prob > {y}.failed_prob then -1 " \
-        "else 0 end"
-    df_with_failed_probs = df_with_failed_probs.groupBy('sha') \
-        .agg(funcs.expr('collect_set(named_struct("test", test, "failed_prob", failed_prob))').alias('tests')) \
-        .selectExpr('sha', f'filter(tests, t -> t.test IS NOT NULL) tests') \
-        .selectExpr('sha', f'array_sort(tests, (l, r) -> {compare("l", "r")}) tests')
-
-    return df_with_failed_probs
+    return _rank_tests_by_failed_probs(df_with_failed_probs)
 
 
 @auto_tracking
 def _predict_failed_probs(df: DataFrame, clf: Any) -> DataFrame:
     pdf = _to_pandas('to_pandas_for_predicting_failed_probs')(df)
-    predicted = clf.predict_proba(pdf.drop('test', axis=1))
-    pmf = map(lambda p: {"classes": clf.classes_.tolist(), "probs": p.tolist()}, predicted)
-    pmf = map(lambda p: json.dumps(p), pmf)  # type: ignore
-    pdf['predicted'] = pd.Series(list(pmf))
-    to_map_expr = funcs.expr('from_json(predicted, "classes array<string>, probs array<double>")')
-    to_failed_prob = 'map_from_arrays(pmf.classes, pmf.probs)["1"] failed_prob'
-    df_with_failed_probs = _to_spark('predicted_failed_probs')(df.sql_ctx.sparkSession, pdf[['test', 'predicted']]) \
-        .withColumn('pmf', to_map_expr) \
-        .selectExpr('test', to_failed_prob)
-
-    compare = lambda x, y: \
-        f"case when {x}.failed_prob < {y}.failed_prob then 1 " \
-        f"when {x}.failed_prob > {y}.failed_prob then -1 " \
-        "else 0 end"
-    df_with_failed_probs = df_with_failed_probs \
-        .selectExpr('collect_set(named_struct("test", test, "failed_prob", failed_prob)) tests') \
-        .selectExpr(f'filter(tests, t -> t.test IS NOT NULL) tests') \
-        .selectExpr(f'array_sort(tests, (l, r) -> {compare("l", "r")}) tests')
-
-    return df_with_failed_probs
+    pdf['failed_prob'] = _predict_positive_probs(clf, pdf.drop(['sha', 'test'], axis=1))
+    df_with_failed_probs = _to_spark('predicted_failed_probs')(
+        df.sql_ctx.sparkSession, pdf[['sha', 'test', 'failed_prob']])
+    return _rank_tests_by_failed_probs(df_with_failed_probs)
 
 
 @auto_tracking
@@ -160,6 +180,8 @@ def _compute_eval_metrics(predicted: DataFrame, total_num_tests: int, eval_num_t
     # , where D is a set of code changes and F_{d} is a set of failed tests.
     #
     # TODO: Computes a "chnage recall" metric.
+    from pyspark.sql import functions as funcs
+
     def _metric(num_tests: int, score_thres: float = 0.0) -> Tuple[float, float]:
         # TODO: Needs to make 'num_dependent_tests' more precise
         filtered_test_expr = funcs.expr(f'filter(tests, x -> x.failed_prob >= {score_thres})')
@@ -196,6 +218,7 @@ def _format_eval_metrics(metrics: List[Dict[str, Any]]) -> str:
 
 
 def _save_metrics_as_chart(output_path: str, metrics: List[Dict[str, Any]], max_test_num: int) -> None:
+    import pandas as pd  # type: ignore[import]
     import altair as alt
     x_opts = {
         'scale': alt.Scale(domain=[0, max_test_num]),
@@ -213,21 +236,89 @@ def _save_metrics_as_chart(output_path: str, metrics: List[Dict[str, Any]], max_
     plot.save(output_path)
 
 
+def _load_feature_cache(spark: SparkSession, cache_path: str) -> Tuple[DataFrame, DataFrame, DataFrame, DataFrame]:
+    train_df, test_df, train_feature_df, test_feature_df = \
+        [spark.read.parquet(f'{cache_path}/{name}') for name in _FEATURE_CACHE_ENTRIES]
+    return train_df, test_df, train_feature_df, test_feature_df
+
+
+def _materialize_split(spark: SparkSession, train_df: DataFrame, test_df: DataFrame,
+                       path: Optional[str]) -> Tuple[DataFrame, DataFrame]:
+    # The split is not always deterministic (e.g., ties in commit dates at the split boundary), so it is
+    # materialized before anything is derived from it; otherwise, failed tests, correlated files, and features
+    # could be computed from different splits. The split logs are written in `path` if given.
+    if path is None:
+        return train_df.localCheckpoint(), test_df.localCheckpoint()
+
+    train_df.write.parquet(f'{path}/train-logs')
+    test_df.write.parquet(f'{path}/test-logs')
+    return spark.read.parquet(f'{path}/train-logs'), spark.read.parquet(f'{path}/test-logs')
+
+
+def _save_feature_cache(spark: SparkSession, cache_path: str, tmp_path: str, train_df: DataFrame, test_df: DataFrame,
+                        to_train_features: Any, to_test_features: Any) -> Tuple[DataFrame, DataFrame, DataFrame,
+                                                                                DataFrame]:
+    # Writes the features of the split logs materialized in `tmp_path` (See `_materialize_split`) and then renames
+    # the directory so that partially-written caches are never reused.
+    import shutil
+    try:
+        to_train_features(train_df).write.parquet(f'{tmp_path}/train-features')
+        to_test_features(test_df.drop('failed_tests')).write.parquet(f'{tmp_path}/test-features')
+        os.rename(tmp_path, cache_path)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+    _prune_feature_caches(cache_path)
+    return _load_feature_cache(spark, cache_path)
+
+
+def _prune_feature_caches(cache_path: str) -> None:
+    # Removes the caches for the other inputs because they are never reused, but keeps temporary directories
+    # unless they are stale because other training runs might be writing caches into them.
+    import shutil
+    import time
+    cache_root_path, cache_key = os.path.split(cache_path)
+    for entry in os.listdir(cache_root_path):
+        path = f'{cache_root_path}/{entry}'
+        if entry == cache_key or not os.path.isdir(path):
+            continue
+        if entry.endswith('.tmp') and time.time() - os.path.getmtime(path) < _STALE_FEATURE_CACHE_SECONDS:
+            continue
+        shutil.rmtree(path, ignore_errors=True)
+
+
 @auto_tracking
 def _train_and_eval_ptest_model(output_path: str, spark: SparkSession, df: DataFrame,
                                 test_files: Dict[str, str],
                                 commits: List[Tuple[str, str, List[str]]],
                                 correlated_files: Dict[str, List[str]],
-                                dep_graph: Dict[str, List[str]],
+                                dep_graph: depgraph.CompactGraph,
                                 included_tests: List[str],
                                 updated_file_stats: Dict[str, List[Tuple[str, str, str, str]]],
                                 contributor_stats: Optional[List[Tuple[str, str]]],
-                                test_ratio: float = 0.20) -> None:
+                                test_ratio: float = 0.20,
+                                feature_cache_path: Optional[str] = None,
+                                stage_store_path: Optional[str] = None) -> None:
+    import features
+    from ptesting import github_utils
+
     @auto_tracking
     def num_failed_tests(df: DataFrame) -> int:
         return df.selectExpr('explode(failed_tests)').count()
 
-    train_df, test_df = _train_test_split(df, test_ratio=test_ratio)
+    # Reuses the split logs and their features if they have already been computed from the same inputs
+    feature_cache_hit = feature_cache_path is not None and os.path.isdir(feature_cache_path)
+    tmp_cache_path: Optional[str] = None
+    if feature_cache_path is not None and feature_cache_hit:
+        _logger.info(f'Reusing the features cached in {feature_cache_path}')
+        train_df, test_df, train_feature_df, test_feature_df = _load_feature_cache(spark, feature_cache_path)
+    else:
+        if feature_cache_path is not None:
+            import uuid
+            tmp_cache_path = f'{feature_cache_path}.{uuid.uuid4().hex}.tmp'
+        train_df, test_df = _train_test_split(df, test_ratio=test_ratio)
+        train_df, test_df = _materialize_split(spark, train_df, test_df, tmp_cache_path)
+
     _logger.info('Split data: #total={}(#failed={}), #train={}(#failed={}), #test={}(#failed={})'.format(
         df.count(), num_failed_tests(df), train_df.count(), num_failed_tests(train_df),
         test_df.count(), num_failed_tests(test_df)))
@@ -240,9 +331,18 @@ def _train_and_eval_ptest_model(output_path: str, spark: SparkSession, df: DataF
     failed_tests = features.build_failed_tests(train_df)
     to_train_features, to_test_features = features.create_train_test_pipeline(
         spark, test_files, repo_commits, dep_graph, correlated_files, included_tests, updated_file_stats,
-        contributor_stats, failed_tests)
+        contributor_stats, failed_tests, stage_store_path=stage_store_path)
 
-    clf = _build_predictive_model(train_df, to_train_features)
+    if feature_cache_path is not None:
+        if tmp_cache_path is not None:
+            train_df, test_df, train_feature_df, test_feature_df = _save_feature_cache(
+                spark, feature_cache_path, tmp_cache_path, train_df, test_df, to_train_features, to_test_features)
+
+        to_train_features = lambda _: train_feature_df
+        to_test_features = lambda _: test_feature_df
+
+    # Hyperparameter search is warm-started from the trials of the previous model
+    clf = _build_predictive_model(train_df, to_train_features, trials_path=f"{output_path}/model-trials.json")
 
     with open(f"{output_path}/correlated-files-delta.json", 'w') as f:
         f.write(json.dumps(correlated_files_from_failed_tests, indent=2))
@@ -251,6 +351,8 @@ def _train_and_eval_ptest_model(output_path: str, spark: SparkSession, df: DataF
     with open(f"{output_path}/model.pkl", 'wb') as f:  # type: ignore
         pickle.dump(clf, f)  # type: ignore
 
+    _export_model(output_path, clf)
+
     predicted = _predict_failed_probs_for_tests(test_df.drop('failed_tests'), clf, to_test_features)
     predicted = test_df.selectExpr('sha', 'failed_tests').join(predicted, 'sha', 'LEFT_OUTER') \
         .selectExpr('sha', 'failed_tests', 'coalesce(tests, array()) tests')
@@ -272,6 +374,7 @@ def _train_and_eval_ptest_model(output_path: str, spark: SparkSession, df: DataF
 
 @auto_tracking
 def _exclude_tests_from(df: DataFrame, excluded_tests: List[str]) -> DataFrame:
+    import pandas as pd  # type: ignore[import]
     spark = df.sql_ctx.sparkSession
     excluded_test_df = spark.createDataFrame(pd.DataFrame(excluded_tests, columns=['excluded_test'])) \
         .selectExpr('collect_set(excluded_test) excluded_tests')
@@ -280,6 +383,14 @@ def _exclude_tests_from(df: DataFrame, excluded_tests: List[str]) -> DataFrame:
         .selectExpr('author', 'sha', 'commit_date', array_except_expr, 'files')
 
 
+def _resolve_dep_graph_path(path: str) -> str:
+    # `analyze-spark-repo.py` writes a dependency graph as both a `dep-graph` directory and a `dep-graph.json` file,
+    # but indexes built by older versions only have the JSON file, so it is used if the directory is missing.
+    if path and not os.path.exists(path) and os.path.isfile(f'{path}.json'):
+        return f'{path}.json'
+    return path
+
+
 def train_main(argv: Any) -> None:
     # Parses command-line arguments for a training mode
     from argparse import ArgumentParser
@@ -295,6 +406,8 @@ def train_main(argv: Any) -> None:
     parser.add_argument('--excluded-tests', type=str, required=False)
     parser.add_argument('--included-tests', type=str, required=False)
     parser.add_argument('--data-lineage', action='store_true')
+    parser.add_argument('--disable-feature-cache', action='store_true')
+    parser.add_argument('--append-mode', action='store_true')
     parser.add_argument('--spark-jars', type=str, required=False, default='')
     args = parser.parse_args(argv)
 
@@ -312,20 +425,25 @@ def train_main(argv: Any) -> None:
         raise ValueError(f"Updated file stats not found in {os.path.abspath(args.updated_file_stats)}")
     if args.contributor_stats and not os.path.isfile(args.contributor_stats):
         raise ValueError(f"Contributor stats not found in {os.path.abspath(args.contributor_stats)}")
-    if args.build_dep and not os.path.isfile(args.build_dep):
+    args.build_dep = _resolve_dep_graph_path(args.build_dep)
+    if args.build_dep and not os.path.exists(args.build_dep):
         raise ValueError(f"Dependency graph file not found in {os.path.abspath(args.build_dep)}")
     if args.excluded_tests and not os.path.isfile(args.excluded_tests):
         raise ValueError(f"Excluded test list file not found in {os.path.abspath(args.excluded_tests)}")
     if args.included_tests and not os.path.isfile(args.included_tests):
         raise ValueError(f"Included test list file not found in {os.path.abspath(args.included_tests)}")
 
+    from pyspark.sql import SparkSession
+    import features
+    from ptesting import depgraph, fingerprint
+
     test_files = json.loads(Path(args.test_files).read_text())
     commits = json.loads(Path(args.commits).read_text())
     correlated_files = json.loads(Path(args.correlated_files).read_text())
     updated_file_stats = json.loads(Path(args.updated_file_stats).read_text())
     contributor_stats = json.loads(Path(args.contributor_stats).read_text()) \
         if args.contributor_stats else None
-    dep_graph = json.loads(Path(args.build_dep).read_text()) \
+    dep_graph = depgraph.load_dependency_graph(args.build_dep) \
         if args.build_dep else None
     excluded_tests = json.loads(Path(args.excluded_tests).read_text()) \
         if args.excluded_tests else []
@@ -344,6 +462,30 @@ def train_main(argv: Any) -> None:
     test_files = {k: test_files[k] for k in test_files if k not in excluded_tests} \
         if excluded_tests else test_files
 
+    # Computes a key of the feature cache from the contents of the input artifacts and the pipeline version
+    test_ratio = 0.10
+    feature_cache_path = None
+    if not args.disable_feature_cache:
+        input_paths = {
+            'train_log_data': args.train_log_data,
+            'test_files': args.test_files,
+            'commits': args.commits,
+            'correlated_files': args.correlated_files,
+            'updated_file_stats': args.updated_file_stats,
+            'contributor_stats': args.contributor_stats,
+            'build_dep': args.build_dep,
+            'excluded_tests': args.excluded_tests,
+            'included_tests': args.included_tests
+        }
+        params = {'feature_pipeline_version': features.FEATURE_PIPELINE_VERSION, 'test_ratio': test_ratio}
+        feature_cache_key = fingerprint.compute_fingerprint(input_paths, params)
+        os.makedirs(f'{args.output}/feature-cache', exist_ok=True)
+        feature_cache_path = f'{args.output}/feature-cache/{feature_cache_key}'
+
+    # In an append mode, the outputs of feature stages for processed shas are stored across training runs
+    # so that only newly-crawled shas are processed
+    stage_store_path = f'{args.output}/feature-store' if args.append_mode else None
+
     # Initializes a Spark session
     spark = SparkSession.builder \
         .config("spark.jars", args.spark_jars) \
@@ -358,11 +500,13 @@ def train_main(argv: Any) -> None:
     spark.sparkContext.setLogLevel("ERROR")
 
     try:
-        # Assigns a random string if 'sha' is an empty string
+        # Assigns a hash of the log content if 'sha' is an empty string; the hash is deterministic
+        # so that the shas can be used as keys of stored features across training runs.
         # TODO: Needs to validate input log data
+        content_hash = 'sha(to_json(struct(author, commit_date, failed_tests, files)))'
         expected_input_cols = [
             'author',
-            'case when length(sha) > 0 then sha else sha(string(random())) end sha',
+            f'case when length(sha) > 0 then sha else {content_hash} end sha',
             'commit_date',
             'array_distinct(failed_tests) failed_tests',
             'files'
@@ -398,15 +542,42 @@ def train_main(argv: Any) -> None:
                                     correlated_files, dep_graph,
                                     included_tests,
                                     updated_file_stats, contributor_stats,
-                                    test_ratio=0.10)
+                                    test_ratio=test_ratio,
+                                    feature_cache_path=feature_cache_path,
+                                    stage_store_path=stage_store_path)
 
         if args.data_lineage:
+            from auto_tracking import save_data_lineage
             save_data_lineage(f'{args.output}/data_lineage', format='svg',
                               contracted=True, overwrite=True)
     finally:
         spark.stop()
 
 
+def _predict_failed_probs_without_spark(pdf: pd.DataFrame, clf: Any) -> pd.DataFrame:
+    import pandas as pd  # type: ignore[import]
+    if len(pdf) == 0:
+        return pd.DataFrame({'sha': [], 'test': [], 'failed_prob': []})
+
+    # Scores the tests of all the commits in `pdf` with a single `predict_proba` call
+    df_with_failed_probs = pd.DataFrame({
+        'sha': pdf['sha'],
+        'test': pdf['test'],
+        'failed_prob': _predict_positive_probs(clf, pdf.drop(['sha', 'test'], axis=1))
+    })
+    # Breaks ties by test names in descending order as `_rank_tests_by_failed_probs` does
+    return df_with_failed_probs.drop_duplicates() \
+        .sort_values(['sha', 'failed_prob', 'test'], ascending=[True, False, False]) \
+        .reset_index(drop=True)
+
+
+def _select_tests_without_spark(predicted: pd.DataFrame, shas: List[str],
+                                num_selected_tests: int) -> Dict[str, List[str]]:
+    selected_tests = predicted.groupby('sha', sort=False).head(num_selected_tests) \
+        .groupby('sha', sort=False)['test'].apply(list).to_dict()
+    return {sha: selected_tests.get(sha, []) for sha in shas}
+
+
 def _format_for_selective_tests_in_scalatest(tests: List[str]) -> str:
     selected_tests = []
     for t in tests:
@@ -414,15 +585,9 @@ def _format_for_selective_tests_in_scalatest(tests: List[str]) -> str:
     return '\n'.join(selected_tests)
 
 
-def predict_main(argv: Any) -> None:
-    # Parses command-line arguments for a prediction mode
-    from argparse import ArgumentParser
-    parser = ArgumentParser()
-    parser.add_argument('--username', type=str, required=True)
-    parser.add_argument('--target', type=str, required=True)
-    parser.add_argument('--num-commits', type=int, required=True)
-    parser.add_argument('--num-selected-tests', type=int, required=True)
-    parser.add_argument('--model', type=str, required=True)
+def _add_arguments_for_prediction(parser: Any) -> None:
+    parser.add_argument('--model', type=str, required=True,
+                        help='Path to a pickled model (model.pkl) or its exported tree arrays (model.npz)')
     parser.add_argument('--test-files', type=str, required=True)
     parser.add_argument('--commits', type=str, required=True)
     parser.add_argument('--correlated-files', type=str, required=True)
@@ -433,15 +598,9 @@ def predict_main(argv: Any) -> None:
     parser.add_argument('--build-dep', type=str, required=True)
     parser.add_argument('--excluded-tests', type=str, required=False)
     parser.add_argument('--included-tests', type=str, required=False)
-    parser.add_argument('--format', action='store_true')
-    args = parser.parse_args(argv)
 
-    if not os.path.isdir(f'{args.target}/.git'):
-        raise ValueError(f"Git-managed directory not found in {os.path.abspath(args.target)}")
-    if args.num_commits <= 0:
-        raise ValueError(f"Target #commits must be positive, but {args.num_commits}")
-    if args.num_selected_tests <= 0:
-        raise ValueError(f"Predicted #tests must be positive, but {args.num_selected_tests}")
+
+def _load_resources_for_prediction(args: Any) -> Dict[str, Any]:
     if not os.path.isfile(args.model):
         raise ValueError(f"Predictive model not found in {os.path.abspath(args.model)}")
     if not os.path.isfile(args.test_files):
@@ -458,14 +617,19 @@ def predict_main(argv: Any) -> None:
         raise ValueError(f"Updated file stats not found in {os.path.abspath(args.updated_file_stats)}")
     if args.contributor_stats and not os.path.isfile(args.contributor_stats):
         raise ValueError(f"Contributor stats not found in {os.path.abspath(args.contributor_stats)}")
-    if args.build_dep and not os.path.isfile(args.build_dep):
+    args.build_dep = _resolve_dep_graph_path(args.build_dep)
+    if args.build_dep and not os.path.exists(args.build_dep):
         raise ValueError(f"Dependency graph file not found in {os.path.abspath(args.build_dep)}")
     if args.excluded_tests and not os.path.isfile(args.excluded_tests):
         raise ValueError(f"Excluded test list file not found in {os.path.abspath(args.excluded_tests)}")
     if args.included_tests and not os.path.isfile(args.included_tests):
         raise ValueError(f"Included test list file not found in {os.path.abspath(args.included_tests)}")
 
-    clf = pickle.loads(Path(args.model).read_bytes())
+    from ptesting import depgraph, github_utils, scoring
+    if args.model.endswith('.npz'):
+        clf = scoring.load_model(args.model)
+    else:
+        clf = pickle.loads(Path(args.model).read_bytes())
     test_files = json.loads(Path(args.test_files).read_text())
     commits = json.loads(Path(args.commits).read_text())
     repo_commits = list(map(lambda c: github_utils.from_github_datetime(c[0]), commits))
@@ -475,7 +639,7 @@ def predict_main(argv: Any) -> None:
     failed_tests = json.loads(Path(args.failed_tests).read_text())
     contributor_stats = json.loads(Path(args.contributor_stats).read_text()) \
         if args.contributor_stats else None
-    dep_graph = json.loads(Path(args.build_dep).read_text()) \
+    dep_graph = depgraph.load_dependency_graph(args.build_dep) \
         if args.build_dep else None
     excluded_tests = json.loads(Path(args.excluded_tests).read_text()) \
         if args.excluded_tests else []
@@ -498,7 +662,78 @@ def predict_main(argv: Any) -> None:
     test_files = {k: test_files[k] for k in test_files if k not in excluded_tests} \
         if excluded_tests else test_files
 
+    return {
+        'clf': clf,
+        'test_files': test_files,
+        'commits': repo_commits,
+        'dep_graph': dep_graph,
+        'corr_map': correlated_files,
+        'included_tests': included_tests,
+        'updated_file_stats': updated_file_stats,
+        'contributor_stats': contributor_stats,
+        'failed_tests': failed_tests
+    }
+
+
+def _to_pipeline_args(resources: Dict[str, Any]) -> List[Any]:
+    return [resources[k] for k in ['test_files', 'commits', 'dep_graph', 'corr_map', 'included_tests',
+                                   'updated_file_stats', 'contributor_stats', 'failed_tests']]
+
+
+def predict_main(argv: Any) -> None:
+    # Parses command-line arguments for a prediction mode
+    from argparse import ArgumentParser
+    parser = ArgumentParser()
+    parser.add_argument('--username', type=str, required=True)
+    parser.add_argument('--target', type=str, required=True)
+    parser.add_argument('--num-commits', type=int, required=True)
+    parser.add_argument('--num-selected-tests', type=int, required=True)
+    _add_arguments_for_prediction(parser)
+    parser.add_argument('--format', action='store_true')
+    parser.add_argument('--without-spark', action='store_true')
+    args = parser.parse_args(argv)
+
+    if not os.path.isdir(f'{args.target}/.git'):
+        raise ValueError(f"Git-managed directory not found in {os.path.abspath(args.target)}")
+    if args.num_commits <= 0:
+        raise ValueError(f"Target #commits must be positive, but {args.num_commits}")
+    if args.num_selected_tests <= 0:
+        raise ValueError(f"Predicted #tests must be positive, but {args.num_selected_tests}")
+
+    resources = _load_resources_for_prediction(args)
+    clf = resources['clf']
+
+    def _print_selected_tests(selected_tests: List[str]) -> None:
+        if args.format:
+            print(_format_for_selective_tests_in_scalatest(selected_tests))
+        else:
+            print(json.dumps(selected_tests, indent=2))
+
+    import git_utils
+    if args.without_spark:
+        # Computes features in-process with pandas/NumPy to avoid the overhead of launching a Spark session
+        import pandas as pd  # type: ignore[import]
+        import local_features
+        commit_date = git_utils.get_latest_commit_date(args.target)
+        num_adds, num_dels, num_chgs = git_utils.get_updated_file_stats(args.target, args.num_commits)
+        pdf = pd.DataFrame([{
+            'sha': '0',
+            'author': args.username,
+            'commit_date': commit_date,
+            'filenames': git_utils.get_updated_files(args.target, args.num_commits),
+            'num_adds': num_adds,
+            'num_dels': num_dels,
+            'num_chgs': num_chgs
+        }])
+
+        to_features = local_features.create_predict_pipeline(*_to_pipeline_args(resources))
+        predicted = _predict_failed_probs_without_spark(to_features(pdf), clf)
+        _print_selected_tests(predicted['test'].head(args.num_selected_tests).tolist())
+        return
+
     # Initializes a Spark session
+    from pyspark.sql import SparkSession
+    import features
     spark = SparkSession.builder \
         .enableHiveSupport() \
         .getOrCreate()
@@ -511,7 +746,6 @@ def predict_main(argv: Any) -> None:
     spark.sparkContext.setLogLevel("ERROR")
 
     try:
-        import git_utils
         commit_date = git_utils.get_latest_commit_date(args.target)
         updated_files = git_utils.get_updated_files(args.target, args.num_commits)
         updated_files = ",".join(list(map(lambda f: f'"{f}"', updated_files)))  # type: ignore
@@ -527,33 +761,224 @@ def predict_main(argv: Any) -> None:
             f'{num_chgs} num_chgs'
         ])
 
-        to_features = features.create_predict_pipeline(
-            spark, test_files, repo_commits, dep_graph, correlated_files, included_tests,
-            updated_file_stats, contributor_stats, failed_tests)
+        to_features = features.create_predict_pipeline(spark, *_to_pipeline_args(resources))
 
         predicted = _predict_failed_probs(to_features(df), clf)
         selected_test_df = predicted \
             .selectExpr(f'slice(tests, 1, {args.num_selected_tests}) selected_tests') \
             .selectExpr('selected_tests.test selected_tests')
 
-        selected_tests = selected_test_df.collect()[0].selected_tests
-        if args.format:
-            print(_format_for_selective_tests_in_scalatest(selected_tests))
-        else:
-            print(json.dumps(selected_tests, indent=2))
+        _print_selected_tests(selected_test_df.collect()[0].selected_tests)
     finally:
         spark.stop()
 
 
+def _to_commit_row(c: Dict[str, Any]) -> Dict[str, Any]:
+    # Converts a JSON object like `{"sha": "...", "author": "...", "commit_date": "...", "files": ["...", ...],
+    # "adds": 1, "dels": 1}` into an input row of `local_features.create_predict_pipeline`; `chgs` is optional
+    # and defaults to `adds + dels` like `git_utils.get_updated_file_stats`.
+    num_adds, num_dels = int(c.get('adds', 0)), int(c.get('dels', 0))
+    return {
+        'sha': str(c['sha']),
+        'author': c.get('author', ''),
+        'commit_date': c['commit_date'],
+        'filenames': list(c['files']),
+        'num_adds': num_adds,
+        'num_dels': num_dels,
+        'num_chgs': int(c.get('chgs', num_adds + num_dels))
+    }
+
+
+def _read_batch_input(path: str) -> pd.DataFrame:
+    # Each line is a JSON object of a commit (See `_to_commit_row`)
+    import pandas as pd  # type: ignore[import]
+    with open(path) as f:
+        rows = [_to_commit_row(json.loads(line)) for line in f if line.strip()]
+
+    columns = ['sha', 'author', 'commit_date', 'filenames', 'num_adds', 'num_dels', 'num_chgs']
+    pdf = pd.DataFrame(rows, columns=columns)
+    if pdf['sha'].duplicated().any():
+        raise ValueError(f"Duplicate shas found in {os.path.abspath(path)}")
+    return pdf
+
+
+def batch_predict_main(argv: Any) -> None:
+    # Parses command-line arguments for a batch prediction mode
+    from argparse import ArgumentParser
+    parser = ArgumentParser()
+    parser.add_argument('--input', type=str, required=True)
+    parser.add_argument('--output', type=str, required=False)
+    parser.add_argument('--num-selected-tests', type=int, required=True)
+    _add_arguments_for_prediction(parser)
+    parser.add_argument('--without-spark', action='store_true')
+    args = parser.parse_args(argv)
+
+    if not os.path.isfile(args.input):
+        raise ValueError(f"Batch input file not found in {os.path.abspath(args.input)}")
+    if args.num_selected_tests <= 0:
+        raise ValueError(f"Predicted #tests must be positive, but {args.num_selected_tests}")
+
+    resources = _load_resources_for_prediction(args)
+    clf = resources['clf']
+    pdf = _read_batch_input(args.input)
+    shas = pdf['sha'].tolist()
+
+    if args.without_spark:
+        import local_features
+        to_features = local_features.create_predict_pipeline(*_to_pipeline_args(resources))
+        predicted = _predict_failed_probs_without_spark(to_features(pdf), clf)
+        selected_tests = _select_tests_without_spark(predicted, shas, args.num_selected_tests)
+    else:
+        # Initializes a Spark session
+        from pyspark.sql import SparkSession
+        import features
+        spark = SparkSession.builder \
+            .enableHiveSupport() \
+            .getOrCreate()
+
+        # Suppresses user warinig messages in Python
+        import warnings
+        warnings.simplefilter("ignore", UserWarning)
+
+        # Suppresses `WARN` messages in JVM
+        spark.sparkContext.setLogLevel("ERROR")
+
+        try:
+            schema = 'sha string, author string, commit_date string, filenames array<string>, ' \
+                'num_adds int, num_dels int, num_chgs int'
+            df = spark.createDataFrame(pdf, schema=schema)
+
+            # Builds the features of all the commits in one pass so that the broadcast indexes
+            # are shared across them, and then scores them with a single `predict_proba` call
+            to_features = features.create_predict_pipeline(spark, *_to_pipeline_args(resources))
+            predicted = _predict_failed_probs(to_features(df), clf)
+            selected_test_df = predicted \
+                .selectExpr('sha', f'slice(tests, 1, {args.num_selected_tests}) selected_tests') \
+                .selectExpr('sha', 'selected_tests.test selected_tests')
+
+            selected_test_map = {r.sha: r.selected_tests for r in selected_test_df.collect()}
+            selected_tests = {sha: selected_test_map.get(sha, []) for sha in shas}
+        finally:
+            spark.stop()
+
+    output = '\n'.join([json.dumps({'sha': sha, 'tests': tests}) for sha, tests in selected_tests.items()])
+    if args.output:
+        Path(args.output).write_text(output + '\n')
+    else:
+        print(output)
+
+
+def _create_prediction_request_handler(resources: Dict[str, Any], default_num_selected_tests: int) -> Any:
+    import pandas as pd  # type: ignore[import]
+    from datetime import datetime, timezone
+    from http.server import BaseHTTPRequestHandler
+    import local_features
+
+    clf = resources['clf']
+    to_features = local_features.create_predict_pipeline(*_to_pipeline_args(resources))
+
+    # Request bodies are JSON objects of commits in the same format as the batch input (See `_to_commit_row`),
+    # e.g., `{"author": "...", "files": ["...", ...], "adds": 1, "dels": 1}`; `sha`, `commit_date`
+    # (`%Y/%m/%d %H:%M:%S` in UTC), and `num_selected_tests` are optional. Responses are JSON objects
+    # like `{"tests": ["...", ...]}` in the order of failure probabilities.
+    def _select_tests(request: Dict[str, Any]) -> List[str]:
+        commit_date = datetime.now(timezone.utc).strftime('%Y/%m/%d %H:%M:%S')
+        pdf = pd.DataFrame([_to_commit_row({'sha': '0', 'commit_date': commit_date, **request})])
+        predicted = _predict_failed_probs_without_spark(to_features(pdf), clf)
+        num_selected_tests = int(request.get('num_selected_tests', default_num_selected_tests))
+        return predicted['test'].head(num_selected_tests).tolist()
+
+    class _RequestHandler(BaseHTTPRequestHandler):
+
+        def address_string(self) -> str:
+            # `client_address` is empty for Unix domain sockets
+            return str(self.client_address[0]) if self.client_address else 'unix'
+
+        def _send_json(self, code: int, body: Any) -> None:
+            content = json.dumps(body).encode('utf-8')
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self) -> None:
+            if self.path == '/health':
+                self._send_json(200, {'status': 'ok'})
+            else:
+                self._send_json(404, {'error': f'Unknown path: {self.path}'})
+
+        def do_POST(self) -> None:
+            if self.path != '/predict':
+                self._send_json(404, {'error': f'Unknown path: {self.path}'})
+                return
+
+            try:
+                content_length = int(self.headers.get('Content-Length', 0))
+                request = json.loads(self.rfile.read(content_length))
+                self._send_json(200, {'tests': _select_tests(request)})
+            except (ValueError, KeyError, TypeError) as e:
+                self._send_json(400, {'error': f'Invalid request: {e}'})
+
+    return _RequestHandler
+
+
+def serve_main(argv: Any) -> None:
+    # Parses command-line arguments for a server mode
+    from argparse import ArgumentParser
+    parser = ArgumentParser()
+    _add_arguments_for_prediction(parser)
+    parser.add_argument('--host', type=str, required=False, default='127.0.0.1')
+    parser.add_argument('--port', type=int, required=False, default=8200)
+    parser.add_argument('--unix-socket', type=str, required=False)
+    parser.add_argument('--num-selected-tests', type=int, required=False, default=32)
+    args = parser.parse_args(argv)
+
+    if args.num_selected_tests <= 0:
+        raise ValueError(f"Predicted #tests must be positive, but {args.num_selected_tests}")
+
+    # Loads the model and indexes only once, and then keeps them resident to serve requests
+    handler = _create_prediction_request_handler(
+        _load_resources_for_prediction(args), args.num_selected_tests)
+
+    import socketserver
+    from http.server import ThreadingHTTPServer
+    if args.unix_socket:
+        class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+            daemon_threads = True
+
+        if os.path.exists(args.unix_socket):
+            os.remove(args.unix_socket)
+
+        server: Any = _UnixHTTPServer(args.unix_socket, handler)
+        _logger.info(f"Serving test selection requests on {args.unix_socket}")
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), handler)
+        _logger.info(f"Serving test selection requests on http://{args.host}:{args.port}")
+
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
 def main() -> None:
     # Checks if a training mode enabled or not first
     from argparse import ArgumentParser
     parser = ArgumentParser()
     parser.add_argument('--train', dest='train_mode_enabled', action='store_true')
+    parser.add_argument('--serve', dest='serve_mode_enabled', action='store_true')
+    parser.add_argument('--batch', dest='batch_mode_enabled', action='store_true')
     args, rest_argv = parser.parse_known_args()
 
     if args.train_mode_enabled:
         train_main(rest_argv)
+    elif args.batch_mode_enabled:
+        batch_predict_main(rest_argv)
+    elif args.serve_mode_enabled:
+        serve_main(rest_argv)
     else:
         predict_main(rest_argv)
 
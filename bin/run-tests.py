@@ -33,7 +33,9 @@ from multiprocessing import Manager
 
 
 python_test_goals = [
-    "test_depgraph", "test_javaclass", "test_github_apis", "test_github_utils"
+    "test_depgraph", "test_javaclass", "test_github_apis", "test_github_utils", "test_timeline",
+    "test_fingerprint", "test_train", "test_scoring", "test_import_time", "test_local_features",
+    "test_prediction_server"
 ]
 
 
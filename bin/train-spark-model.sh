@@ -38,7 +38,7 @@ exec python3 -u ${FWDIR}/bin/ptesting-model.py \
   --commits ${MODELPATH}/logs/commits.json \
   --excluded-tests ${MODELPATH}/logs/excluded-tests.json \
   --included-tests ${MODELPATH}/logs/included-tests.json \
-  --build-dep ${MODELPATH}/indexes/latest/dep-graph.json \
+  --build-dep ${MODELPATH}/indexes/latest/dep-graph \
   --correlated-files ${MODELPATH}/indexes/latest/correlated-files.json \
   --updated-file-stats ${MODELPATH}/logs/updated-file-stats.json \
   --contributor-stats ${MODELPATH}/logs/contributor-stats.json \
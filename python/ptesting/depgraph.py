@@ -17,28 +17,370 @@
 # limitations under the License.
 #
 
-from typing import Any, Dict, List, Set, Tuple
+import functools
+import json
+import os
+import numpy as np  # type: ignore[import]
+from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 
-def build_dependency_graphs(files: List[Tuple[str, str]], extract_edges_from_path: Any) -> Dict[str, List[str]]:
+def _extract_edges_from_files(extract_edges_from_path: Any, batched: bool,
+                              files: List[Tuple[str, str]]) -> List[Tuple[str, List[str]]]:
+    if batched:
+        extracted_dst_nodes = extract_edges_from_path([path for _, path in files])
+        return [(node, dst_nodes) for (node, _), dst_nodes in zip(files, extracted_dst_nodes)]
+
+    return [(node, extract_edges_from_path(path)) for node, path in files]
+
+
+def _compute_file_hash(path: str) -> Optional[str]:
+    import hashlib
+    try:
+        with open(path, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def build_dependency_graphs(files: List[Tuple[str, str]], extract_edges_from_path: Any,
+                            num_workers: int = 1, chunk_size: int = 256,
+                            batched: bool = False,
+                            cache: Optional[Dict[str, List[str]]] = None) -> Dict[str, List[str]]:
+    # If `batched` is True, `extract_edges_from_path` takes a chunk of paths at once and
+    # returns a list of extracted edges for each path.
+    #
+    # If `cache` is given, it is used as a map from the content hash of a file to the edges extracted
+    # from the file; only the files whose hashes are not found in `cache` are scanned. `cache` is updated
+    # in-place so that it holds the edges of the given files only.
     adj_list: Dict[str, Set[str]] = {}
 
-    import tqdm
-    n_files = len(files)
-    for i in tqdm.tqdm(range(n_files)):
-        node, path = files[i]
-        extracted_dst_nodes = extract_edges_from_path(path)
+    def _update_adj_list(node: str, extracted_dst_nodes: List[str]) -> None:
         for dst_node in extracted_dst_nodes:
             if dst_node != node:
                 if dst_node not in adj_list:
                     adj_list[dst_node] = set()
                 adj_list[dst_node].add(node)
 
+    file_hashes: List[Optional[str]] = []
+    if cache is not None:
+        file_hashes = [_compute_file_hash(path) for _, path in files]
+        # Files that cannot be hashed (e.g., unreadable ones) are always scanned
+        scanned = [h is None or h not in cache for h in file_hashes]
+    else:
+        file_hashes = [None] * len(files)
+        scanned = [True] * len(files)
+
+    files_to_scan = [f for f, s in zip(files, scanned) if s]
+
+    # Splits `files_to_scan` into chunks to amortize the dispatch cost of a process pool
+    chunks = [files_to_scan[i:i + chunk_size] for i in range(0, len(files_to_scan), chunk_size)]
+    extract_edges_from_chunk = functools.partial(_extract_edges_from_files, extract_edges_from_path, batched)
+    scanned_edges: List[Tuple[str, List[str]]] = []
+
+    import tqdm
+    with tqdm.tqdm(total=len(files_to_scan)) as progress_bar:
+        def _append_edges(edges: List[Tuple[str, List[str]]]) -> None:
+            scanned_edges.extend(edges)
+            progress_bar.update(len(edges))
+
+        if num_workers > 1:
+            # NOTE: `extract_edges_from_path` must be picklable to be sent to worker processes
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                # `map` yields results in the order of `chunks`, so the output graph
+                # does not depend on `num_workers`.
+                for edges in executor.map(extract_edges_from_chunk, chunks):
+                    _append_edges(edges)
+        else:
+            for chunk in chunks:
+                _append_edges(extract_edges_from_chunk(chunk))
+
+    # Merges the scanned edges and the cached ones in the order of `files`
+    scanned_edge_iter = iter(scanned_edges)
+    file_edges: Dict[str, List[str]] = {}
+    for (node, _), file_hash, s in zip(files, file_hashes, scanned):
+        extracted_dst_nodes = next(scanned_edge_iter)[1] if s else cache[file_hash]  # type: ignore
+        if file_hash is not None:
+            file_edges[file_hash] = extracted_dst_nodes
+
+        _update_adj_list(node, extracted_dst_nodes)
+
+    if cache is not None:
+        # Drops the entries of the files that no longer exist
+        cache.clear()
+        cache.update(file_edges)
+
     return {k: list(v) for k, v in adj_list.items()}
 
 
-def select_subgraph(targets: List[str], edges: Dict[str, List[str]],
+def _gather_row_indices(offsets: Any, row_ids: Any) -> Any:
+    # Concatenates the index ranges of the CSR rows `row_ids` without a Python-level loop
+    starts = offsets[row_ids]
+    lengths = offsets[row_ids + 1] - starts
+    total_length = int(lengths.sum())
+    if total_length == 0:
+        return np.empty(0, dtype=np.int64)
+
+    ends = np.cumsum(lengths)
+    return np.arange(total_length) - np.repeat(ends - lengths, lengths) + np.repeat(starts, lengths)
+
+
+class TestDistanceIndex:
+    # Precomputed shortest distances from each node to the test nodes reachable within `cutoff` hops;
+    # the distance from `nodes[i]` to `nodes[tests[k]]` is `distances[k]` for each `k` in
+    # `range(offsets[i], offsets[i + 1])`, and `tests` is sorted in each row. `test_nodes` holds
+    # the sorted ids of the indexed test nodes.
+
+    def __init__(self, test_nodes: Any, offsets: Any, tests: Any, distances: Any, cutoff: int) -> None:
+        self.test_nodes = test_nodes
+        self.offsets = offsets
+        self.tests = tests
+        self.distances = distances
+        self.cutoff = cutoff
+
+    def __reduce__(self) -> Any:
+        return TestDistanceIndex, (np.asarray(self.test_nodes), np.asarray(self.offsets),
+                                   np.asarray(self.tests), np.asarray(self.distances), self.cutoff)
+
+    def is_test(self, node_id: int) -> bool:
+        pos = np.searchsorted(self.test_nodes, node_id)
+        return bool(pos < len(self.test_nodes) and self.test_nodes[pos] == node_id)
+
+    def distance(self, node_id: int, test_id: int) -> Optional[int]:
+        start, end = self.offsets[node_id], self.offsets[node_id + 1]
+        pos = start + np.searchsorted(self.tests[start:end], test_id)
+        if pos < end and self.tests[pos] == test_id:
+            return int(self.distances[pos])
+
+        return None
+
+    def gather_distances(self, node_ids: Any) -> Tuple[Any, Any]:
+        # Returns the minimum distance to each test reachable from any of `node_ids`
+        indices = _gather_row_indices(self.offsets, node_ids)
+        tests, distances = self.tests[indices], self.distances[indices]
+        order = np.lexsort((distances, tests))
+        tests, first_pos = np.unique(tests[order], return_index=True)
+        return tests, distances[order][first_pos]
+
+
+class CompactGraph:
+    # An integer-indexed graph whose adjacency lists are stored in the CSR (Compressed Sparse Row) format;
+    # the i-th node `nodes[i]` has edges to `nodes[j]` for each `j` in `targets[offsets[i]:offsets[i + 1]]`.
+    # `offsets` and `targets` are NumPy arrays and they can be memory-mapped from files.
+
+    def __init__(self, nodes: List[str], offsets: Any, targets: Any,
+                 test_distances: Optional[TestDistanceIndex] = None) -> None:
+        self.nodes = nodes
+        self.offsets = offsets
+        self.targets = targets
+        self.test_distances = test_distances
+        self._node_ids: Optional[Dict[str, int]] = None
+
+    def __reduce__(self) -> Any:
+        # Pickles the arrays as plain ones even if they are memory-mapped, and drops the lazily-built index
+        return CompactGraph, (self.nodes, np.asarray(self.offsets), np.asarray(self.targets), self.test_distances)
+
+    def __len__(self) -> int:
+        return len(self.nodes)
+
+    def node_id(self, node: str) -> Optional[int]:
+        if self._node_ids is None:
+            self._node_ids = {n: i for i, n in enumerate(self.nodes)}
+        return self._node_ids.get(node)
+
+    def neighbors(self, node_id: int) -> Any:
+        return self.targets[self.offsets[node_id]:self.offsets[node_id + 1]]
+
+    def gather_neighbors(self, node_ids: Any) -> Any:
+        return self.targets[_gather_row_indices(self.offsets, node_ids)]
+
+
+def to_compact_graph(edges: Dict[str, List[str]]) -> CompactGraph:
+    nodes = sorted(set(edges.keys()).union(*edges.values()))
+    node_ids = {n: i for i, n in enumerate(nodes)}
+    offsets = np.zeros(len(nodes) + 1, dtype=np.int64)
+    for key, dst_nodes in edges.items():
+        offsets[node_ids[key] + 1] = len(dst_nodes)
+    np.cumsum(offsets, out=offsets)
+
+    targets = np.empty(offsets[-1], dtype=np.int32)
+    for key, dst_nodes in edges.items():
+        start = offsets[node_ids[key]]
+        targets[start:start + len(dst_nodes)] = sorted(node_ids[n] for n in dst_nodes)
+
+    return CompactGraph(nodes, offsets, targets)
+
+
+def transpose(graph: CompactGraph) -> CompactGraph:
+    num_nodes = len(graph)
+    sources = np.repeat(np.arange(num_nodes, dtype=np.int32), np.diff(graph.offsets))
+    order = np.argsort(graph.targets, kind='stable')
+    offsets = np.zeros(num_nodes + 1, dtype=np.int64)
+    np.cumsum(np.bincount(graph.targets, minlength=num_nodes), out=offsets[1:])
+    return CompactGraph(graph.nodes, offsets, sources[order])
+
+
+def build_test_distance_index(graph: CompactGraph, is_test: Any, cutoff: int = 16) -> CompactGraph:
+    # Runs a BFS from each test node on the transposed graph, so that every node reachable
+    # to the test within `cutoff` hops gets its distance in a single traversal.
+    reversed_graph = transpose(graph)
+    test_nodes = np.array([i for i, n in enumerate(graph.nodes) if is_test(n)], dtype=np.int32)
+    node_chunks, test_chunks, distance_chunks = [], [], []
+    for test_id in test_nodes:
+        visited_ids, distances = _traverse(reversed_graph, np.array([test_id], dtype=np.int64), cutoff)
+        node_chunks.append(visited_ids)
+        test_chunks.append(np.full(len(visited_ids), test_id, dtype=np.int32))
+        distance_chunks.append(distances)
+
+    def _concat(chunks: List[Any], dtype: Any) -> Any:
+        return np.concatenate(chunks).astype(dtype) if chunks else np.empty(0, dtype=dtype)
+
+    nodes = _concat(node_chunks, np.int32)
+    tests = _concat(test_chunks, np.int32)
+    distances = _concat(distance_chunks, np.uint8)
+    order = np.lexsort((tests, nodes))
+    offsets = np.zeros(len(graph) + 1, dtype=np.int64)
+    np.cumsum(np.bincount(nodes, minlength=len(graph)), out=offsets[1:])
+    index = TestDistanceIndex(test_nodes, offsets, tests[order], distances[order], cutoff)
+    return CompactGraph(graph.nodes, graph.offsets, graph.targets, index)
+
+
+def to_adjacency_list(graph: CompactGraph) -> Dict[str, List[str]]:
+    adj_list: Dict[str, List[str]] = {}
+    for i, node in enumerate(graph.nodes):
+        dst_nodes = graph.neighbors(i)
+        if len(dst_nodes) > 0:
+            adj_list[node] = [graph.nodes[j] for j in dst_nodes]
+
+    return adj_list
+
+
+def save_compact_graph(graph: CompactGraph, path: str) -> None:
+    os.makedirs(path, exist_ok=True)
+    with open(f'{path}/nodes.json', mode='w') as f:
+        f.write(json.dumps(graph.nodes))
+    np.save(f'{path}/offsets.npy', np.asarray(graph.offsets))
+    np.save(f'{path}/targets.npy', np.asarray(graph.targets))
+    index = graph.test_distances
+    if index is not None:
+        with open(f'{path}/test-distances.json', mode='w') as f:
+            f.write(json.dumps({'cutoff': index.cutoff}))
+        np.save(f'{path}/test-distances-nodes.npy', np.asarray(index.test_nodes))
+        np.save(f'{path}/test-distances-offsets.npy', np.asarray(index.offsets))
+        np.save(f'{path}/test-distances-tests.npy', np.asarray(index.tests))
+        np.save(f'{path}/test-distances-values.npy', np.asarray(index.distances))
+
+
+def load_compact_graph(path: str, mmap: bool = True) -> CompactGraph:
+    mmap_mode: Any = 'r' if mmap else None
+    with open(f'{path}/nodes.json') as f:
+        nodes = json.loads(f.read())
+    offsets = np.load(f'{path}/offsets.npy', mmap_mode=mmap_mode)
+    targets = np.load(f'{path}/targets.npy', mmap_mode=mmap_mode)
+    index = None
+    if os.path.exists(f'{path}/test-distances.json'):
+        with open(f'{path}/test-distances.json') as f:
+            cutoff = json.loads(f.read())['cutoff']
+        index = TestDistanceIndex(np.load(f'{path}/test-distances-nodes.npy', mmap_mode=mmap_mode),
+                                  np.load(f'{path}/test-distances-offsets.npy', mmap_mode=mmap_mode),
+                                  np.load(f'{path}/test-distances-tests.npy', mmap_mode=mmap_mode),
+                                  np.load(f'{path}/test-distances-values.npy', mmap_mode=mmap_mode),
+                                  cutoff)
+
+    return CompactGraph(nodes, offsets, targets, index)
+
+
+def load_dependency_graph(path: str) -> CompactGraph:
+    # Loads a graph from either a directory written by `save_compact_graph` or a JSON file of adjacency lists
+    if os.path.isdir(path):
+        return load_compact_graph(path)
+
+    with open(path) as f:
+        return to_compact_graph(json.loads(f.read()))
+
+
+def _traverse(graph: CompactGraph, source_ids: Any, depth: int) -> Tuple[Any, Any]:
+    frontier = np.unique(source_ids)
+    distances = np.full(len(graph), -1, dtype=np.int32)
+    distances[frontier] = 0
+    for d in range(1, depth + 1):
+        if len(frontier) == 0:
+            break
+
+        next_nodes = np.unique(graph.gather_neighbors(frontier))
+        frontier = next_nodes[distances[next_nodes] < 0]
+        distances[frontier] = d
+
+    visited_ids = np.nonzero(distances >= 0)[0]
+    return visited_ids, distances[visited_ids]
+
+
+def traverse(graph: CompactGraph, sources: List[str], depth: int) -> Tuple[Any, Any]:
+    # Runs BFS from `sources` up to `depth` hops and returns the ids of the visited nodes
+    # and their shortest distances from `sources`.
+    source_ids = [graph.node_id(s) for s in sources]
+    return _traverse(graph, np.array([i for i in source_ids if i is not None], dtype=np.int64), depth)
+
+
+def shortest_distance(graph: CompactGraph, sources: List[str], target: str, depth: int) -> Optional[int]:
+    target_id = graph.node_id(target)
+    if target_id is None:
+        return None
+
+    index = graph.test_distances
+    if index is not None and depth <= index.cutoff and index.is_test(target_id):
+        source_ids = [graph.node_id(s) for s in sources]
+        found = [index.distance(i, target_id) for i in source_ids if i is not None]
+        distances_within_depth = [d for d in found if d is not None and d <= depth]
+        return min(distances_within_depth) if distances_within_depth else None
+
+    visited_ids, distances = traverse(graph, sources, depth)
+    pos = np.searchsorted(visited_ids, target_id)
+    if pos < len(visited_ids) and visited_ids[pos] == target_id:
+        return int(distances[pos])
+
+    return None
+
+
+def compute_test_distances(graph: CompactGraph, sources: List[str], depth: int, is_test: Any) -> Dict[str, int]:
+    # Runs a single multi-source BFS from `sources` and returns the shortest distances to all the test nodes
+    # reachable within `depth` hops. Test nodes in `sources` have zero distances even if they are not in `graph`.
+    node_ids = [graph.node_id(s) for s in sources]
+    source_ids = np.array([i for i in node_ids if i is not None], dtype=np.int64)
+    index = graph.test_distances
+    if index is not None and depth <= index.cutoff:
+        test_ids, distances = index.gather_distances(source_ids)
+        within_depth = distances <= depth
+        test_ids, distances = test_ids[within_depth], distances[within_depth]
+    else:
+        visited_ids, distances = _traverse(graph, source_ids, depth)
+        is_test_node = np.array([is_test(graph.nodes[i]) for i in visited_ids], dtype=bool)
+        test_ids, distances = visited_ids[is_test_node], distances[is_test_node]
+
+    test_distances = {graph.nodes[i]: int(d) for i, d in zip(test_ids, distances)}
+    test_distances.update({s: 0 for s in sources if is_test(s)})
+    return test_distances
+
+
+def _select_compact_subgraph(targets: List[str], graph: CompactGraph,
+                             depth: int) -> Tuple[Dict[str, List[str]], List[str]]:
+    visited_ids, distances = traverse(graph, targets, depth)
+    subgraph = {}
+    for i in visited_ids[distances < depth]:
+        dst_nodes = graph.neighbors(i)
+        if len(dst_nodes) > 0:
+            subgraph[graph.nodes[i]] = [graph.nodes[j] for j in dst_nodes]
+
+    visited_nodes = set(graph.nodes[i] for i in visited_ids)
+    visited_nodes.update(targets)
+    return subgraph, list(visited_nodes)
+
+
+def select_subgraph(targets: List[str], edges: Union[Dict[str, List[str]], CompactGraph],
                     depth: int) -> Tuple[Dict[str, List[str]], List[str]]:
+    if isinstance(edges, CompactGraph):
+        return _select_compact_subgraph(targets, edges, depth)
+
     subgraph = {}
     visited_nodes = set()
     keys = targets
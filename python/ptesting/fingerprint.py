@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import hashlib
+import json
+import os
+from typing import Any, Dict, Optional
+
+_CHUNK_SIZE = 1 << 20
+
+
+def _update_with_file(h: Any, path: str) -> None:
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(_CHUNK_SIZE), b''):
+            h.update(chunk)
+
+
+def _hash_path(path: str) -> str:
+    # Directories (e.g., a compact dependency graph) are hashed by the relative names and contents
+    # of all the files under them in a sorted order
+    h = hashlib.sha256()
+    if os.path.isdir(path):
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(files):
+                file_path = os.path.join(root, name)
+                h.update(os.path.relpath(file_path, path).encode('utf-8') + b'\0')
+                h.update(_hash_path(file_path).encode('utf-8'))
+    else:
+        _update_with_file(h, path)
+    return h.hexdigest()
+
+
+def compute_fingerprint(paths: Dict[str, Optional[str]], params: Dict[str, Any]) -> str:
+    # Returns a content-addressed key of input artifacts and parameters; the key depends only on
+    # the names/contents of `paths` (not on their locations or timestamps) and the JSON-serialized `params`.
+    digests = {}
+    for name, path in paths.items():
+        if path is not None and not os.path.exists(path):
+            raise ValueError(f"Input artifact '{name}' not found in {os.path.abspath(path)}")
+        digests[name] = _hash_path(path) if path is not None else None
+
+    content = json.dumps({'paths': digests, 'params': params}, sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
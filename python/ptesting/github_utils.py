@@ -19,13 +19,10 @@
 
 import os
 import retrying
-import tqdm
 from datetime import datetime, timedelta, timezone
 import shutil
 from typing import Any, Dict, List, Optional, Set, Tuple
 
-from ptesting import github_apis
-
 
 # The GitHub time format (UTC)
 # See: https://docs.github.com/en/rest/overview/resources-in-the-rest-api#timezones
@@ -47,6 +44,7 @@ def to_github_datetime(d: datetime) -> str:
 
 def count_file_updates(path: str, base_date: str, days: List[int], owner: str, repo: str,
                        token: str, logger: Any = None) -> List[int]:
+    from ptesting import github_apis
     update_counts: List[int] = []
     base = from_github_datetime(base_date)
     for day in days:
@@ -103,6 +101,7 @@ def _create_name_filter(targets: Optional[List[str]]) -> Any:
 
 
 def _retry_if_except(caught: Exception) -> bool:
+    from ptesting import github_apis
     if isinstance(caught, RuntimeError) and github_apis.is_rate_limit_exceeded(str(caught)):
         # If rate limit happens, do not retry
         return False
@@ -123,6 +122,8 @@ def get_test_results_from(owner: str, repo: str, token: str,
                           tqdm_leave: bool,
                           logger: Any) -> Dict[str, Tuple[str, str, List[Dict[str, str]], List[str]]]:
     assert os.path.exists(resume_path), "resume path '{resume_path}' does not exists"
+    import tqdm
+    from ptesting import github_apis
 
     test_results: Dict[str, Tuple[str, str, List[Dict[str, str]], List[str]]] = {}
 
@@ -242,6 +243,8 @@ def generate_commit_logs(owner: str, repo: str, token: str,
                          sleep_if_limit_exceeded: bool,
                          commit_day_intervals: List[int],
                          logger: Any) -> List[Dict[str, Any]]:
+    from ptesting import github_apis
+
     # Per-user buffer to write github logs
     per_user_logs: List[Dict[str, Any]] = []
 
@@ -289,6 +292,7 @@ def generate_commit_logs(owner: str, repo: str, token: str,
 
 def get_rate_limit(github_token: str) -> Tuple[int, int, int, int]:
     import time
+    from ptesting import github_apis
     rate_limit = github_apis.get_rate_limit(github_token)
     c = rate_limit['resources']['core']
     renewal = c['reset'] - int(time.time())
@@ -23,7 +23,8 @@ Helper functions to analyze java class files
 
 import glob
 import re
-from typing import Any, List, Optional, Tuple
+import struct
+from typing import Any, Dict, List, Optional, Set, Tuple
 
 
 def list_classes(root_path: str, target_package: str) -> List[Tuple[str, str]]:
@@ -59,18 +60,253 @@ def _get_cmd_path(cmd: str) -> Any:
     return cmd
 
 
-def create_func_to_extract_refs_from_class_file(target_package: str) -> Any:
+def _extract_refs_from_opcodes(re_extract_refs: Any, opcodes: List[str]) -> List[str]:
+    invoke_opcodes = list(filter(lambda op: re.search('invoke', op), opcodes))
+    refs: List[str] = []
+    for invoke_opcode in invoke_opcodes:
+        for ref in re_extract_refs.findall(invoke_opcode):
+            refs.append(ref.replace('/', '.'))
+
+    return refs
+
+
+def _extract_refs(re_extract_refs: Any, path: str) -> List[str]:
+    stdout, _, _ = _exec_subprocess(f"{_get_cmd_path('javap')} -c -p {path}", raise_error=False)
+    opcodes = stdout.decode().split('\n')
+    return _extract_refs_from_opcodes(re_extract_refs, opcodes)
+
+
+def _split_javap_output(output: str) -> List[List[str]]:
+    # `javap` writes the disassembled classes one after another and each of them ends with
+    # a non-indented closing brace, e.g.,
+    #
+    #   Compiled from "BaseClass.scala"
+    #   public class io.github.maropu.BaseClass {
+    #     public int func(int, int);
+    #       Code:
+    #   ...
+    #   }
+    classes: List[List[str]] = []
+    lines: List[str] = []
+    for line in output.split('\n'):
+        lines.append(line)
+        if line.rstrip() == '}':
+            classes.append(lines)
+            lines = []
+
+    return classes
+
+
+def _extract_refs_in_batch(re_extract_refs: Any, paths: List[str]) -> List[List[str]]:
+    if not paths:
+        return []
+
+    import shlex
+    cmd = f"{_get_cmd_path('javap')} -c -p {' '.join(map(shlex.quote, paths))}"
+    stdout, _, rt = _exec_subprocess(cmd, raise_error=False)
+    classes = _split_javap_output(stdout.decode())
+
+    # If `javap` fails to analyze some of the given files, we cannot map its output into
+    # the files correctly. In that case, falls back to running `javap` for each file.
+    if rt != 0 or len(classes) != len(paths):
+        return [_extract_refs(re_extract_refs, p) for p in paths]
+
+    return [_extract_refs_from_opcodes(re_extract_refs, opcodes) for opcodes in classes]
+
+
+# Constant pool tags defined in "The Java Virtual Machine Specification, Section 4.4"
+_CONSTANT_Utf8 = 1
+_CONSTANT_Long = 5
+_CONSTANT_Double = 6
+_CONSTANT_Class = 7
+_CONSTANT_Methodref = 10
+_CONSTANT_InterfaceMethodref = 11
+_CONSTANT_NameAndType = 12
+_CONSTANT_InvokeDynamic = 18
+
+# Byte sizes of constant pool entries except for `CONSTANT_Utf8` (its size is variable)
+_CONSTANT_POOL_ENTRY_SIZES = {
+    3: 4,  # Integer
+    4: 4,  # Float
+    5: 8,  # Long
+    6: 8,  # Double
+    7: 2,  # Class
+    8: 2,  # String
+    9: 4,  # Fieldref
+    10: 4,  # Methodref
+    11: 4,  # InterfaceMethodref
+    12: 4,  # NameAndType
+    15: 3,  # MethodHandle
+    16: 2,  # MethodType
+    17: 4,  # Dynamic
+    18: 4,  # InvokeDynamic
+    19: 2,  # Module
+    20: 2,  # Package
+}
+
+
+# Opcodes defined in "The Java Virtual Machine Specification, Chapter 6"
+_OPCODE_IINC = 0x84
+_OPCODE_TABLESWITCH = 0xaa
+_OPCODE_LOOKUPSWITCH = 0xab
+_OPCODE_INVOKEVIRTUAL = 0xb6
+_OPCODE_INVOKEDYNAMIC = 0xba
+_OPCODE_WIDE = 0xc4
+
+
+def _create_instruction_sizes() -> List[int]:
+    # Byte sizes of instructions (including opcodes) except for `tableswitch`, `lookupswitch`, and `wide`
+    sizes = [1] * 256
+    opcodes_by_size = [
+        # bipush, ldc, *load, *store, ret, and newarray
+        ([0x10, 0x12, *range(0x15, 0x1a), *range(0x36, 0x3b), 0xa9, 0xbc], 2),
+        # sipush, ldc_w, ldc2_w, iinc, if*, goto, jsr, get*/put*, invoke(virtual|special|static), new, anewarray,
+        # checkcast, instanceof, ifnull, and ifnonnull
+        ([0x11, 0x13, 0x14, _OPCODE_IINC, *range(0x99, 0xa9), *range(0xb2, 0xb9), 0xbb, 0xbd, 0xc0, 0xc1,
+          0xc6, 0xc7], 3),
+        # multianewarray
+        ([0xc5], 4),
+        # invokeinterface, invokedynamic, goto_w, and jsr_w
+        ([0xb9, _OPCODE_INVOKEDYNAMIC, 0xc8, 0xc9], 5)
+    ]
+    for opcodes, size in opcodes_by_size:
+        for opcode in opcodes:
+            sizes[opcode] = size
+
+    return sizes
+
+
+_INSTRUCTION_SIZES = _create_instruction_sizes()
+
+
+def _read_invoked_constant_indexes(code: bytes) -> Set[int]:
+    # Returns the constant pool indexes that the `invoke*` instructions in `code` refer to
+    indexes: Set[int] = set()
+    pc = 0
+    while pc < len(code):
+        opcode = code[pc]
+        if _OPCODE_INVOKEVIRTUAL <= opcode <= _OPCODE_INVOKEDYNAMIC:
+            indexes.add(struct.unpack_from('>H', code, pc + 1)[0])
+            pc += _INSTRUCTION_SIZES[opcode]
+        elif opcode in (_OPCODE_TABLESWITCH, _OPCODE_LOOKUPSWITCH):
+            # The operands start at a 4-byte aligned offset from the start of the code
+            aligned_pc = (pc + 4) & ~3
+            if opcode == _OPCODE_TABLESWITCH:
+                low, high = struct.unpack_from('>ii', code, aligned_pc + 4)
+                pc = aligned_pc + 12 + (high - low + 1) * 4
+            else:
+                npairs = struct.unpack_from('>i', code, aligned_pc + 4)[0]
+                pc = aligned_pc + 8 + npairs * 8
+        elif opcode == _OPCODE_WIDE:
+            pc += 6 if code[pc + 1] == _OPCODE_IINC else 4
+        else:
+            pc += _INSTRUCTION_SIZES[opcode]
+
+    return indexes
+
+
+def _read_invoked_methods(buf: Any) -> List[str]:
+    if len(buf) < 10 or struct.unpack_from('>I', buf, 0)[0] != 0xCAFEBABE:
+        raise ValueError("Invalid magic number found in a class file")
+
+    cp_count = struct.unpack_from('>H', buf, 8)[0]
+    utf8s: Dict[int, str] = {}
+    entries: Dict[int, Tuple[int, int, int]] = {}
+    index, offset = 1, 10
+    while index < cp_count:
+        tag = buf[offset]
+        if tag == _CONSTANT_Utf8:
+            length = struct.unpack_from('>H', buf, offset + 1)[0]
+            utf8s[index] = bytes(buf[offset + 3:offset + 3 + length]).decode('utf-8', errors='replace')
+            offset += 3 + length
+        elif tag in _CONSTANT_POOL_ENTRY_SIZES:
+            if tag == _CONSTANT_Class:
+                entries[index] = (tag, struct.unpack_from('>H', buf, offset + 1)[0], 0)
+            elif tag in (_CONSTANT_Methodref, _CONSTANT_InterfaceMethodref,
+                         _CONSTANT_NameAndType, _CONSTANT_InvokeDynamic):
+                entries[index] = (tag, *struct.unpack_from('>HH', buf, offset + 1))
+            offset += 1 + _CONSTANT_POOL_ENTRY_SIZES[tag]
+        else:
+            raise ValueError(f"Unknown constant pool tag found: {tag}")
+
+        # Long and double constants take up two entries
+        index += 2 if tag in (_CONSTANT_Long, _CONSTANT_Double) else 1
+
+    # The constant pool also has methods that are not invoked in the class, e.g., the ones only referred to by
+    # `CONSTANT_MethodHandle` for bootstrap methods, so collects the methods that the `invoke*` instructions
+    # in the `Code` attributes refer to as `javap -c` shows.
+    interfaces_count = struct.unpack_from('>H', buf, offset + 6)[0]
+    offset += 8 + interfaces_count * 2
+    invoked_indexes: Set[int] = set()
+    for _ in range(2):  # Fields and methods
+        members_count = struct.unpack_from('>H', buf, offset)[0]
+        offset += 2
+        for _ in range(members_count):
+            attributes_count = struct.unpack_from('>H', buf, offset + 6)[0]
+            offset += 8
+            for _ in range(attributes_count):
+                name_index, length = struct.unpack_from('>HI', buf, offset)
+                if utf8s.get(name_index) == 'Code':
+                    # The `Code` attribute has `max_stack`, `max_locals`, `code_length`, and then `code`
+                    code_length = struct.unpack_from('>I', buf, offset + 10)[0]
+                    code = bytes(buf[offset + 14:offset + 14 + code_length])
+                    invoked_indexes.update(_read_invoked_constant_indexes(code))
+                offset += 6 + length
+
+    def _name_and_type(i: int) -> str:
+        _, name_index, descriptor_index = entries[i]
+        return f'{utf8s[name_index]}:{utf8s[descriptor_index]}'
+
+    # Formats the invoked methods in the same way as `javap` does in comments, e.g.,
+    # 'io/github/maropu/BaseClass.func:(I)V' and '0:apply:()Lscala/Function1;'
+    methods: List[str] = []
+    for index in sorted(invoked_indexes):
+        tag, index1, index2 = entries[index]
+        if tag in (_CONSTANT_Methodref, _CONSTANT_InterfaceMethodref):
+            methods.append(f'{utf8s[entries[index1][1]]}.{_name_and_type(index2)}')
+        elif tag == _CONSTANT_InvokeDynamic:
+            methods.append(f'{index1}:{_name_and_type(index2)}')
+
+    return methods
+
+
+def _extract_refs_from_constant_pool(re_extract_refs: Any, path: str) -> List[str]:
+    import mmap
+    try:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+            methods = _read_invoked_methods(buf)
+    except (OSError, ValueError, KeyError, IndexError, struct.error):
+        # Ignores a file that is not a valid class file like `javap` does
+        return []
+
+    refs: List[str] = []
+    for method in methods:
+        for ref in re_extract_refs.findall(method):
+            refs.append(ref.replace('/', '.'))
+
+    return refs
+
+
+def create_func_to_extract_refs_from_class_file(target_package: str, use_javap: bool = False) -> Any:
     re_extract_refs = re.compile(f"({target_package.replace('.', '/')}/[a-zA-Z0-9/\-]+)")
 
-    def extract_refs(path: str) -> List[str]:
-        stdout, _, _ = _exec_subprocess(f"{_get_cmd_path('javap')} -c -p {path}", raise_error=False)
-        opcodes = stdout.decode().split('\n')
-        invoke_opcodes = list(filter(lambda op: re.search('invoke', op), opcodes))
-        refs: List[str] = []
-        for invoke_opcode in invoke_opcodes:
-            for ref in re_extract_refs.findall(invoke_opcode):
-                refs.append(ref.replace('/', '.'))
+    # Uses `functools.partial` instead of a closure so that the returned function is picklable
+    # and can be shipped to worker processes (See `depgraph.build_dependency_graphs`).
+    import functools
+    if use_javap:
+        return functools.partial(_extract_refs, re_extract_refs)
+
+    # Since methods invoked in a class file must be registered in its constant pool as
+    # `CONSTANT_Methodref`, `CONSTANT_InterfaceMethodref`, or `CONSTANT_InvokeDynamic` and the `invoke*`
+    # instructions refer to them, we can extract the references by reading the class file directly
+    # without JVM launches.
+    return functools.partial(_extract_refs_from_constant_pool, re_extract_refs)
 
-        return refs
 
-    return extract_refs
+def create_func_to_extract_refs_from_class_files(target_package: str) -> Any:
+    re_extract_refs = re.compile(f"({target_package.replace('.', '/')}/[a-zA-Z0-9/\-]+)")
+
+    # The returned function passes all the given class files to a single `javap` process
+    # to amortize the JVM startup cost.
+    import functools
+    return functools.partial(_extract_refs_in_batch, re_extract_refs)
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import math
+import numpy as np  # type: ignore[import]
+from typing import Any, Dict, List
+
+# Missing value types of numerical splits in LightGBM (See `MissingType` in LightGBM)
+_MISSING_TYPES = {'None': 0, 'Zero': 1, 'NaN': 2}
+_MISSING_TYPE_ZERO = _MISSING_TYPES['Zero']
+_MISSING_TYPE_NAN = _MISSING_TYPES['NaN']
+
+# Values whose absolute values are less than or equal to this are treated as zero in LightGBM
+_ZERO_THRESHOLD = 1e-35
+
+
+class TreeEnsembleModel:
+    # A binary LightGBM classifier flattened into NumPy arrays, which scores rows without lightgbm, sklearn, and pandas.
+    # The nodes of all the trees are stored in the arrays below and leaf nodes have themselves as their children,
+    # so that rows reaching leaves stay there until all the rows reach leaves.
+    # It has the same `classes_` and `predict_proba` as `LGBMClassifier` so that it can be used in its place.
+
+    def __init__(self, arrays: Dict[str, Any]) -> None:
+        self.split_feature = np.asarray(arrays['split_feature'], dtype=np.int32)
+        self.threshold = np.asarray(arrays['threshold'], dtype=np.float64)
+        self.default_left = np.asarray(arrays['default_left'], dtype=bool)
+        self.missing_type = np.asarray(arrays['missing_type'], dtype=np.int8)
+        self.left_child = np.asarray(arrays['left_child'], dtype=np.int32)
+        self.right_child = np.asarray(arrays['right_child'], dtype=np.int32)
+        self.leaf_value = np.asarray(arrays['leaf_value'], dtype=np.float64)
+        self.tree_roots = np.asarray(arrays['tree_roots'], dtype=np.int32)
+        self.max_depth = int(arrays['max_depth'])
+        self.sigmoid = float(arrays['sigmoid'])
+        self.feature_names = [str(f) for f in arrays['feature_names']]
+        self.classes_ = np.asarray(arrays['classes'])
+        self._has_missing_splits = bool(np.any(self.missing_type != _MISSING_TYPES['None']))
+
+    def _to_arrays(self) -> Dict[str, Any]:
+        return {
+            'split_feature': self.split_feature,
+            'threshold': self.threshold,
+            'default_left': self.default_left,
+            'missing_type': self.missing_type,
+            'left_child': self.left_child,
+            'right_child': self.right_child,
+            'leaf_value': self.leaf_value,
+            'tree_roots': self.tree_roots,
+            'max_depth': np.int32(self.max_depth),
+            'sigmoid': np.float64(self.sigmoid),
+            'feature_names': np.array(self.feature_names, dtype=str),
+            'classes': self.classes_
+        }
+
+    def save(self, path: str) -> None:
+        with open(path, 'wb') as f:
+            np.savez(f, **self._to_arrays())
+
+    def predict_raw(self, X: Any) -> Any:
+        # Walks all the trees for all the rows at once; each iteration moves every row one level down in every tree
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != len(self.feature_names):
+            raise ValueError(f'Expected a matrix with {len(self.feature_names)} features, but got shape {X.shape}')
+
+        num_rows, num_trees = len(X), len(self.tree_roots)
+        flat_X = np.ascontiguousarray(X).ravel()
+        row_offsets = np.repeat(np.arange(num_rows, dtype=np.int64) * X.shape[1], num_trees)
+        nodes = np.tile(self.tree_roots, num_rows)
+        handles_missing = self._has_missing_splits or bool(np.isnan(flat_X).any())
+        for _ in range(self.max_depth):
+            values = flat_X[row_offsets + self.split_feature[nodes]]
+            if handles_missing:
+                # Follows `NumericalDecision` in LightGBM
+                missing_type = self.missing_type[nodes]
+                is_nan = np.isnan(values)
+                values = np.where(is_nan & (missing_type != _MISSING_TYPE_NAN), 0.0, values)
+                is_missing = ((missing_type == _MISSING_TYPE_ZERO) & (np.abs(values) <= _ZERO_THRESHOLD)) | \
+                    ((missing_type == _MISSING_TYPE_NAN) & is_nan)
+                go_left = np.where(is_missing, self.default_left[nodes], values <= self.threshold[nodes])
+            else:
+                go_left = values <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left_child[nodes], self.right_child[nodes])
+
+        # Accumulates the outputs in the tree order as LightGBM does (`sum` is pairwise) to get the exact same scores
+        return np.cumsum(self.leaf_value[nodes].reshape(num_rows, num_trees), axis=1)[:, -1]
+
+    def predict_proba(self, X: Any) -> Any:
+        # Uses `exp` in libm as LightGBM does because SIMD `np.exp` can differ in the last bit,
+        # which changes the order of tests having the same failed probabilities.
+        exps = np.frompyfunc(math.exp, 1, 1)(-self.sigmoid * self.predict_raw(X)).astype(np.float64)
+        probs = 1.0 / (1.0 + exps)
+        return np.stack([1.0 - probs, probs], axis=1)
+
+
+def _parse_sigmoid(objective: str) -> float:
+    # An objective string is like 'binary sigmoid:1'
+    name, *params = objective.split(' ')
+    if name != 'binary':
+        raise ValueError(f'Unsupported objective: {objective}')
+    return float(dict(p.split(':', 1) for p in params).get('sigmoid', '1.0'))
+
+
+def from_lgb_dump(dumped_model: Dict[str, Any], classes: List[Any]) -> TreeEnsembleModel:
+    # Flattens a model dumped by `Booster.dump_model` into arrays
+    if dumped_model['num_tree_per_iteration'] != 1 or dumped_model.get('average_output', False):
+        raise ValueError('Only binary GBDT models are supported')
+
+    sigmoid = _parse_sigmoid(dumped_model['objective'])
+    columns: Dict[str, List[Any]] = {k: [] for k in [
+        'split_feature', 'threshold', 'default_left', 'missing_type', 'left_child', 'right_child', 'leaf_value']}
+
+    def _add_node(node: Dict[str, Any]) -> int:
+        node_id = len(columns['split_feature'])
+        for k in columns.keys():
+            columns[k].append(0)
+        if 'leaf_value' in node:
+            columns['leaf_value'][node_id] = node['leaf_value']
+            columns['left_child'][node_id] = node_id
+            columns['right_child'][node_id] = node_id
+            return node_id
+
+        if node['decision_type'] != '<=':
+            raise ValueError(f"Unsupported decision type: {node['decision_type']}")
+        columns['split_feature'][node_id] = node['split_feature']
+        columns['threshold'][node_id] = node['threshold']
+        columns['default_left'][node_id] = node['default_left']
+        columns['missing_type'][node_id] = _MISSING_TYPES[node['missing_type']]
+        columns['left_child'][node_id] = _add_node(node['left_child'])
+        columns['right_child'][node_id] = _add_node(node['right_child'])
+        return node_id
+
+    def _depth(node: Dict[str, Any]) -> int:
+        return 0 if 'leaf_value' in node else 1 + max(_depth(node['left_child']), _depth(node['right_child']))
+
+    trees = [t['tree_structure'] for t in dumped_model['tree_info']]
+    tree_roots = [_add_node(t) for t in trees]
+    arrays: Dict[str, Any] = {k: np.array(v) for k, v in columns.items()}
+    arrays.update({
+        'tree_roots': np.array(tree_roots, dtype=np.int32),
+        'max_depth': max([_depth(t) for t in trees], default=0),
+        'sigmoid': sigmoid,
+        'feature_names': dumped_model['feature_names'],
+        'classes': np.asarray(classes)
+    })
+    return TreeEnsembleModel(arrays)
+
+
+def load_model(path: str) -> TreeEnsembleModel:
+    with np.load(path, allow_pickle=False) as arrays:
+        return TreeEnsembleModel(dict(arrays))
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import numpy as np  # type: ignore[import]
+import pandas as pd  # type: ignore[import]
+from datetime import datetime
+from typing import Any, List, Optional, Tuple
+
+
+def to_epoch_seconds(dates: Any, fmt: str) -> Any:
+    # Parses date strings in UTC into an int64 array of epoch seconds at once
+    timestamps = pd.to_datetime(pd.Series(dates, dtype=str), format=fmt, utc=True)
+    return ((timestamps - pd.Timestamp(0, tz='UTC')) // pd.Timedelta(seconds=1)).to_numpy(dtype=np.int64)
+
+
+class CommitTimeline:
+    # A sorted array of commit dates in epoch seconds that answers commit-based window queries
+    # by using binary searches instead of scanning a commit list.
+
+    def __init__(self, commit_epochs: Any) -> None:
+        self.commit_epochs = np.sort(np.asarray(commit_epochs, dtype=np.int64))
+
+    def __len__(self) -> int:
+        return len(self.commit_epochs)
+
+    def position(self, base_epochs: Any) -> Any:
+        # Returns the number of commits made at or before each of `base_epochs`
+        return np.searchsorted(self.commit_epochs, base_epochs, side='right')
+
+    def windows(self, base_epochs: Any, num_commits: List[int]) -> Tuple[Any, Any, Any]:
+        # Returns the lower/upper bounds of the time windows covering the last commit at or before each base date
+        # and the `num_commits` commits before it. The windows are invalid if no commit exists before the base date.
+        base_epochs = np.asarray(base_epochs, dtype=np.int64)
+        num_prev_commits = self.position(base_epochs)
+        valid_windows = np.repeat((num_prev_commits > 0)[:, None], len(num_commits), axis=1)
+        if len(self.commit_epochs) == 0:
+            bounds = np.zeros((len(base_epochs), len(num_commits)), dtype=np.int64)
+            return bounds, bounds, valid_windows
+
+        last_commit_pos = np.maximum(num_prev_commits - 1, 0)
+        first_commit_pos = np.maximum(last_commit_pos[:, None] - np.array(num_commits, dtype=np.int64)[None, :], 0)
+        lower_bounds = self.commit_epochs[first_commit_pos]
+        upper_bounds = np.repeat(self.commit_epochs[last_commit_pos][:, None], len(num_commits), axis=1)
+        return lower_bounds, upper_bounds, valid_windows
+
+
+def build_commit_timeline(commits: List[datetime]) -> CommitTimeline:
+    return CommitTimeline([int(c.timestamp()) for c in commits])
+
+
+def find_divergent_epoch(old_events: Tuple[Any, Any], new_events: Tuple[Any, Any]) -> Optional[int]:
+    # Compares two histories of `(keys, epochs)` events (e.g., file updates and test failures), and returns
+    # the earliest epoch at which they differ, or None if they are the same. Features computed from windows
+    # ending before the returned epoch are not affected by the difference.
+    def _to_event_counts(events: Tuple[Any, Any]) -> pd.Series:
+        keys, epochs = events
+        df = pd.DataFrame({'key': np.asarray(keys, dtype=str), 'epoch': np.asarray(epochs, dtype=np.int64)})
+        return df.groupby(['key', 'epoch']).size()
+
+    diffs = _to_event_counts(new_events).sub(_to_event_counts(old_events), fill_value=0)
+    divergent_epochs = diffs[diffs != 0].index.get_level_values('epoch')
+    return int(divergent_epochs.min()) if len(divergent_epochs) > 0 else None
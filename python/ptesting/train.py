@@ -17,10 +17,14 @@
 # limitations under the License.
 #
 
+from __future__ import annotations
+
 import time
-import numpy as np  # type: ignore[import]
-import pandas as pd  # type: ignore[import]
-from typing import Any, Dict, List, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple, TYPE_CHECKING
+
+# NumPy/pandas are imported in the functions using them so that importing this module is cheap
+if TYPE_CHECKING:
+    import pandas as pd  # type: ignore[import]
 
 
 def _setup_logger() -> Any:
@@ -34,9 +38,235 @@ def _setup_logger() -> Any:
 _logger = _setup_logger()
 
 
-def _build_lgb_model(X: pd.DataFrame, y: pd.Series, n_jobs: int = -1, opts: Dict[str, str] = {}) -> Tuple[Any, float]:
+def _cast_int_params(params: Dict[str, Any]) -> Dict[str, Any]:
+    # Some params must be int
+    params = dict(params)
+    for k in ["num_leaves", "subsample_freq", "min_child_samples", "n_estimators"]:
+        if k in params:
+            params[k] = int(params[k])
+    return params
+
+
+def _create_lgb_model(fixed_params: Dict[str, Any], params: Dict[str, Any]) -> Any:
     import lightgbm as lgb  # type: ignore[import]
+    import copy
+    p = copy.deepcopy(fixed_params)
+    p.update(_cast_int_params(params))
+    return lgb.LGBMClassifier(**p)
+
 
+def _create_lgb_dataset(X: pd.DataFrame, y: pd.Series, fixed_params: Dict[str, Any]) -> Any:
+    # Bins the features only once here; CV folds are built as subsets of the constructed dataset,
+    # so all the folds of all the trials share the same bin mappers.
+    import lightgbm as lgb  # type: ignore[import]
+    import numpy as np  # type: ignore[import]
+    weight = None
+    if fixed_params["class_weight"] == "balanced":
+        labels, counts = np.unique(y, return_counts=True)
+        weight = (len(y) / (len(labels) * counts))[np.searchsorted(labels, y)]
+
+    # `feature_pre_filter` is disabled because it depends on `min_child_samples` that varies between trials
+    params = {"max_bin": fixed_params["max_bin"], "feature_pre_filter": False, "verbose": -1}
+    return lgb.Dataset(X, label=y, weight=weight, params=params, free_raw_data=False).construct()
+
+
+def _to_booster_params(fixed_params: Dict[str, Any], params: Dict[str, Any]) -> Dict[str, Any]:
+    # Converts `LGBMClassifier` params into the ones for the native `lgb.cv` API (most of the names are aliases)
+    p = {k: v for k, v in fixed_params.items() if k not in ["class_weight", "importance_type", "n_estimators"]}
+    p.update(_cast_int_params(params))
+    p.update({"metric": "None", "feature_pre_filter": False, "verbose": -1})
+    return p
+
+
+def _f1_macro(preds: Any, data: Any) -> Tuple[str, float, bool]:
+    import numpy as np  # type: ignore[import]
+    y_true = data.get_label() > 0.5
+    y_pred = preds >= 0.5
+
+    def _f1(t: Any, p: Any) -> float:
+        tp, fp, fn = np.sum(t & p), np.sum(~t & p), np.sum(t & ~p)
+        return 2.0 * tp / (2 * tp + fp + fn) if tp + fp + fn > 0 else 0.0
+
+    return "f1_macro", (_f1(y_true, y_pred) + _f1(~y_true, ~y_pred)) / 2.0, True
+
+
+class _PruningCallback:
+    # Prunes an unpromising trial in a successive-halving manner: when the trial reaches one of `rung_rounds`
+    # boosting rounds, it is stopped unless its CV score is in the top `1/eta` of the scores that
+    # the previous trials got at the same round.
+    order = 40
+
+    def __init__(self, rung_rounds: List[int], prev_rung_scores: Dict[int, List[float]], eta: int) -> None:
+        self.rung_rounds = set(rung_rounds)
+        self.prev_rung_scores = prev_rung_scores
+        self.eta = eta
+        self.rung_scores: Dict[int, float] = {}
+        self.pruned = False
+
+    def __call__(self, env: Any) -> None:
+        import lightgbm as lgb  # type: ignore[import]
+        num_rounds = env.iteration + 1
+        if num_rounds not in self.rung_rounds:
+            return
+
+        score = next(r[2] for r in env.evaluation_result_list if r[1] == "f1_macro")
+        self.rung_scores[num_rounds] = score
+        prev_scores = sorted(self.prev_rung_scores.get(num_rounds, []), reverse=True)
+        if len(prev_scores) >= self.eta and score < prev_scores[len(prev_scores) // self.eta - 1]:
+            self.pruned = True
+            raise lgb.callback.EarlyStopException(env.iteration, env.evaluation_result_list)
+
+
+def _get_rung_rounds(min_rounds: int, max_rounds: int, eta: int) -> List[int]:
+    # Boosting rounds at which trials are checked for pruning, e.g., [25, 75, 225] for (25, 300, 3)
+    if eta <= 1 or min_rounds <= 0:
+        return []
+    rounds = []
+    r = min_rounds
+    while r < max_rounds:
+        rounds.append(r)
+        r *= eta
+    return rounds
+
+
+def _collect_rung_scores(trials: Any) -> Dict[int, List[float]]:
+    rung_scores: Dict[int, List[float]] = {}
+    for t in trials.trials:
+        for r, score in t['result'].get('rung_scores', {}).items():
+            rung_scores.setdefault(r, []).append(score)
+    return rung_scores
+
+
+def _cross_validate_lgb_model(dataset: Any, fixed_params: Dict[str, Any], params: Dict[str, Any],
+                              n_splits: int, early_stopping_rounds: int, rung_rounds: List[int],
+                              prev_rung_scores: Dict[int, List[float]], eta: int) -> Dict[str, Any]:
+    import lightgbm as lgb  # type: ignore[import]
+    pruning_callback = _PruningCallback(rung_rounds, prev_rung_scores, eta)
+    try:
+        cv_results: Dict[str, Any] = lgb.cv(
+            _to_booster_params(fixed_params, params), dataset, num_boost_round=fixed_params["n_estimators"],
+            nfold=n_splits, stratified=True, shuffle=True, seed=42, feval=_f1_macro,
+            callbacks=[lgb.early_stopping(early_stopping_rounds, verbose=False), pruning_callback])
+        # A key name differs between LightGBM versions (e.g., 'f1_macro-mean' and 'valid f1_macro-mean')
+        scores = next(v for k, v in cv_results.items() if k.endswith("f1_macro-mean"))
+        return {"loss": -scores[-1], "num_boost_round": len(scores),
+                "rung_scores": pruning_callback.rung_scores, "pruned": pruning_callback.pruned}
+
+    # it might throw an exception because `y` contains
+    # previously unseen labels.
+    except Exception as e:
+        _logger.warning(f"{e.__class__}: {e}")
+        return {"loss": 0.0, "num_boost_round": fixed_params["n_estimators"]}
+
+
+# Training data and parameters shared by the trials evaluated in a worker process
+_worker_context: Dict[str, Any] = {}
+
+
+def _init_trial_worker(X: pd.DataFrame, y: pd.Series, fixed_params: Dict[str, Any], cv_opts: Dict[str, Any]) -> None:
+    _worker_context.update(dataset=_create_lgb_dataset(X, y, fixed_params), fixed_params=fixed_params, cv_opts=cv_opts)
+
+
+def _evaluate_trial_in_worker(params: Dict[str, Any], prev_rung_scores: Dict[int, List[float]]) -> Dict[str, Any]:
+    c = _worker_context
+    return _cross_validate_lgb_model(c['dataset'], c['fixed_params'], params,
+                                     prev_rung_scores=prev_rung_scores, **c['cv_opts'])
+
+
+def _create_trial_docs(trials: Any, domain: Any, points: List[Dict[str, Any]]) -> List[Any]:
+    # Creates trial documents for the given points as `tpe.suggest` does for its suggested ones
+    tids = trials.new_trial_ids(len(points))
+    miscs = [{'tid': tid, 'cmd': domain.cmd, 'workdir': domain.workdir,
+              'idxs': {k: [tid] for k in p.keys()}, 'vals': {k: [v] for k, v in p.items()}}
+             for tid, p in zip(tids, points)]
+    return trials.new_trial_docs(tids, [None] * len(points), [domain.new_result()] * len(points), miscs)
+
+
+def _run_trials(objective: Any, param_space: Dict[str, Any], trials: Any, max_evals: int, early_stop_fn: Any,
+                seed: int, parallelism: int, executor: Any, initial_points: List[Dict[str, Any]] = []) -> None:
+    # Runs a TPE search in an ask-and-tell manner: it suggests `parallelism` candidates at once,
+    # evaluates them concurrently in `executor` (or in this process if `executor` is None), and then
+    # tells the results to `trials` before suggesting the next candidates. `initial_points` are
+    # evaluated before any candidate is suggested, and `early_stop_fn` is checked only after that;
+    # otherwise, a search would stop before suggesting any candidate because `initial_points`
+    # are evaluated in ascending order of their previous losses and the later ones rarely make progress.
+    from hyperopt import space_eval, tpe, Domain, STATUS_OK, JOB_STATE_DONE  # type: ignore[import]
+    from hyperopt.base import spec_from_misc  # type: ignore[import]
+    from hyperopt.utils import coarse_utcnow  # type: ignore[import]
+    import numpy as np  # type: ignore[import]
+
+    domain = Domain(objective, param_space)
+    rstate = np.random.RandomState(seed)
+    early_stop_args: List[Any] = []
+    initial_points = initial_points[:max_evals]
+    while len(trials.trials) < max_evals:
+        n_trials = min(parallelism, max_evals - len(trials.trials))
+        is_warm_start = len(initial_points) > 0
+        if is_warm_start:
+            new_trials = _create_trial_docs(trials, domain, initial_points[:n_trials])
+            initial_points = initial_points[n_trials:]
+        else:
+            new_trials = tpe.suggest(trials.new_trial_ids(n_trials), domain, trials, rstate.randint(2 ** 31 - 1))
+        new_params = [space_eval(param_space, spec_from_misc(t['misc'])) for t in new_trials]
+        rung_scores = _collect_rung_scores(trials)
+        if executor is not None:
+            results = list(executor.map(objective, new_params, [rung_scores] * len(new_params)))
+        else:
+            results = [objective(p, rung_scores) for p in new_params]
+
+        for t, result in zip(new_trials, results):
+            t['state'] = JOB_STATE_DONE
+            t['result'] = dict(result, status=STATUS_OK)
+            t['refresh_time'] = coarse_utcnow()
+
+        trials.insert_trial_docs(new_trials)
+        trials.refresh()
+
+        if not is_warm_start:
+            stop, early_stop_args = early_stop_fn(trials, *early_stop_args)
+            if stop:
+                break
+
+
+def _to_trial_history(trials: Any) -> List[Dict[str, Any]]:
+    # Extracts the evaluated points and their losses from `trials` in ascending order of the losses
+    history = [{'params': {k: v[0] for k, v in t['misc']['vals'].items()}, 'loss': t['result']['loss']}
+               for t in trials.trials if t['result'].get('status') == 'ok']
+    return sorted(history, key=lambda h: h['loss'])
+
+
+def _select_warm_start_points(prev_trials: List[Dict[str, Any]], param_space: Dict[str, Any],
+                              num_points: int) -> List[Dict[str, Any]]:
+    # Selects the best points of a previous search whose params still match `param_space`
+    valid_points = [h['params'] for h in sorted(prev_trials, key=lambda h: h['loss'])
+                    if set(h['params'].keys()) == set(param_space.keys())]
+    return valid_points[:num_points]
+
+
+def _merge_trial_histories(prev_trials: List[Dict[str, Any]],
+                           trials: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    # Appends the new trials to the previous ones; if the same point is evaluated again (e.g., as a warm-start
+    # point), its new loss replaces the previous one because the new loss is evaluated on the latest data.
+    import json
+    to_key = lambda h: json.dumps(h['params'], sort_keys=True)
+    new_keys = set(map(to_key, trials))
+    history = [h for h in prev_trials if to_key(h) not in new_keys] + trials
+    return sorted(history, key=lambda h: h['loss'])
+
+
+def _split_cpus(parallelism: int, n_jobs: int) -> Tuple[int, int]:
+    # If trials are evaluated in parallel, CPUs are split between the trials and each trial
+    # trains LightGBM models with the rest of CPUs so as not to oversubscribe them.
+    import os
+    num_cpus = os.cpu_count() or 1
+    trial_parallelism = max(1, min(parallelism, num_cpus))
+    if trial_parallelism > 1:
+        n_jobs = max(1, num_cpus // trial_parallelism)
+    return trial_parallelism, n_jobs
+
+
+def _build_lgb_model(X: pd.DataFrame, y: pd.Series, n_jobs: int = -1, opts: Dict[str, str] = {},
+                     prev_trials: List[Dict[str, Any]] = []) -> Tuple[Any, float, List[Dict[str, Any]]]:
     # TODO: Validate given parameter values
     def _get_option(key: str, default_value: Optional[str]) -> Any:
         return opts[str(key)] if str(key) in opts else default_value
@@ -71,6 +301,15 @@ def _build_lgb_model(X: pd.DataFrame, y: pd.Series, n_jobs: int = -1, opts: Dict
     def _n_splits() -> int:
         return int(_get_option("cv.n_splits", "3"))
 
+    def _early_stopping_rounds() -> int:
+        return int(_get_option("cv.early_stopping_rounds", "30"))
+
+    def _pruning_eta() -> int:
+        return int(_get_option("hp.pruning_eta", "3"))
+
+    def _pruning_min_rounds() -> int:
+        return int(_get_option("hp.pruning_min_rounds", "25"))
+
     def _timeout() -> Optional[int]:
         opt_value = _get_option("hp.timeout", None)
         return int(opt_value) if opt_value is not None else None
@@ -81,6 +320,14 @@ def _build_lgb_model(X: pd.DataFrame, y: pd.Series, n_jobs: int = -1, opts: Dict
     def _no_progress_loss() -> int:
         return int(_get_option("hp.no_progress_loss", "1000"))
 
+    def _parallelism() -> int:
+        return int(_get_option("hp.parallelism", "1"))
+
+    def _warm_start_trials() -> int:
+        return int(_get_option("hp.warm_start_trials", "10"))
+
+    trial_parallelism, n_jobs = _split_cpus(_parallelism(), n_jobs)
+
     fixed_params = {
         "boosting_type": _boosting_type(),
         "objective": "binary",
@@ -96,20 +343,8 @@ def _build_lgb_model(X: pd.DataFrame, y: pd.Series, n_jobs: int = -1, opts: Dict
         "n_jobs": n_jobs
     }
 
-    def _create_model(params: Dict[str, Any]) -> Any:
-        # Some params must be int
-        for k in ["num_leaves", "subsample_freq", "min_child_samples"]:
-            if k in params:
-                params[k] = int(params[k])
-        import copy
-        p = copy.deepcopy(fixed_params)
-        p.update(params)
-        return lgb.LGBMClassifier(**p)
-
-    from hyperopt import hp, tpe, Trials  # type: ignore[import]
+    from hyperopt import hp, space_eval, Trials  # type: ignore[import]
     from hyperopt.early_stop import no_progress_loss  # type: ignore[import]
-    from hyperopt.fmin import fmin  # type: ignore[import]
-    from sklearn.model_selection import cross_val_score, StratifiedKFold  # type: ignore[import]
 
     # Forcibly disable INFO-level logging in the `hyperopt` module
     from logging import getLogger, WARN
@@ -125,24 +360,16 @@ def _build_lgb_model(X: pd.DataFrame, y: pd.Series, n_jobs: int = -1, opts: Dict
         "reg_lambda": hp.loguniform("reg_lambda", -2, 3)
     }
 
-    def _objective(params: Dict[str, Any]) -> float:
-        model = _create_model(params)
-        fit_params: Dict[str, str] = {
-            # TODO: Raises an error if a single regressor is used
-            # "categorical_feature": "auto",
-        }
-        try:
-            # TODO: Replace with `lgb.cv` to remove the `sklearn` dependency
-            cv = StratifiedKFold(n_splits=_n_splits(), shuffle=True)
-            scores = cross_val_score(
-                model, X, y, scoring="f1_macro", cv=cv, fit_params=fit_params, n_jobs=n_jobs)
-            return -scores.mean()
-
-        # it might throw an exception because `y` contains
-        # previously unseen labels.
-        except Exception as e:
-            _logger.warning(f"{e.__class__}: {e}")
-            return 0.0
+    # Trials are pruned by comparing their CV scores at these boosting rounds (pruning is disabled if `eta` <= 1)
+    cv_opts: Dict[str, Any] = {
+        "n_splits": _n_splits(),
+        "early_stopping_rounds": _early_stopping_rounds(),
+        "rung_rounds": _get_rung_rounds(_pruning_min_rounds(), _n_estimators(), _pruning_eta()),
+        "eta": _pruning_eta()
+    }
+
+    def _objective(params: Dict[str, Any], prev_rung_scores: Dict[int, List[float]]) -> Dict[str, Any]:
+        return _cross_validate_lgb_model(dataset, fixed_params, params, prev_rung_scores=prev_rung_scores, **cv_opts)
 
     def _early_stop_fn() -> Any:
         no_progress_loss_fn = no_progress_loss(_no_progress_loss())
@@ -159,23 +386,36 @@ def _build_lgb_model(X: pd.DataFrame, y: pd.Series, n_jobs: int = -1, opts: Dict
 
         return _timeout_fn
 
+    # The best points of a previous search are re-evaluated first on the given data, so that
+    # the search starts around them and pruning/early stopping compare trials with a good incumbent.
+    warm_start_points = _select_warm_start_points(prev_trials, param_space, _warm_start_trials())
+
+    # TPE suggests random points until it has enough trials, so the seed varies with the number of the previous
+    # trials; otherwise, every warm-started search would suggest the same points as the previous search did.
+    seed = 42 + len(prev_trials)
+
     trials = Trials()
-    best_params = fmin(
-        fn=_objective,
-        space=param_space,
-        algo=tpe.suggest,
-        trials=trials,
-        max_evals=_max_eval(),
-        early_stop_fn=_early_stop_fn(),
-        rstate=np.random.RandomState(42),
-        show_progressbar=False,
-        verbose=False)
-
-    _logger.debug("hyperopt: #eval={}/{}".format(len(trials.trials), _max_eval()))
-
-    # Builds a model with `best_params`
+    if trial_parallelism > 1:
+        from concurrent.futures import ProcessPoolExecutor
+        with ProcessPoolExecutor(max_workers=trial_parallelism, initializer=_init_trial_worker,
+                                 initargs=(X, y, fixed_params, cv_opts)) as executor:
+            _run_trials(_evaluate_trial_in_worker, param_space, trials, _max_eval(), _early_stop_fn(),
+                        seed=seed, parallelism=trial_parallelism, executor=executor,
+                        initial_points=warm_start_points)
+    else:
+        dataset = _create_lgb_dataset(X, y, fixed_params)
+        _run_trials(_objective, param_space, trials, _max_eval(), _early_stop_fn(),
+                    seed=seed, parallelism=1, executor=None, initial_points=warm_start_points)
+
+    _logger.debug("hyperopt: #eval={}/{} (parallelism={}, n_jobs={}, #warm_start={}, #pruned={})".format(
+        len(trials.trials), _max_eval(), trial_parallelism, n_jobs, len(warm_start_points),
+        sum(1 for t in trials.trials if t['result'].get('pruned', False))))
+
+    # Builds a model with the best params and the number of boosting rounds chosen by early stopping
     # TODO: Could we extract constraint rules (e.g., FD and CFD) from built statistical models?
-    model = _create_model(best_params)
+    best_params = space_eval(param_space, trials.argmin)
+    best_params["n_estimators"] = trials.best_trial['result']['num_boost_round']
+    model = _create_lgb_model(fixed_params, best_params)
     model.fit(X, y)
 
     def _feature_importances() -> List[Any]:
@@ -186,11 +426,26 @@ def _build_lgb_model(X: pd.DataFrame, y: pd.Series, n_jobs: int = -1, opts: Dict
 
     sorted_lst = sorted(trials.trials, key=lambda x: x['result']['loss'])
     min_loss = sorted_lst[0]['result']['loss']
-    return model, -min_loss
+    return model, -min_loss, _to_trial_history(trials)
+
+
+def build_model(X: pd.DataFrame, y: pd.Series, opts: Dict[str, str] = {}, trials_path: Optional[str] = None) -> Any:
+    # If `trials_path` is given, a search is warm-started from the trials stored in the file (if it exists)
+    # and the trials of the search are merged into them for the next run.
+    import json
+    import os
+    prev_trials = []
+    if trials_path is not None and os.path.exists(trials_path):
+        with open(trials_path, 'r') as f:
+            prev_trials = json.load(f)
+
+    model, score, trials = _build_lgb_model(X, y, opts=opts, prev_trials=prev_trials)
 
+    if trials_path is not None:
+        with open(trials_path, 'w') as f:
+            f.write(json.dumps(_merge_trial_histories(prev_trials, trials), indent=2))
 
-def build_model(X: pd.DataFrame, y: pd.Series, opts: Dict[str, str] = {}) -> Any:
-    return _build_lgb_model(X, y, opts=opts)
+    return model, score
 
 
 def rebalance_training_data(X: pd.DataFrame, y: pd.Series, coeff: float = 1.0) -> Tuple[pd.DataFrame, pd.Series]:
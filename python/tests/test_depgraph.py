@@ -15,13 +15,21 @@
 # limitations under the License.
 #
 
+import functools
+import json
 import os
+import pickle
+import tempfile
 import unittest
 
 from ptesting import depgraph
 from ptesting import javaclass
 
 
+def map_paths_to_edges(edges, paths):
+    return [edges[p] for p in paths]
+
+
 class DepGraphTests(unittest.TestCase):
 
     @classmethod
@@ -47,6 +55,61 @@ class DepGraphTests(unittest.TestCase):
             ('io.github.maropu.TestClassC', ['io.github.maropu.MainClass']),
         ])
 
+    def test_build_call_graphs_in_parallel(self):
+        edges = {
+            'A.class': ['B', 'C'],
+            'B.class': ['A', 'B'],
+            'C.class': ['A', 'D'],
+            'D.class': []
+        }
+        files = [('A', 'A.class'), ('B', 'B.class'), ('C', 'C.class'), ('D', 'D.class')]
+        expected_rev_adj_list = [('A', ['B', 'C']), ('B', ['A']), ('C', ['A']), ('D', ['C'])]
+        for num_workers, chunk_size in [(1, 1), (1, 3), (2, 1), (2, 3), (4, 256)]:
+            rev_adj_list = depgraph.build_dependency_graphs(
+                files, edges.__getitem__, num_workers=num_workers, chunk_size=chunk_size)
+            _rev_adj_list = sorted(map(lambda kv: (kv[0], sorted(kv[1])), rev_adj_list.items()))
+            self.assertEqual(_rev_adj_list, expected_rev_adj_list)
+
+    def test_build_call_graphs_in_batch(self):
+        edges = {'A.class': ['B', 'C'], 'B.class': ['A'], 'C.class': ['A']}
+        extract_edges_from_paths = functools.partial(map_paths_to_edges, edges)
+        files = [('A', 'A.class'), ('B', 'B.class'), ('C', 'C.class')]
+        for num_workers in [1, 2]:
+            rev_adj_list = depgraph.build_dependency_graphs(
+                files, extract_edges_from_paths, num_workers=num_workers, chunk_size=2, batched=True)
+            _rev_adj_list = sorted(map(lambda kv: (kv[0], sorted(kv[1])), rev_adj_list.items()))
+            self.assertEqual(_rev_adj_list, [('A', ['B', 'C']), ('B', ['A']), ('C', ['A'])])
+
+    def test_build_call_graphs_incrementally(self):
+        classes = javaclass.list_classes(self._java_class_test_path, 'io.github.maropu')
+        extract_edges_from_path = javaclass.create_func_to_extract_refs_from_class_file('io.github.maropu')
+        expected_rev_adj_list = depgraph.build_dependency_graphs(classes, extract_edges_from_path)
+        to_sorted_list = lambda g: sorted(map(lambda kv: (kv[0], sorted(kv[1])), g.items()))
+
+        cache = {}
+        rev_adj_list = depgraph.build_dependency_graphs(classes, extract_edges_from_path, cache=cache)
+        self.assertEqual(to_sorted_list(rev_adj_list), to_sorted_list(expected_rev_adj_list))
+        self.assertEqual(len(cache), len(set(map(lambda c: c[1], classes))))
+
+        def _fail_to_extract_edges(path):
+            raise AssertionError(f'{path} should not be scanned')
+
+        # No class file is scanned if all the class files are cached
+        rev_adj_list = depgraph.build_dependency_graphs(classes, _fail_to_extract_edges, cache=cache)
+        self.assertEqual(to_sorted_list(rev_adj_list), to_sorted_list(expected_rev_adj_list))
+
+        # Checks if the cached entries of removed class files are dropped
+        remaining_classes = list(filter(lambda c: not c[1].endswith('TestClassSuite.class'), classes))
+        rev_adj_list = depgraph.build_dependency_graphs(remaining_classes, _fail_to_extract_edges, cache=cache)
+        self.assertEqual(to_sorted_list(rev_adj_list), [
+            ('io.github.maropu.BaseClass', ['io.github.maropu.TestClassA', 'io.github.maropu.TestClassB']),
+            ('io.github.maropu.MainClass', ['io.github.maropu.MainClassSuite']),
+            ('io.github.maropu.TestClassA', ['io.github.maropu.MainClass', 'io.github.maropu.TestClassC']),
+            ('io.github.maropu.TestClassB', ['io.github.maropu.TestClassC']),
+            ('io.github.maropu.TestClassC', ['io.github.maropu.MainClass']),
+        ])
+        self.assertEqual(len(cache), len(classes) - 1)
+
     def test_select_subgraph(self):
         g = {'A': ['B'], 'B': ['A', 'C'], 'C': ['D'], 'D': ['E'], 'E': ['A']}
         subgraph, subnodes = depgraph.select_subgraph(['A'], g, depth=2)
@@ -54,6 +117,82 @@ class DepGraphTests(unittest.TestCase):
                          [('A', ['B']), ('B', ['A', 'C'])])
         self.assertEqual(sorted(subnodes), ['A', 'B', 'C'])
 
+    def test_select_compact_subgraph(self):
+        g = {'A': ['B'], 'B': ['A', 'C'], 'C': ['D'], 'D': ['E'], 'E': ['A']}
+        compact_g = depgraph.to_compact_graph(g)
+        for targets, depth in [(['A'], 0), (['A'], 2), (['C', 'X'], 2), (['B'], 8), ([], 1)]:
+            subgraph, subnodes = depgraph.select_subgraph(targets, g, depth=depth)
+            compact_subgraph, compact_subnodes = depgraph.select_subgraph(targets, compact_g, depth=depth)
+            self.assertEqual(sorted(map(lambda kv: (kv[0], sorted(kv[1])), compact_subgraph.items())),
+                             sorted(map(lambda kv: (kv[0], sorted(kv[1])), subgraph.items())))
+            self.assertEqual(sorted(compact_subnodes), sorted(subnodes))
+
+    def test_compact_graph(self):
+        g = {'A': ['B', 'C'], 'B': ['C'], 'D': ['A']}
+        compact_g = depgraph.to_compact_graph(g)
+        self.assertEqual(compact_g.nodes, ['A', 'B', 'C', 'D'])
+        self.assertEqual(compact_g.offsets.tolist(), [0, 2, 3, 3, 4])
+        self.assertEqual(compact_g.targets.tolist(), [1, 2, 2, 0])
+        self.assertEqual(compact_g.node_id('C'), 2)
+        self.assertIsNone(compact_g.node_id('X'))
+        self.assertEqual(depgraph.to_adjacency_list(compact_g), g)
+
+        visited_ids, distances = depgraph.traverse(compact_g, ['D', 'X'], depth=16)
+        self.assertEqual(list(zip(visited_ids.tolist(), distances.tolist())), [(0, 1), (1, 2), (2, 2), (3, 0)])
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            depgraph.save_compact_graph(compact_g, f'{tmpdir}/dep-graph')
+            loaded_g = depgraph.load_dependency_graph(f'{tmpdir}/dep-graph')
+            self.assertEqual(depgraph.to_adjacency_list(loaded_g), g)
+            self.assertEqual(depgraph.to_adjacency_list(pickle.loads(pickle.dumps(loaded_g))), g)
+
+            with open(f'{tmpdir}/dep-graph.json', 'w') as f:
+                f.write(json.dumps(g))
+            self.assertEqual(depgraph.to_adjacency_list(depgraph.load_dependency_graph(f'{tmpdir}/dep-graph.json')), g)
+
+    def test_test_distance_index(self):
+        g = {'A': ['B', 'C'], 'B': ['CSuite'], 'C': ['D'], 'D': ['BSuite', 'CSuite'], 'ASuite': ['A']}
+        compact_g = depgraph.to_compact_graph(g)
+        indexed_g = depgraph.build_test_distance_index(compact_g, lambda n: n.endswith('Suite'), cutoff=3)
+        self.assertEqual(depgraph.transpose(depgraph.transpose(compact_g)).targets.tolist(),
+                         compact_g.targets.tolist())
+
+        for src in compact_g.nodes:
+            for dst in ['ASuite', 'BSuite', 'CSuite', 'D', 'X']:
+                for depth in [1, 2, 3, 4]:
+                    expected = depgraph.shortest_distance(compact_g, [src], dst, depth)
+                    actual = depgraph.shortest_distance(indexed_g, [src], dst, depth)
+                    self.assertEqual(actual, expected, msg=f'{src}->{dst} (depth={depth})')
+
+        self.assertEqual(depgraph.shortest_distance(indexed_g, ['A'], 'CSuite', 3), 2)
+        self.assertEqual(depgraph.shortest_distance(indexed_g, ['A'], 'BSuite', 3), 3)
+        self.assertEqual(depgraph.shortest_distance(indexed_g, ['A', 'D'], 'BSuite', 3), 1)
+        self.assertIsNone(depgraph.shortest_distance(indexed_g, ['B'], 'BSuite', 3))
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            depgraph.save_compact_graph(indexed_g, f'{tmpdir}/dep-graph')
+            loaded_g = depgraph.load_dependency_graph(f'{tmpdir}/dep-graph')
+            self.assertEqual(loaded_g.test_distances.cutoff, 3)
+            self.assertEqual(depgraph.shortest_distance(loaded_g, ['A'], 'BSuite', 3), 3)
+            unpickled_g = pickle.loads(pickle.dumps(loaded_g))
+            self.assertEqual(depgraph.shortest_distance(unpickled_g, ['A'], 'CSuite', 3), 2)
+
+    def test_compute_test_distances(self):
+        g = {'A': ['B', 'C'], 'B': ['CSuite'], 'C': ['D'], 'D': ['BSuite', 'CSuite'], 'E': ['ASuite']}
+        is_test = lambda n: n.endswith('Suite')
+        compact_g = depgraph.to_compact_graph(g)
+        indexed_g = depgraph.build_test_distance_index(compact_g, is_test, cutoff=16)
+        for graph in [compact_g, indexed_g]:
+            self.assertEqual(depgraph.compute_test_distances(graph, ['A'], 16, is_test),
+                             {'BSuite': 3, 'CSuite': 2})
+            self.assertEqual(depgraph.compute_test_distances(graph, ['A', 'D'], 16, is_test),
+                             {'BSuite': 1, 'CSuite': 1})
+            self.assertEqual(depgraph.compute_test_distances(graph, ['A', 'E'], 2, is_test),
+                             {'ASuite': 1, 'CSuite': 2})
+            self.assertEqual(depgraph.compute_test_distances(graph, ['XSuite', 'Y'], 16, is_test),
+                             {'XSuite': 0})
+            self.assertEqual(depgraph.compute_test_distances(graph, [], 16, is_test), {})
+
 
 if __name__ == "__main__":
     try:
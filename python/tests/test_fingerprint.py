@@ -0,0 +1,59 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from ptesting import fingerprint
+
+
+class FingerprintTests(unittest.TestCase):
+
+    def test_compute_fingerprint(self):
+        with tempfile.TemporaryDirectory() as d1, tempfile.TemporaryDirectory() as d2:
+            for d in [d1, d2]:
+                Path(f'{d}/logs.json').write_text('{"sha": "abc"}\n')
+                os.mkdir(f'{d}/dep-graph')
+                Path(f'{d}/dep-graph/nodes.json').write_text('["a", "b"]')
+
+            def _fingerprint(d, params={'version': 1}):
+                return fingerprint.compute_fingerprint(
+                    {'logs': f'{d}/logs.json', 'dep_graph': f'{d}/dep-graph', 'stats': None}, params)
+
+            # The key only depends on contents, not on locations
+            self.assertEqual(_fingerprint(d1), _fingerprint(d2))
+            self.assertNotEqual(_fingerprint(d1), _fingerprint(d1, params={'version': 2}))
+
+            Path(f'{d2}/dep-graph/nodes.json').write_text('["a", "c"]')
+            self.assertNotEqual(_fingerprint(d1), _fingerprint(d2))
+            Path(f'{d2}/dep-graph/nodes.json').write_text('["a", "b"]')
+            Path(f'{d2}/dep-graph/offsets.npy').write_bytes(b'')
+            self.assertNotEqual(_fingerprint(d1), _fingerprint(d2))
+
+            with self.assertRaises(ValueError):
+                fingerprint.compute_fingerprint({'logs': f'{d1}/not-found.json'}, {})
+
+
+if __name__ == "__main__":
+    try:
+        import xmlrunner
+        testRunner = xmlrunner.XMLTestRunner(output="target/test-reports", verbosity=2)
+    except ImportError:
+        testRunner = None
+    unittest.main(testRunner=testRunner, verbosity=2)
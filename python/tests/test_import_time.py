@@ -0,0 +1,90 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import os
+import subprocess
+import sys
+import unittest
+
+_ROOT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../..'))
+
+# Modules that take hundreds of milliseconds to import
+_HEAVY_MODULES = [
+    'pyspark', 'pandas', 'numpy', 'lightgbm', 'sklearn', 'hyperopt', 'imblearn', 'pydantic', 'requests',
+    'features', 'local_features', 'auto_tracking', 'ptesting.github_apis'
+]
+
+
+def _run_with_importtime(args):
+    # Runs a Python process with `-X importtime` and returns its exit code and the cumulative import time
+    # (in microseconds) of each module imported by it
+    env = dict(os.environ, PYTHONPATH=f'{_ROOT_PATH}/python:{_ROOT_PATH}/bin')
+    proc = subprocess.run([sys.executable, '-X', 'importtime', *args], env=env,
+                          stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    import_times = {}
+    for line in proc.stderr.split('\n'):
+        if line.startswith('import time:') and not line.endswith('imported package'):
+            _, cumulative_time, module = line[len('import time:'):].split('|')
+            import_times[module.strip()] = int(cumulative_time)
+    return proc.returncode, import_times
+
+
+class ImportTimeTests(unittest.TestCase):
+
+    def _assert_no_heavy_module_imported(self, import_times):
+        heavy_modules = [m for m in import_times.keys() if m.split('.')[0] in _HEAVY_MODULES or m in _HEAVY_MODULES]
+        self.assertEqual(heavy_modules, [])
+
+    def _assert_import_time_within(self, import_times, base_import_times, max_msec):
+        # Compares only the modules imported in addition to the ones that the interpreter imports at startup
+        total_msec = sum(t for m, t in import_times.items()
+                         if m not in base_import_times and '.' not in m) / 1000.0
+        self.assertLess(total_msec, max_msec, f'Import time {total_msec}ms exceeds {max_msec}ms')
+
+    def test_cli_starts_without_heavy_modules(self):
+        _, base_import_times = _run_with_importtime(['-c', 'pass'])
+        cli_path = f'{_ROOT_PATH}/bin/ptesting-model.py'
+
+        returncode, import_times = _run_with_importtime([cli_path, '--help'])
+        self.assertEqual(returncode, 0)
+        self._assert_no_heavy_module_imported(import_times)
+        self._assert_import_time_within(import_times, base_import_times, max_msec=200)
+
+        # Argument validation errors
+        for argv in [['--train'], ['--batch', '--input', 'not-found.jsonl', '--num-selected-tests', '1']]:
+            returncode, import_times = _run_with_importtime([cli_path, *argv])
+            self.assertNotEqual(returncode, 0)
+            self._assert_no_heavy_module_imported(import_times)
+
+    def test_train_module_import(self):
+        returncode, import_times = _run_with_importtime(['-c', 'from ptesting import train'])
+        self.assertEqual(returncode, 0)
+        self._assert_no_heavy_module_imported(import_times)
+
+    def test_scoring_module_import(self):
+        returncode, import_times = _run_with_importtime(['-c', 'from ptesting import scoring'])
+        self.assertEqual(returncode, 0)
+        self.assertIn('numpy', import_times)
+        self._assert_no_heavy_module_imported({m: t for m, t in import_times.items() if not m.startswith('numpy')})
+
+
+if __name__ == "__main__":
+    try:
+        import xmlrunner
+        testRunner = xmlrunner.XMLTestRunner(output="target/test-reports", verbosity=2)
+    except ImportError:
+        testRunner = None
+    unittest.main(testRunner=testRunner, verbosity=2)
@@ -42,9 +42,10 @@ class JavaClassTests(unittest.TestCase):
         r = stdout.decode().replace('\n', '')
         self.assertEqual(r, '1')
 
-    def test_extract_refs(self):
+    def _test_extract_refs(self, use_javap):
         classes = javaclass.list_classes(self._java_class_test_path, 'io.github.maropu')
-        extract_refs_from_path = javaclass.create_func_to_extract_refs_from_class_file('io.github.maropu')
+        extract_refs_from_path = javaclass.create_func_to_extract_refs_from_class_file(
+            'io.github.maropu', use_javap=use_javap)
 
         results = []
         for (clazz, path) in classes:
@@ -64,6 +65,74 @@ class JavaClassTests(unittest.TestCase):
         ]
         self.assertEqual(sorted(results), expected_results)
 
+    def test_extract_refs(self):
+        self._test_extract_refs(use_javap=False)
+
+    def test_extract_refs_with_javap(self):
+        self._test_extract_refs(use_javap=True)
+
+    def test_extract_refs_in_batch(self):
+        classes = javaclass.list_classes(self._java_class_test_path, 'io.github.maropu')
+        extract_refs = javaclass.create_func_to_extract_refs_from_class_file('io.github.maropu', use_javap=True)
+        extract_refs_in_batch = javaclass.create_func_to_extract_refs_from_class_files('io.github.maropu')
+        paths = [path for _, path in classes]
+        self.assertEqual(list(map(sorted, extract_refs_in_batch(paths))),
+                         [sorted(extract_refs(p)) for p in paths])
+        self.assertEqual(extract_refs_in_batch([]), [])
+
+    def test_split_javap_output(self):
+        output = 'Compiled from "BaseClass.scala"\n' \
+            'public class io.github.maropu.BaseClass {\n' \
+            '  public io.github.maropu.BaseClass();\n' \
+            '    Code:\n' \
+            '       1: invokespecial #9  // Method java/lang/Object."<init>":()V\n' \
+            '}\n' \
+            'public interface io.github.maropu.BaseTrait {\n' \
+            '}\n'
+        classes = javaclass._split_javap_output(output)
+        self.assertEqual(len(classes), 2)
+        self.assertEqual(classes[0][1], 'public class io.github.maropu.BaseClass {')
+        self.assertEqual(classes[1], ['public interface io.github.maropu.BaseTrait {', '}'])
+
+    def test_read_invoked_methods(self):
+        path = f'{self._java_class_test_path}/target/scala-2.12/test-classes/io/github/maropu/MainClassSuite.class'
+        with open(path, 'rb') as f:
+            methods = javaclass._read_invoked_methods(f.read())
+
+        self.assertIn('io/github/maropu/MainClass$.func:(II)I', methods)
+        self.assertIn('0:apply:(Lio/github/maropu/MainClassSuite;)Lscala/Function0;', methods)
+        # Methods only referred to by `CONSTANT_MethodHandle` (e.g., bootstrap methods and lambda bodies)
+        # are not invoked in the class and `javap -c` does not show them in `invoke*` instructions.
+        for method in methods:
+            self.assertNotRegex(method, r'^(java/lang/invoke/LambdaMetafactory|scala/runtime/LambdaDeserialize)\.')
+            self.assertNotRegex(method, r'\.\$anonfun\$')
+
+    def test_read_invoked_constant_indexes(self):
+        code = bytes([
+            0x2a,  # aload_0
+            0xb7, 0x00, 0x01,  # invokespecial #1
+            0x10, 0xb6,  # bipush -74 (the same byte as invokevirtual)
+            0xaa, 0x00,  # tableswitch with a padding byte
+            0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x01, 0x00, 0x00, 0x00, 0x02,
+            0x00, 0x00, 0x00, 0xb8, 0x00, 0x00, 0x00, 0xb9,
+            0xab,  # lookupswitch with 3 padding bytes
+            0x00, 0x00, 0x00,
+            0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x00, 0x01, 0x00, 0x00, 0x00, 0xb6, 0x00, 0x00, 0x00, 0xb7,
+            0xc4, 0x84, 0x00, 0xb8, 0x00, 0xb9,  # wide iinc
+            0xc4, 0x15, 0x00, 0xb6,  # wide iload
+            0xb8, 0x00, 0x02,  # invokestatic #2
+            0xb9, 0x00, 0x03, 0x01, 0x00,  # invokeinterface #3
+            0xba, 0x01, 0x04, 0x00, 0x00,  # invokedynamic #260
+            0xb1  # return
+        ])
+        self.assertEqual(javaclass._read_invoked_constant_indexes(code), {1, 2, 3, 260})
+        self.assertEqual(javaclass._read_invoked_constant_indexes(b''), set())
+
+    def test_extract_refs_from_invalid_files(self):
+        extract_refs_from_path = javaclass.create_func_to_extract_refs_from_class_file('io.github.maropu')
+        self.assertEqual(extract_refs_from_path(f'{self._java_class_test_path}/pom.xml'), [])
+        self.assertEqual(extract_refs_from_path(f'{self._java_class_test_path}/src'), [])
+        self.assertEqual(extract_refs_from_path(f'{self._java_class_test_path}/non-existent.class'), [])
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,146 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import os
+import sys
+import unittest
+from datetime import datetime, timezone
+
+from ptesting import depgraph, timeline
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '../../bin')))
+import local_features  # noqa: E402
+
+
+def _to_datetime(d):
+    return datetime.strptime(d, '%Y/%m/%d %H:%M:%S').replace(tzinfo=timezone.utc)
+
+
+class LocalFeaturesTests(unittest.TestCase):
+
+    # Commits are listed in the newest-first order in `commits.json`
+    _commits = [_to_datetime(f'2021/11/{d:02d} 12:00:00') for d in [20, 15, 10, 5, 1]]
+
+    _test_files = {
+        'org.apache.spark.sql.DataFrameSuite':
+            'sql/core/src/test/scala/org/apache/spark/sql/DataFrameSuite.scala',
+        'org.apache.spark.sql.SQLQuerySuite':
+            'sql/core/src/test/scala/org/apache/spark/sql/SQLQuerySuite.scala',
+        'org.apache.spark.SparkContextSuite':
+            'core/src/test/scala/org/apache/spark/SparkContextSuite.scala'
+    }
+
+    _updated_file_stats = {
+        'sql/core/src/main/scala/org/apache/spark/sql/Dataset.scala': [
+            ('2021-11-19T12:00:00Z', '1', '1', '2'),
+            ('2021-11-01T12:00:00Z', '3', '0', '3'),
+            ('2021-11-10T12:00:00Z', '2', '2', '4')
+        ],
+        'core/src/main/scala/org/apache/spark/SparkContext.scala': [
+            ('2021-11-15T12:00:00Z', '5', '1', '6')
+        ]
+    }
+
+    _failed_tests = {
+        'org.apache.spark.sql.DataFrameSuite': ['2021/11/18 00:00:00', '2021/11/02 00:00:00'],
+        'org.apache.spark.SparkContextSuite': ['2021/10/01 00:00:00']
+    }
+
+    def test_count_file_updates(self):
+        commit_timeline = timeline.build_commit_timeline(self._commits)
+        update_epochs = local_features.to_sorted_update_epochs(self._updated_file_stats)
+        files = list(self._updated_file_stats.keys())
+        self.assertEqual(update_epochs[files[0]].tolist(), sorted(update_epochs[files[0]].tolist()))
+
+        stats = local_features.count_file_updates(
+            update_epochs, commit_timeline,
+            ['2021/11/20 13:00:00', '2021/11/20 13:00:00', '2021/10/01 00:00:00'],
+            [files, [files[0], 'unknown.scala'], files])
+        # The commit-based windows cover the commits between 2021/11/05 and 2021/11/20 for 3 commits
+        # and the ones between 2021/11/01 and 2021/11/20 for 14/56 commits.
+        self.assertEqual(stats.values.tolist(), [
+            [1, 3, 4, 3, 4, 4],
+            [1, 2, 3, 2, 3, 3],
+            [0, 0, 0, 0, 0, 0]
+        ])
+
+    def test_count_test_failures(self):
+        commit_timeline = timeline.build_commit_timeline(self._commits)
+        failure_index = local_features.to_failure_epoch_index(self._failed_tests)
+        stats = local_features.count_test_failures(
+            failure_index, commit_timeline,
+            ['2021/11/20 13:00:00', '2021/11/20 13:00:00', '2021/11/20 13:00:00'],
+            ['org.apache.spark.sql.DataFrameSuite', 'org.apache.spark.SparkContextSuite', 'UnknownSuite'])
+        self.assertEqual(stats.columns.tolist(), ['n7d', 'n14d', 'n28d', 'n7c', 'n14c', 'n28c', 'total'])
+        self.assertEqual(stats.values.tolist(), [
+            [1, 1, 2, 2, 2, 2, 2],
+            [0, 0, 0, 0, 0, 0, 1],
+            [0, 0, 0, 0, 0, 0, 0]
+        ])
+
+    def test_create_predict_pipeline(self):
+        import pandas as pd
+        dep_graph = depgraph.to_compact_graph({
+            'org.apache.spark.sql.Dataset': ['org.apache.spark.sql.DataFrameSuite', 'org.apache.spark.sql.Column'],
+            'org.apache.spark.sql.Column': ['org.apache.spark.sql.SQLQuerySuite']
+        })
+        corr_map = {
+            'core/src/main/scala/org/apache/spark/SparkContext.scala': [
+                'org.apache.spark.SparkContextSuite', 'org.apache.spark.UnknownSuite']
+        }
+        to_features = local_features.create_predict_pipeline(
+            self._test_files, self._commits, dep_graph, corr_map,
+            included_tests=['org.apache.spark.sql.SQLQuerySuite'],
+            updated_file_stats=self._updated_file_stats,
+            contributor_stats=[('maropu', '12')],
+            failed_tests=self._failed_tests)
+
+        pdf = pd.DataFrame({
+            'sha': ['0002', '0001'],
+            'author': ['maropu', 'unknown'],
+            'commit_date': ['2021/11/20 13:00:00', '2021/11/20 13:00:00'],
+            'filenames': [
+                ['sql/core/src/main/scala/org/apache/spark/sql/Dataset.scala'],
+                ['core/src/main/scala/org/apache/spark/SparkContext.scala']
+            ],
+            'num_adds': [1, 5],
+            'num_dels': [1, 1],
+            'num_chgs': [2, 6]
+        })
+        features = to_features(pdf)
+        self.assertEqual(features.columns.tolist(), ['sha', 'test', *local_features.FEATURES])
+        self.assertEqual(features[['sha', 'test']].values.tolist(), [
+            ['0002', 'org.apache.spark.sql.DataFrameSuite'],
+            ['0002', 'org.apache.spark.sql.SQLQuerySuite'],
+            ['0001', 'org.apache.spark.SparkContextSuite'],
+            ['0001', 'org.apache.spark.sql.SQLQuerySuite']
+        ])
+        self.assertEqual(features['num_commits'].tolist(), [12, 12, 0, 0])
+        self.assertEqual(features['updated_num_56d'].tolist(), [3, 3, 1, 1])
+        self.assertEqual(features['file_card'].tolist(), [1, 1, 1, 1])
+        self.assertEqual(features['failed_num_28d'].tolist(), [2, 0, 0, 0])
+        self.assertEqual(features['distance'].tolist(), [1, 2, 128, 128])
+        self.assertEqual(features['total_failed_num__x__num_commits'].tolist(), [24, 0, 0, 0])
+
+
+if __name__ == "__main__":
+    try:
+        import xmlrunner
+        testRunner = xmlrunner.XMLTestRunner(output="target/test-reports", verbosity=2)
+    except ImportError:
+        testRunner = None
+    unittest.main(testRunner=testRunner, verbosity=2)
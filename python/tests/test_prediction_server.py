@@ -0,0 +1,142 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import importlib.util
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import urllib.request
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer
+
+import numpy as np
+
+from ptesting import depgraph
+
+_BIN_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '../../bin'))
+sys.path.insert(0, _BIN_PATH)
+
+
+def _load_cli_module():
+    spec = importlib.util.spec_from_file_location('ptesting_model', f'{_BIN_PATH}/ptesting-model.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class _LinearClassifier:
+    # A classifier that has the same `classes_` and `predict_proba` as `LGBMClassifier`, and whose failed
+    # probabilities depend on the `chgs` stats of commits.
+    classes_ = np.array([0, 1])
+
+    def predict_proba(self, X):
+        logits = 0.1 * X['total_failed_num__x__num_chgs'].to_numpy() - 0.001 * X['distance'].to_numpy()
+        probs = 1.0 / (1.0 + np.exp(-logits))
+        return np.stack([1.0 - probs, probs], axis=1)
+
+
+class PredictionServerTests(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls._cli = _load_cli_module()
+        to_datetime = lambda d: datetime.strptime(d, '%Y/%m/%d').replace(tzinfo=timezone.utc)
+        cls._resources = {
+            'clf': _LinearClassifier(),
+            'test_files': {
+                'org.apache.spark.sql.DataFrameSuite':
+                    'sql/core/src/test/scala/org/apache/spark/sql/DataFrameSuite.scala',
+                'org.apache.spark.sql.SQLQuerySuite':
+                    'sql/core/src/test/scala/org/apache/spark/sql/SQLQuerySuite.scala',
+                'org.apache.spark.sql.ColumnSuite':
+                    'sql/core/src/test/scala/org/apache/spark/sql/ColumnSuite.scala'
+            },
+            'commits': [to_datetime(f'2021/11/{d:02d}') for d in [20, 15, 10, 5, 1]],
+            'dep_graph': depgraph.to_compact_graph({
+                'org.apache.spark.sql.Dataset': [
+                    'org.apache.spark.sql.DataFrameSuite', 'org.apache.spark.sql.ColumnSuite'],
+                'org.apache.spark.sql.Column': ['org.apache.spark.sql.SQLQuerySuite']
+            }),
+            'corr_map': {},
+            'included_tests': ['org.apache.spark.sql.SQLQuerySuite'],
+            'updated_file_stats': {
+                'sql/core/src/main/scala/org/apache/spark/sql/Dataset.scala': [('2021-11-19T12:00:00Z', '1', '1', '2')]
+            },
+            'contributor_stats': [('maropu', '12')],
+            'failed_tests': {
+                'org.apache.spark.sql.ColumnSuite': ['2021/11/18 00:00:00', '2021/11/02 00:00:00'],
+                'org.apache.spark.sql.SQLQuerySuite': ['2021/11/02 00:00:00']
+            }
+        }
+
+    def _predict_in_batch(self, commit):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            with open(f'{tmp_dir}/input.jsonl', 'w') as f:
+                f.write(json.dumps(commit) + '\n')
+            pdf = self._cli._read_batch_input(f'{tmp_dir}/input.jsonl')
+
+        import local_features
+        to_features = local_features.create_predict_pipeline(*self._cli._to_pipeline_args(self._resources))
+        predicted = self._cli._predict_failed_probs_without_spark(to_features(pdf), self._resources['clf'])
+        return self._cli._select_tests_without_spark(predicted, [commit['sha']], 10)[commit['sha']]
+
+    def _request(self, server, body):
+        request = urllib.request.Request(
+            f'http://127.0.0.1:{server.server_address[1]}/predict', data=json.dumps(body).encode('utf-8'))
+        with urllib.request.urlopen(request) as response:
+            return json.loads(response.read())
+
+    def test_ranks_tests_in_the_same_way_as_batch_mode(self):
+        handler = self._cli._create_prediction_request_handler(self._resources, default_num_selected_tests=10)
+        server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        try:
+            commit = {
+                'sha': 'abc',
+                'author': 'maropu',
+                'commit_date': '2021/11/20 13:00:00',
+                'files': ['sql/core/src/main/scala/org/apache/spark/sql/Dataset.scala'],
+                'adds': 10,
+                'dels': 2
+            }
+            expected_tests = self._predict_in_batch(commit)
+            # `chgs` defaults to `adds + dels`, so that failure counts rank tests before their names
+            self.assertEqual(expected_tests, [
+                'org.apache.spark.sql.ColumnSuite',
+                'org.apache.spark.sql.SQLQuerySuite',
+                'org.apache.spark.sql.DataFrameSuite'
+            ])
+
+            response = self._request(server, {k: v for k, v in commit.items() if k != 'sha'})
+            self.assertEqual(response['tests'], expected_tests)
+            response = self._request(server, {**commit, 'chgs': 12, 'num_selected_tests': 2})
+            self.assertEqual(response['tests'], expected_tests[:2])
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == "__main__":
+    try:
+        import xmlrunner
+        testRunner = xmlrunner.XMLTestRunner(output="target/test-reports", verbosity=2)
+    except ImportError:
+        testRunner = None
+    unittest.main(testRunner=testRunner, verbosity=2)
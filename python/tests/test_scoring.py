@@ -0,0 +1,76 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import tempfile
+import unittest
+
+import numpy as np
+
+from ptesting import scoring
+
+
+class ScoringTests(unittest.TestCase):
+
+    def _create_data(self, n, rng):
+        X = rng.randint(0, 10, size=(n, 5)).astype(float)
+        X[rng.rand(n, 5) < 0.1] = np.nan
+        y = ((np.nan_to_num(X[:, 0]) + X[:, 1] + rng.rand(n) * 4 > 12)).astype(int)
+        return X, y
+
+    def _assert_same_probs(self, clf, X):
+        model = scoring.from_lgb_dump(clf.booster_.dump_model(), list(clf.classes_))
+        self.assertEqual(model.classes_.tolist(), clf.classes_.tolist())
+        np.testing.assert_allclose(model.predict_proba(X), clf.predict_proba(X), rtol=0, atol=1e-12)
+        return model
+
+    def test_tree_ensemble_model(self):
+        import lightgbm as lgb
+        rng = np.random.RandomState(0)
+        X, y = self._create_data(1000, rng)
+        test_X, _ = self._create_data(300, rng)
+        test_X[:, 2] = 0.0
+
+        # Covers all the missing value types: 'NaN', 'Zero', and 'None'
+        for params in [{}, {'zero_as_missing': True}, {'use_missing': False}]:
+            clf = lgb.LGBMClassifier(n_estimators=30, num_leaves=8, verbose=-1, **params).fit(X, y)
+            model = self._assert_same_probs(clf, test_X)
+
+        with tempfile.TemporaryDirectory() as d:
+            model.save(f'{d}/model.npz')
+            loaded_model = scoring.load_model(f'{d}/model.npz')
+            np.testing.assert_array_equal(loaded_model.predict_proba(test_X), model.predict_proba(test_X))
+            self.assertEqual(loaded_model.feature_names, model.feature_names)
+
+        with self.assertRaises(ValueError):
+            model.predict_proba(test_X[:, :4])
+
+    def test_unsupported_models(self):
+        import lightgbm as lgb
+        rng = np.random.RandomState(0)
+        X, _ = self._create_data(300, rng)
+        y = rng.randint(0, 3, size=len(X))
+        clf = lgb.LGBMClassifier(n_estimators=3, verbose=-1).fit(X, y)
+        with self.assertRaises(ValueError):
+            scoring.from_lgb_dump(clf.booster_.dump_model(), list(clf.classes_))
+
+
+if __name__ == "__main__":
+    try:
+        import xmlrunner
+        testRunner = xmlrunner.XMLTestRunner(output="target/test-reports", verbosity=2)
+    except ImportError:
+        testRunner = None
+    unittest.main(testRunner=testRunner, verbosity=2)
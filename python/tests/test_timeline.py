@@ -0,0 +1,69 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+import unittest
+from datetime import datetime, timezone
+
+from ptesting import timeline
+
+
+class TimelineTests(unittest.TestCase):
+
+    def test_to_epoch_seconds(self):
+        epochs = timeline.to_epoch_seconds(['1970/01/02 00:00:01', '2021/11/19 22:00:00'], '%Y/%m/%d %H:%M:%S')
+        self.assertEqual(epochs.tolist(), [86401, 1637359200])
+        self.assertEqual(timeline.to_epoch_seconds([], '%Y/%m/%d %H:%M:%S').tolist(), [])
+
+    def test_commit_timeline(self):
+        # Commits are listed in the newest-first order in `commits.json`
+        commits = [datetime(1970, 1, 1, 0, 0, s, tzinfo=timezone.utc) for s in [50, 40, 30, 20, 10]]
+        commit_timeline = timeline.build_commit_timeline(commits)
+        self.assertEqual(len(commit_timeline), 5)
+        self.assertEqual(commit_timeline.position([5, 10, 35, 50, 60]).tolist(), [0, 1, 3, 5, 5])
+
+        lower_bounds, upper_bounds, valid_windows = commit_timeline.windows([5, 10, 35, 60], [1, 3])
+        self.assertEqual(lower_bounds.tolist(), [[10, 10], [10, 10], [20, 10], [40, 20]])
+        self.assertEqual(upper_bounds.tolist(), [[10, 10], [10, 10], [30, 30], [50, 50]])
+        self.assertEqual(valid_windows.tolist(), [[False, False], [True, True], [True, True], [True, True]])
+
+        empty_timeline = timeline.build_commit_timeline([])
+        _, _, valid_windows = empty_timeline.windows([5, 10], [1])
+        self.assertEqual(valid_windows.tolist(), [[False], [False]])
+
+    def test_find_divergent_epoch(self):
+        old_events = (['a', 'a', 'b', '$commit'], [10, 30, 20, 5])
+        self.assertIsNone(timeline.find_divergent_epoch(old_events, old_events))
+        self.assertIsNone(timeline.find_divergent_epoch(([], []), ([], [])))
+        # The order of events does not matter
+        self.assertIsNone(timeline.find_divergent_epoch(old_events, (['b', '$commit', 'a', 'a'], [20, 5, 30, 10])))
+        # Appended events
+        new_events = (['a', 'a', 'b', '$commit', 'c'], [10, 30, 20, 5, 40])
+        self.assertEqual(timeline.find_divergent_epoch(old_events, new_events), 40)
+        # Removed, duplicated, and moved events
+        self.assertEqual(timeline.find_divergent_epoch(old_events, (['a', 'b', '$commit'], [10, 20, 5])), 30)
+        new_events = (['a', 'a', 'b', 'b', '$commit'], [10, 30, 20, 20, 5])
+        self.assertEqual(timeline.find_divergent_epoch(old_events, new_events), 20)
+        self.assertEqual(timeline.find_divergent_epoch(old_events, (['a', 'a', 'c', '$commit'], [10, 30, 20, 5])), 20)
+        self.assertEqual(timeline.find_divergent_epoch(([], []), (['a'], [7])), 7)
+
+if __name__ == "__main__":
+    try:
+        import xmlrunner
+        testRunner = xmlrunner.XMLTestRunner(output="target/test-reports", verbosity=2)
+    except ImportError:
+        testRunner = None
+    unittest.main(testRunner=testRunner, verbosity=2)
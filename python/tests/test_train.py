@@ -0,0 +1,242 @@
+#
+# Licensed to the Apache Software Foundation (ASF) under one or more
+# contributor license agreements.  See the NOTICE file distributed with
+# this work for additional information regarding copyright ownership.
+# The ASF licenses this file to You under the Apache License, Version 2.0
+# (the "License"); you may not use this file except in compliance with
+# the License.  You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+import json
+import tempfile
+import unittest
+from concurrent import futures
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+
+from ptesting import train
+
+
+class TrainTests(unittest.TestCase):
+
+    def _create_training_data(self, n=400):
+        rng = np.random.RandomState(0)
+        X = pd.DataFrame(rng.rand(n, 4), columns=['f0', 'f1', 'f2', 'f3'])
+        y = pd.Series((X['f0'] + 0.1 * rng.rand(n) > 0.6).astype(int))
+        return X, y
+
+    def _create_noisy_training_data(self, n=600):
+        # Labels are noisy so that CV scores improve over boosting rounds
+        rng = np.random.RandomState(0)
+        X = pd.DataFrame(rng.rand(n, 4), columns=['f0', 'f1', 'f2', 'f3'])
+        y = pd.Series((X['f0'] * X['f1'] + 0.3 * rng.rand(n) > 0.45).astype(int))
+        return X, y
+
+    def _create_fixed_params(self, n_estimators):
+        return {
+            'boosting_type': 'gbdt', 'objective': 'binary', 'class_weight': 'balanced', 'learning_rate': 0.1,
+            'max_depth': 7, 'max_bin': 255, 'reg_alpha': 0.0, 'min_split_gain': 0.0, 'n_estimators': n_estimators,
+            'importance_type': 'gain', 'random_state': 42, 'n_jobs': 1
+        }
+
+    def test_cross_validate_lgb_model(self):
+        import lightgbm as lgb
+        from sklearn.metrics import f1_score
+        from sklearn.model_selection import StratifiedKFold
+        from sklearn.utils.class_weight import compute_sample_weight
+        X, y = self._create_noisy_training_data()
+        fixed_params = self._create_fixed_params(n_estimators=200)
+        params = {'num_leaves': 4, 'min_child_samples': 10}
+        dataset = train._create_lgb_dataset(X, y, fixed_params)
+        np.testing.assert_allclose(dataset.get_weight(), compute_sample_weight('balanced', y))
+
+        # Early stopping shortens training
+        result = train._cross_validate_lgb_model(
+            dataset, fixed_params, params, n_splits=3, early_stopping_rounds=10, rung_rounds=[],
+            prev_rung_scores={}, eta=3)
+        self.assertGreater(result['num_boost_round'], 1)
+        self.assertLess(result['num_boost_round'], 200)
+
+        # The CV score is the mean of the macro F1 scores of the stratified folds (`lgb.cv` splits the data
+        # with `StratifiedKFold` and the given seed) at the chosen number of boosting rounds
+        f1_scores = []
+        for train_index, test_index in StratifiedKFold(3, shuffle=True, random_state=42).split(X, y):
+            booster = lgb.train(train._to_booster_params(fixed_params, params), dataset.subset(train_index),
+                                num_boost_round=result['num_boost_round'])
+            y_pred = (booster.predict(X.iloc[test_index]) >= 0.5).astype(int)
+            f1_scores.append(f1_score(y.iloc[test_index], y_pred, average='macro'))
+        self.assertAlmostEqual(-result['loss'], np.mean(f1_scores))
+
+    def test_f1_macro(self):
+        from sklearn.metrics import f1_score
+        rng = np.random.RandomState(0)
+        y_true, preds = rng.randint(0, 2, 100), rng.rand(100)
+        name, score, is_higher_better = train._f1_macro(preds, mock.Mock(get_label=lambda: y_true.astype(float)))
+        self.assertEqual((name, is_higher_better), ('f1_macro', True))
+        self.assertAlmostEqual(score, f1_score(y_true, preds >= 0.5, average='macro'))
+        # A class that appears in neither labels nor predictions has zero F1
+        _, score, _ = train._f1_macro(np.ones(4), mock.Mock(get_label=lambda: np.ones(4)))
+        self.assertAlmostEqual(score, 0.5)
+
+    def test_build_dataset_only_once(self):
+        X, y = self._create_training_data()
+        opts = {'lgb.n_estimators': '20', 'hp.max_evals': '3'}
+        with mock.patch.object(train, '_create_lgb_dataset', wraps=train._create_lgb_dataset) as create_dataset:
+            train._build_lgb_model(X, y, opts=opts)
+        self.assertEqual(create_dataset.call_count, 1)
+
+    def test_prune_unpromising_trials(self):
+        X, y = self._create_noisy_training_data()
+        fixed_params = self._create_fixed_params(n_estimators=60)
+        dataset = train._create_lgb_dataset(X, y, fixed_params)
+        cv_opts = {'n_splits': 3, 'early_stopping_rounds': 100, 'rung_rounds': [5, 15, 45], 'eta': 3}
+        strong_params = {'num_leaves': 8, 'min_child_samples': 5, 'colsample_bytree': 1.0}
+        weak_params = {'num_leaves': 2, 'min_child_samples': 5, 'colsample_bytree': 0.25}
+
+        # Without the scores of previous trials, no trial is pruned
+        result = train._cross_validate_lgb_model(
+            dataset, fixed_params, strong_params, prev_rung_scores={}, **cv_opts)
+        self.assertFalse(result['pruned'])
+        self.assertGreater(result['num_boost_round'], 5)
+        self.assertEqual(sorted(result['rung_scores'].keys()), [5, 15, 45])
+
+        # A weak trial is pruned at the first rung if its score is not in the top 1/3 of the previous scores
+        trials = mock.Mock(trials=[{'result': {'loss': -0.9, 'rung_scores': result['rung_scores']}}] * 3)
+        prev_rung_scores = train._collect_rung_scores(trials)
+        self.assertEqual(prev_rung_scores[5], [result['rung_scores'][5]] * 3)
+        weak_result = train._cross_validate_lgb_model(
+            dataset, fixed_params, weak_params, prev_rung_scores=prev_rung_scores, **cv_opts)
+        self.assertTrue(weak_result['pruned'])
+        self.assertEqual(weak_result['num_boost_round'], 5)
+        self.assertEqual(list(weak_result['rung_scores'].keys()), [5])
+        # The loss of the pruned trial is the score at the round where it stopped
+        self.assertLess(weak_result['rung_scores'][5], result['rung_scores'][5])
+        self.assertAlmostEqual(weak_result['loss'], -weak_result['rung_scores'][5])
+
+        # Pruning is disabled if the number of the previous scores is less than `eta`
+        result = train._cross_validate_lgb_model(
+            dataset, fixed_params, weak_params, prev_rung_scores={5: prev_rung_scores[5][:2]}, **cv_opts)
+        self.assertFalse(result['pruned'])
+
+    def test_get_rung_rounds(self):
+        self.assertEqual(train._get_rung_rounds(25, 300, 3), [25, 75, 225])
+        self.assertEqual(train._get_rung_rounds(25, 25, 3), [])
+        self.assertEqual(train._get_rung_rounds(25, 300, 1), [])
+
+    def test_split_cpus(self):
+        with mock.patch('os.cpu_count', return_value=8):
+            self.assertEqual(train._split_cpus(1, -1), (1, -1))
+            self.assertEqual(train._split_cpus(2, -1), (2, 4))
+            self.assertEqual(train._split_cpus(3, -1), (3, 2))
+            self.assertEqual(train._split_cpus(16, -1), (8, 1))
+            self.assertEqual(train._split_cpus(0, 4), (1, 4))
+        with mock.patch('os.cpu_count', return_value=1):
+            self.assertEqual(train._split_cpus(2, -1), (1, -1))
+
+    def test_build_model_with_parallel_trials(self):
+        X, y = self._create_training_data()
+        opts = {'lgb.n_estimators': '20', 'hp.max_evals': '5', 'hp.parallelism': '2'}
+        executors = []
+
+        class _ProcessPoolExecutor(futures.ProcessPoolExecutor):
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                executors.append(kwargs)
+
+        with mock.patch('os.cpu_count', return_value=4), \
+                mock.patch('concurrent.futures.ProcessPoolExecutor', _ProcessPoolExecutor):
+            clf, score, trials = train._build_lgb_model(X, y, opts=opts)
+
+        # Two trials are evaluated at once in worker processes and each of them uses the half of the CPUs
+        self.assertEqual(len(executors), 1)
+        self.assertEqual(executors[0]['max_workers'], 2)
+        self.assertEqual(executors[0]['initargs'][2]['n_jobs'], 2)
+        self.assertEqual(clf.get_params()['n_jobs'], 2)
+        self.assertEqual(len(trials), 5)
+        self.assertEqual(len(set(json.dumps(t['params'], sort_keys=True) for t in trials)), 5)
+        self.assertGreater(score, 0.8)
+
+    def test_select_warm_start_points(self):
+        param_space = {'num_leaves': None, 'subsample': None}
+        prev_trials = [
+            {'params': {'num_leaves': 8.0, 'subsample': 0.5}, 'loss': -0.5},
+            {'params': {'num_leaves': 16.0, 'subsample': 0.6}, 'loss': -0.9},
+            {'params': {'num_leaves': 32.0}, 'loss': -1.0},
+            {'params': {'num_leaves': 4.0, 'subsample': 0.7}, 'loss': -0.7}
+        ]
+        points = train._select_warm_start_points(prev_trials, param_space, 2)
+        self.assertEqual(points, [{'num_leaves': 16.0, 'subsample': 0.6}, {'num_leaves': 4.0, 'subsample': 0.7}])
+
+    def test_build_model_with_warm_start(self):
+        X, y = self._create_training_data()
+        opts = {'lgb.n_estimators': '20', 'hp.max_evals': '3', 'hp.warm_start_trials': '2'}
+        with tempfile.TemporaryDirectory() as d:
+            trials_path = f'{d}/model-trials.json'
+            clf, score = train.build_model(X, y, opts=opts, trials_path=trials_path)
+            self.assertGreater(score, 0.8)
+            with open(trials_path) as f:
+                trials = json.load(f)
+            self.assertEqual(len(trials), 3)
+            self.assertEqual(trials, sorted(trials, key=lambda t: t['loss']))
+
+            # The best points of the previous search are re-evaluated in the next search
+            # and the new trials are merged into the previous ones.
+            train.build_model(X, y, opts=opts, trials_path=trials_path)
+            with open(trials_path) as f:
+                merged_trials = json.load(f)
+            merged_params = [t['params'] for t in merged_trials]
+            self.assertEqual(len(merged_trials), 4)
+            self.assertEqual(merged_trials, sorted(merged_trials, key=lambda t: t['loss']))
+            for prev_trial in trials:
+                self.assertIn(prev_trial['params'], merged_params)
+
+    def test_warm_start_with_no_progress_loss(self):
+        X, y = self._create_training_data()
+        opts = {'lgb.n_estimators': '20', 'hp.max_evals': '4', 'hp.warm_start_trials': '3',
+                'hp.no_progress_loss': '1'}
+        _, _, prev_trials = train._build_lgb_model(X, y, opts=opts)
+        prev_params = [t['params'] for t in prev_trials]
+
+        # The early stopping is checked only after the warm-start points are evaluated, so new points
+        # are suggested even if the warm-start points make no progress.
+        for _ in range(2):
+            _, _, trials = train._build_lgb_model(X, y, opts=opts, prev_trials=prev_trials)
+            new_params = [t['params'] for t in trials if t['params'] not in prev_params]
+            self.assertGreaterEqual(len(trials), 4)
+            self.assertGreaterEqual(len(new_params), 1)
+            prev_trials = train._merge_trial_histories(prev_trials, trials)
+            prev_params = [t['params'] for t in prev_trials]
+
+    def test_merge_trial_histories(self):
+        prev_trials = [
+            {'params': {'num_leaves': 8.0}, 'loss': -0.9},
+            {'params': {'num_leaves': 16.0}, 'loss': -0.5}
+        ]
+        trials = [
+            {'params': {'num_leaves': 8.0}, 'loss': -0.6},
+            {'params': {'num_leaves': 4.0}, 'loss': -0.7}
+        ]
+        self.assertEqual(train._merge_trial_histories(prev_trials, trials), [
+            {'params': {'num_leaves': 4.0}, 'loss': -0.7},
+            {'params': {'num_leaves': 8.0}, 'loss': -0.6},
+            {'params': {'num_leaves': 16.0}, 'loss': -0.5}
+        ])
+        self.assertEqual(train._merge_trial_histories([], trials), sorted(trials, key=lambda t: t['loss']))
+
+
+if __name__ == "__main__":
+    try:
+        import xmlrunner
+        testRunner = xmlrunner.XMLTestRunner(output="target/test-reports", verbosity=2)
+    except ImportError:
+        testRunner = None
+    unittest.main(testRunner=testRunner, verbosity=2)